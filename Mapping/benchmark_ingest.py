@@ -0,0 +1,102 @@
+"""
+Scaling benchmark: row-by-row vs. columnar Excel mapping ingestion.
+
+Generates synthetic field mapping sheets shaped like the 'Field' sheets of
+`table.xlsx`, runs `collect_field_values_rowwise` and `collect_field_values`
+(and the nested mapping builders of the end-to-end converter) on them, checks
+that both produce the same result and prints the timings.
+
+The row-by-row versions are only run up to --rowwise-limit rows; above that
+they take minutes.
+
+Usage:
+    python benchmark_ingest.py [--rows 10000 100000 1000000] [--rowwise-limit 100000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from excel_ingest import (build_nested_mapping, build_nested_mapping_rowwise,
+                          collect_field_values, collect_field_values_rowwise)
+
+
+def synthetic_field_sheet(rows: int, fields_per_view: int = 40, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a synthetic field mapping sheet with `rows` rows.
+
+    Each calculation view ('Used by') has about `fields_per_view` rows, some
+    fields repeat within a view and a few cells are empty, as in the real
+    workbook.
+    """
+    rng = np.random.default_rng(seed)
+    views = max(rows // fields_per_view, 1)
+    view_ids = np.sort(rng.integers(0, views, rows))
+    field_ids = rng.integers(0, fields_per_view * 2, rows)
+
+    sap_fields = pd.Series([f"ZFIELD_{i:05d}" for i in field_ids], dtype=object)
+    sap_fields[rng.random(rows) < 0.02] = np.nan
+    dbx_fields = pd.Series([f"field_{i:05d}_p" for i in field_ids], dtype=object)
+    dbx_fields[rng.random(rows) < 0.02] = np.nan
+    comments = pd.Series(np.where(rng.random(rows) < 0.05, 'check with business', None), dtype=object)
+
+    return pd.DataFrame({
+        'No': np.arange(rows, dtype=float),
+        'Used by': [f"CV_DLO_SYNTH_{v:06d}" for v in view_ids],
+        'Base SAP CV - equivalent of DBX Table': [f"CV_DEC_Z90_O{v % 500:03d}_SYNTH" for v in view_ids],
+        'SAP Field Name': sap_fields,
+        'DBX Field name': dbx_fields,
+        'DBX Table': [f"lpdbwlppns01{{ENV}}.lego_b2s.synth_{v % 500:03d}_vw" for v in view_ids],
+        'Comments': comments,
+        'SAP Field description': [f"Description of field {i}" for i in field_ids],
+    })
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(row_counts, rowwise_limit: int) -> bool:
+    """
+    Time both ingestion paths for every row count.
+
+    Returns:
+    bool: True if the columnar results matched the row-by-row results wherever both ran
+    """
+    all_identical = True
+    print(f"{'Rows':>9} {'Step':<22} {'Row-wise s':>11} {'Columnar s':>11} {'Speedup':>8}  Identical")
+    for rows in row_counts:
+        df = synthetic_field_sheet(rows)
+        sheets = {'Synthetic Fields': df}
+        nested_df = df.rename(columns={'Used by': 'ADSO GCM'})
+
+        steps = [
+            ('collect_field_values', collect_field_values_rowwise, collect_field_values, sheets),
+            ('build_nested_mapping', build_nested_mapping_rowwise, build_nested_mapping, nested_df),
+        ]
+        for name, rowwise_func, columnar_func, data in steps:
+            columnar_result, columnar_time = _timed(columnar_func, data)
+            if rows <= rowwise_limit:
+                rowwise_result, rowwise_time = _timed(rowwise_func, data)
+                identical = rowwise_result == columnar_result
+                all_identical = all_identical and identical
+                print(f"{rows:>9} {name:<22} {rowwise_time:>11.3f} {columnar_time:>11.3f} "
+                      f"{rowwise_time / columnar_time:>7.1f}x  {'✓' if identical else '✗'}")
+            else:
+                print(f"{rows:>9} {name:<22} {'skipped':>11} {columnar_time:>11.3f} {'-':>8}  -")
+
+    return all_identical
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--rowwise-limit', type=int, default=100_000)
+    args = parser.parse_args()
+
+    ok = run_benchmark(args.rows, args.rowwise_limit)
+    raise SystemExit(0 if ok else 1)
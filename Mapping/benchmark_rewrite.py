@@ -0,0 +1,101 @@
+"""
+Benchmark: sequential regex loop vs. compiled single-pass field rewriter.
+
+Runs both implementations on the bundled sample SQL files with the field
+mappings from `table.xlsx`, checks that the outputs are identical and prints
+the timings.
+
+Usage:
+    python benchmark_rewrite.py [--excel table.xlsx] [--repeat 3] [sql_file ...]
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List
+
+import pandas as pd
+
+from sql_rewriter import FieldRewriter, rewrite_fields_sequential
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SQL_FILES = [
+    os.path.join(HERE, 'converted_databricks_sql.txt'),
+    os.path.join(HERE, 'test.sql'),
+    os.path.join(HERE, '..', 'tf_steftedata_BRP_variant.sql'),
+]
+
+
+def load_benchmark_mappings(excel_file: str) -> Dict[str, str]:
+    """Collect SAP -> DBX field mappings from all 'Field' sheets of the workbook."""
+    field_mappings = {}
+    xl = pd.ExcelFile(excel_file)
+    for sheet_name in [sheet for sheet in xl.sheet_names if 'Field' in sheet]:
+        df = xl.parse(sheet_name)
+        if 'SAP Field Name' not in df.columns or 'DBX Field name' not in df.columns:
+            continue
+        pairs = df[['SAP Field Name', 'DBX Field name']].dropna()
+        for sap_field, dbx_field in pairs.itertuples(index=False):
+            sap_field = str(sap_field).strip()
+            dbx_field = str(dbx_field).strip()
+            if sap_field and dbx_field:
+                field_mappings[sap_field.upper()] = dbx_field
+    return field_mappings
+
+
+def _best_of(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(excel_file: str, sql_files: List[str], repeat: int = 3) -> bool:
+    """
+    Time both rewriters on every SQL file and compare their output.
+
+    Returns:
+    bool: True if the outputs were identical for every file
+    """
+    field_mappings = load_benchmark_mappings(excel_file)
+    print(f"Loaded {len(field_mappings)} field mappings from {excel_file}")
+
+    start = time.perf_counter()
+    rewriter = FieldRewriter(field_mappings)
+    compile_time = time.perf_counter() - start
+    print(f"Compiled rewriter in {compile_time * 1000:.1f} ms (single pass: {rewriter.single_pass})")
+
+    all_identical = True
+    print(f"\n{'File':<40} {'Size KB':>8} {'Loop s':>9} {'Single s':>9} {'Speedup':>8}  Identical")
+    for sql_file in sql_files:
+        if not os.path.exists(sql_file):
+            print(f"✗ SQL file not found: {sql_file}")
+            continue
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        expected = rewrite_fields_sequential(content, field_mappings)
+        actual = rewriter.rewrite(content)
+        identical = expected == actual
+        all_identical = all_identical and identical
+
+        loop_time = _best_of(lambda: rewrite_fields_sequential(content, field_mappings), repeat)
+        single_time = _best_of(lambda: rewriter.rewrite(content), repeat)
+        speedup = loop_time / single_time if single_time > 0 else float('inf')
+        print(f"{os.path.basename(sql_file):<40} {len(content) / 1024:>8.1f} "
+              f"{loop_time:>9.3f} {single_time:>9.4f} {speedup:>7.0f}x  {'✓' if identical else '✗'}")
+
+    return all_identical
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('sql_files', nargs='*', default=DEFAULT_SQL_FILES)
+    parser.add_argument('--excel', default=os.path.join(HERE, 'table.xlsx'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    ok = run_benchmark(args.excel, args.sql_files, args.repeat)
+    raise SystemExit(0 if ok else 1)
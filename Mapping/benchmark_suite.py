@@ -0,0 +1,354 @@
+"""
+Benchmark suite: time and peak memory of every conversion stage on synthetic inputs.
+
+Generates, per size, a mapping workbook shaped like `table.xlsx` (a 'Field'
+sheet for mapping_script.py and an 'EWD field mapping_NN' sheet for the
+end-to-end comment converter) and a SQL corpus mixing the statement shapes of
+`converted_databricks_sql.txt` (temporary views with joins and window
+functions), `tf_steftedata_BRP_variant.sql` (HANA table variables with
+_BIC_ columns, CASE expressions and comments) and CREATE TABLE DDL. Then it
+runs the stages of the notebooks on them:
+
+    read_mapping_from_excel, compile_mappings, create_fuzzy_mapping,
+    create_fuzzy_candidates, read_excel_mapping, create_field_lookup,
+    process_sql_file, create_databricks_notebook, convert_sql_to_notebook,
+    convert_sql_to_notebook (incremental re-run), process_sql_string
+    (line and structural mode)
+
+Each stage is timed best-of --repeat without tracing, then run once more under
+tracemalloc for its peak memory. One JSON record per size and stage is
+appended to --output, so runs on different commits or machines can be
+compared with --compare.
+
+Usage:
+    python benchmark_suite.py [--sizes small medium large] [--repeat 3]
+                              [--output benchmark_results.jsonl] [--compare previous.jsonl]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from excel_ingest import read_excel_mapping, read_field_mapping
+from field_lookup import create_field_lookup
+from fuzzy_index import create_fuzzy_candidates, create_fuzzy_mapping
+from incremental import ConversionManifest, MappingReferences
+from instrumentation import WARNING, run_log
+from sql_annotator import process_sql_string
+from sql_conversion import build_notebook, compile_mappings, make_sql_rewriter
+from sql_pipeline import convert_sql_file
+
+# Size presets: calculation views, fields per view, SQL statements
+SIZES = {
+    'small': {'views': 20, 'fields_per_view': 40, 'statements': 200},
+    'medium': {'views': 100, 'fields_per_view': 40, 'statements': 2000},
+    'large': {'views': 500, 'fields_per_view': 40, 'statements': 20000},
+}
+
+# Syllables for SAP-like field names (ZMUTDATE, ZVERW_DAT, ...)
+_STEMS = ['MUT', 'VERW', 'DAT', 'REL', 'VOLG', 'NR', 'POL', 'STAT', 'JAAR', 'BEDR',
+          'GRP', 'AANV', 'EIND', 'PERC', 'KAP', 'FACT', 'VZ', 'CD', 'TYP', 'SRT']
+_TYPES = ['STRING', 'DATE', 'DECIMAL(17,2)', 'INT', 'TIMESTAMP']
+
+
+def _sap_field(rng: random.Random, i: int) -> str:
+    stem = ''.join(rng.choice(_STEMS) for _ in range(rng.randint(2, 3)))
+    return f"Z{stem}{i}" if rng.random() < 0.5 else f"{stem}_{i}"
+
+
+def _dbx_field(rng: random.Random, sap_field: str) -> str:
+    """A DBX name the way the mapping sheets have them: same, suffixed or abbreviated."""
+    name = sap_field.lower().lstrip('z')
+    roll = rng.random()
+    if roll < 0.3:
+        return sap_field.lower()
+    if roll < 0.6:
+        return name + rng.choice(['_p', '_r', '_cd', '_dat'])
+    if roll < 0.8:
+        return name.replace('_', '')
+    return f"{name}_{rng.choice(['ind', 'oms', 'bdr'])}"
+
+
+def synthetic_mapping(views: int, fields_per_view: int, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """
+    Build the sheets of a synthetic mapping workbook.
+
+    Returns:
+    dict: sheet name -> DataFrame ('Synthetic Fields' and 'EWD field mapping_NN')
+    """
+    rng = random.Random(seed)
+    rows = []
+    for v in range(views):
+        base_cv = f"CV_DEC_Z90_O{v:03d}_SYNTH_VIEW"
+        dbx_table = f"lpdbwlppns01{{ENV}}.lego_b2s.synth_{v:03d}_vw"
+        for f in range(fields_per_view):
+            sap_field = _sap_field(rng, v * fields_per_view + f)
+            # A few fields are not mapped yet (create_fuzzy_candidates suggests names for them)
+            dbx_field = _dbx_field(rng, sap_field) if rng.random() > 0.05 else None
+            rows.append({
+                'No': float(len(rows) + 1),
+                'Used by': f"CV_DLO_SYNTH_{v:04d}",
+                'Base SAP CV - equivalent of DBX Table': base_cv,
+                'SAP Field Name': sap_field,
+                'DBX Field name': dbx_field,
+                'DBX Table': dbx_table,
+                'Comments': 'check with business' if rng.random() < 0.05 else None,
+                'SAP Field description': f"Omschrijving {sap_field.lower().replace('_', ' ')}",
+                'ADSO GCM': f"Z90_O{v:03d}",
+            })
+    df = pd.DataFrame(rows)
+    field_columns = ['No', 'Used by', 'Base SAP CV - equivalent of DBX Table', 'SAP Field Name',
+                     'DBX Field name', 'DBX Table', 'Comments']
+    comment_columns = ['ADSO GCM', 'SAP Field Name', 'SAP Field description', 'DBX Table', 'DBX Field name']
+    return {'Synthetic Fields': df[field_columns], 'EWD field mapping_NN': df[comment_columns]}
+
+
+def write_workbook(sheets: Dict[str, pd.DataFrame], path: str) -> None:
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def _view_statement(rng: random.Random, n: int, tables: List[str], fields: List[str]) -> str:
+    """Temporary view with a join and a window function (converted_databricks_sql.txt)."""
+    t1, t2 = rng.sample(tables, 2)
+    columns = [f"  t{rng.randint(1, 2)}.{field}" for field in rng.sample(fields, rng.randint(8, 30))]
+    key = rng.choice(fields)
+    return (f"CREATE OR REPLACE TEMPORARY VIEW join_{n} AS\nSELECT\n" + ',\n'.join(columns) + ',\n'
+            f"  RANK() OVER (PARTITION BY t1.{key} ORDER BY t1.{rng.choice(fields)} DESC) AS rnk\n"
+            f"FROM {t1} t1\nLEFT JOIN {t2} t2\n  ON t1.{key} = t2.{key}\n"
+            f"WHERE t1.{rng.choice(fields)} <> '{rng.choice(fields)}';")
+
+
+def _procedure_statement(rng: random.Random, n: int, tables: List[str], fields: List[str]) -> str:
+    """HANA table variable with _BIC_ columns, CASE and comments (tf_steftedata_BRP_variant.sql)."""
+    picked = rng.sample(fields, rng.randint(6, 20))
+    columns = [f"\t\t\t\t_BIC_{field} as  {field}," for field in picked]
+    date_field = picked[0]
+    return (f"--Get all required columns and records until the processing date ({n}).\n"
+            f"\tIT_SYNTH_{n} = \n\t\tselect distinct \n" + '\n'.join(columns) + '\n'
+            f"\t\t\t\tcase when substring(_BIC_{date_field},5,4) = '0101'\t--BOY snapshot on 1st of January\n"
+            f"\t\t\t\tthen _BIC_{picked[1]}\n\t\t\t\telse (_BIC_{picked[1]}+1)\n"
+            f"\t\t\t\t\t\tend as BEGIN_JAAR\n"
+            f"\t\tfrom \"{rng.choice(tables)}\"\n\t\twhere _BIC_{date_field} <= :IP_VERW_DAT;")
+
+
+def _ddl_statement(rng: random.Random, n: int, dbx_fields: List[str]) -> str:
+    """CREATE TABLE with DBX column names, as process_sql_string annotates them."""
+    columns = [f"    {field} {rng.choice(_TYPES)}" for field in rng.sample(dbx_fields, rng.randint(5, 25))]
+    return f"CREATE TABLE IF NOT EXISTS synth_target_{n} (\n" + ',\n'.join(columns) + '\n);'
+
+
+def synthetic_sql(statements: int, sheets: Dict[str, pd.DataFrame], seed: int = 0) -> str:
+    """
+    Build a SQL corpus of `statements` statements over the names of a synthetic mapping.
+
+    Statements are separated by ';' and a blank line, as in the converted SQL files.
+    """
+    rng = random.Random(seed)
+    df = sheets['Synthetic Fields']
+    fields = df['SAP Field Name'].dropna().unique().tolist()
+    tables = df['Base SAP CV - equivalent of DBX Table'].dropna().unique().tolist() + ['factor_a', 'latest_factor_a']
+    dbx_fields = df['DBX Field name'].dropna().unique().tolist()
+    # Some names the mapping does not know, as in real SQL
+    fields += [f"h_local_{i}" for i in range(len(fields) // 10 + 1)]
+
+    parts = []
+    for n in range(statements):
+        roll = rng.random()
+        if roll < 0.45:
+            parts.append(_view_statement(rng, n, tables, fields))
+        elif roll < 0.8:
+            parts.append(_procedure_statement(rng, n, tables, fields))
+        else:
+            parts.append(_ddl_statement(rng, n, dbx_fields))
+    return '\n\n\n'.join(parts) + '\n'
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict:
+    """
+    Best-of-`repeat` wall time of func, then the peak traced memory of one more call.
+
+    Returns:
+    dict: seconds, mean_seconds, peak_bytes and the result of the last call
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(times), 'mean_seconds': sum(times) / len(times), 'peak_bytes': peak_bytes,
+            'result': result}
+
+
+def _count_items(result) -> Optional[int]:
+    """Size of a stage result: number of entries, or the statement count of a conversion."""
+    if isinstance(result, tuple):
+        return result[0] if isinstance(result[0], int) else result[1]
+    if isinstance(result, dict):
+        return len(result)
+    if isinstance(result, int):
+        return result
+    return None
+
+
+def run_size(size: str, params: Dict, repeat: int, workdir: str, seed: int = 0) -> List[Dict]:
+    """
+    Generate the inputs for one size and measure every stage on them.
+
+    Returns:
+    list: One result record per stage
+    """
+    sheets = synthetic_mapping(params['views'], params['fields_per_view'], seed)
+    excel_file = os.path.join(workdir, f"{size}_mapping.xlsx")
+    sql_file = os.path.join(workdir, f"{size}_corpus.sql")
+    processed_file = os.path.join(workdir, f"{size}_processed.txt")
+    notebook_file = os.path.join(workdir, f"{size}_notebook.py")
+    write_workbook(sheets, excel_file)
+    with open(sql_file, 'w', encoding='utf-8') as f:
+        f.write(synthetic_sql(params['statements'], sheets, seed))
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        sql_content = f.read()
+
+    inputs = dict(params, mapping_rows=len(sheets['Synthetic Fields']), sql_bytes=os.path.getsize(sql_file))
+    records = []
+    state = {}
+
+    def stage(name: str, func: Callable[[], object]) -> object:
+        measured = measure(func, repeat)
+        result = measured.pop('result')
+        records.append(dict(inputs, size=size, stage=name, repeat=repeat, items=_count_items(result), **measured))
+        print(f"{size:<8} {name:<36} {measured['seconds']:>9.3f} {measured['peak_bytes'] / 2 ** 20:>10.1f}  "
+              f"{records[-1]['items'] if records[-1]['items'] is not None else '-'}")
+        return result
+
+    def create_databricks_notebook():
+        with open(processed_file, 'r', encoding='utf-8') as f:
+            notebook_content, num_statements = build_notebook(f.read())
+        with open(notebook_file, 'w', encoding='utf-8') as f:
+            f.write(notebook_content)
+        return num_statements
+
+    def incremental_rerun():
+        manifest = ConversionManifest(os.path.join(workdir, f"{size}_manifest"))
+        result = convert_sql_file(sql_file, notebook_file, rewrite=state['rewrite'], manifest=manifest,
+                                  references=state['references'])
+        manifest.save()
+        return result
+
+    field_mapping = stage('read_mapping_from_excel', lambda: read_field_mapping(excel_file))
+    compiled = stage('compile_mappings', lambda: compile_mappings(field_mapping))
+    stage('create_fuzzy_mapping', lambda: create_fuzzy_mapping(field_mapping))
+    stage('create_fuzzy_candidates', lambda: create_fuzzy_candidates(field_mapping))
+    nested_mapping = stage('read_excel_mapping', lambda: read_excel_mapping(excel_file))
+    field_lookup = stage('create_field_lookup', lambda: create_field_lookup(nested_mapping))
+
+    state['rewrite'] = make_sql_rewriter(compiled['field_mappings'], compiled['table_mappings'], compiled['rewriter'])
+    state['references'] = MappingReferences(compiled['field_mappings'], compiled['table_mappings'],
+                                            compiled['rewriter'])
+    stage('process_sql_file', lambda: convert_sql_file(sql_file, processed_file=processed_file,
+                                                       rewrite=state['rewrite']))
+    stage('create_databricks_notebook', create_databricks_notebook)
+    stage('convert_sql_to_notebook', lambda: convert_sql_file(sql_file, notebook_file, processed_file,
+                                                              rewrite=state['rewrite']))
+    stage('convert_sql_to_notebook_streaming', lambda: convert_sql_file(sql_file, notebook_file,
+                                                                        rewrite=state['rewrite'], streaming=True))
+    # First run fills the manifest; the measured runs reuse every statement
+    incremental_rerun()
+    stage('convert_sql_to_notebook_incremental', incremental_rerun)
+    stage('process_sql_string', lambda: process_sql_string(sql_content, field_lookup, verbose=False))
+    stage('process_sql_string_structural',
+          lambda: process_sql_string(sql_content, field_lookup, verbose=False, structural=True))
+    return records
+
+
+def write_results(records: List[Dict], output_file: str) -> None:
+    """Append the records to a JSON lines file, one line per size and stage."""
+    with open(output_file, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def load_results(results_file: str) -> Dict:
+    """Read a results file; the latest record wins for every (size, stage)."""
+    results = {}
+    with open(results_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                results[(record['size'], record['stage'])] = record
+    return results
+
+
+def compare_results(records: List[Dict], previous: Dict) -> None:
+    """Print the time and peak memory of this run relative to a previous one."""
+    print(f"\n{'Size':<8} {'Stage':<36} {'Before s':>9} {'After s':>9} {'Time':>7} {'Memory':>7}")
+    for record in records:
+        before = previous.get((record['size'], record['stage']))
+        if before is None:
+            continue
+        time_ratio = record['seconds'] / before['seconds'] if before['seconds'] else float('nan')
+        memory_ratio = record['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else float('nan')
+        print(f"{record['size']:<8} {record['stage']:<36} {before['seconds']:>9.3f} {record['seconds']:>9.3f} "
+              f"{time_ratio:>6.2f}x {memory_ratio:>6.2f}x")
+
+
+def run_benchmark(sizes: List[str], repeat: int = 3, seed: int = 0) -> List[Dict]:
+    """
+    Measure all stages for every size.
+
+    Returns:
+    list: Result records, tagged with the run id, time and environment
+    """
+    run = {
+        'run_id': time.strftime('%Y%m%dT%H%M%S'),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+    # Keep the stage functions quiet; warnings still show
+    run_log.console_level = WARNING
+
+    records = []
+    print(f"{'Size':<8} {'Stage':<36} {'Best s':>9} {'Peak MiB':>10}  Items")
+    with tempfile.TemporaryDirectory(prefix='mapping_benchmark_') as workdir:
+        for size in sizes:
+            for record in run_size(size, SIZES[size], repeat, workdir, seed):
+                records.append(dict(run, **record))
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.jsonl',
+                        help='JSON lines file the results are appended to')
+    parser.add_argument('--compare', help='Results file of a previous run to compare against')
+    args = parser.parse_args()
+
+    previous = load_results(args.compare) if args.compare else None
+    records = run_benchmark(args.sizes, args.repeat, args.seed)
+    write_results(records, args.output)
+    print(f"\n✓ {len(records)} results appended to {args.output}")
+    if previous is not None:
+        compare_results(records, previous)
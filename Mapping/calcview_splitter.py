@@ -0,0 +1,401 @@
+"""
+Split a HANA calculation view XML into files of grouped calculationViews under a token budget.
+
+`split_grouped_calc_views` (calculationview_splitter.ipynb) parsed the whole
+file into an ElementTree, ran ET.tostring and the tokenizer on every
+calculationView, and for every output file deep-copied the header, footer and
+grouped views into a new tree and re-indented it. The splitter in this module
+works on the bytes of the file instead:
+
+1. scan_calc_view streams the file through expat (the parser under
+   ET.iterparse, used directly because it reports byte offsets) and records
+   the byte ranges of the header (up to and including the <calculationViews>
+   start tag), of every calculationView and of the footer. Only the view
+   being read is held in memory; its text is tokenized right away, once.
+2. The header and footer are read and tokenized once.
+3. Each output file is the header bytes, the byte ranges of its views (read
+   back from the input file) and the footer bytes, concatenated.
+
+Because the views are copied byte for byte, the output keeps the original
+namespace prefixes (including the ones only used in xsi:type values),
+formatting and comments.
+
+split_calc_view groups the views in document order, so a view and the views
+it reads (<input node="...">) can end up in different files.
+split_calc_view_by_dependencies builds the view -> input DAG instead, orders
+the views so that every view follows its inputs and subtrees stay together,
+and cuts that order into files within the token budget with the fewest
+input references crossing files. It reports the crossing references and the
+order in which the files can be converted (files of one wave do not read
+from each other and can be converted in parallel).
+
+Usage:
+    files = split_calc_view('CV_DLO_PUBS_BASE.calculationview', 'split_grouped_by_calcview', max_tokens=120000)
+    split = split_calc_view_by_dependencies('CV_DLO_PUBS_BASE.calculationview', 'split_by_dependencies', 120000)
+    split.cut_edges, split.waves
+"""
+
+import os
+import xml.parsers.expat
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from instrumentation import run_log
+from model_scheduler import CHARS_PER_TOKEN
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Depth of the <calculationViews> container (root element = depth 1)
+CONTAINER_DEPTH = 2
+
+
+class ViewRange(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    id: str
+    inputs: Tuple[str, ...]  # <input node="..."> references, without the leading '#'
+
+
+class CalcViewLayout(NamedTuple):
+    header_end: int  # end of the <calculationViews> start tag
+    views: List[ViewRange]  # every calculationView, in document order
+    footer_start: int  # start of </calculationViews>
+    size: int  # file size
+
+
+class SplitFile(NamedTuple):
+    path: str
+    views: int
+    tokens: int  # header + footer + views
+
+
+class CutEdge(NamedTuple):
+    input: str  # id of the view that is read
+    view: str  # id of the view that reads it
+    input_file: int  # 1-based number of the file with the input view
+    view_file: int
+
+
+class DependencySplit(NamedTuple):
+    files: List[SplitFile]
+    cut_edges: List[CutEdge]
+    waves: List[List[int]]  # file numbers; a file only reads views from files of earlier waves
+
+
+def token_counter(encoding: str = 'cl100k_base') -> Callable[[str], int]:
+    """
+    Token counting function of tiktoken's `encoding`.
+
+    Without tiktoken, tokens are estimated as characters / CHARS_PER_TOKEN.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        run_log.warning("⚠️  tiktoken is not installed; estimating tokens as characters / %d", CHARS_PER_TOKEN)
+        return lambda text: len(text) // CHARS_PER_TOKEN
+
+    enc = tiktoken.get_encoding(encoding)
+    return lambda text: len(enc.encode(text, disallowed_special=()))
+
+
+def scan_calc_view(f: BinaryIO, count_tokens: Callable[[str], int],
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> CalcViewLayout:
+    """
+    Find the header, calculationView and footer byte ranges of a calculation view XML.
+
+    expat reports where an element starts; it ends where the next event
+    (text, tag, comment, ...) starts. Every calculationView is tokenized as
+    soon as its end is known; its id and the nodes of its <input> elements
+    are recorded on the way.
+
+    Parameters:
+    f (BinaryIO): The XML file, opened in binary mode
+    count_tokens (callable): text -> number of tokens
+
+    Returns:
+    CalcViewLayout
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    buffer = bytearray()
+    state = {
+        'offset': 0,  # file offset of buffer[0]
+        'depth': 0,
+        'container': None,  # None before, True inside, False after <calculationViews>
+        'pending': None,  # what ends where the next event starts: 'header' or 'view'
+        'view_start': None,
+        'view_id': None,
+        'view_inputs': [],
+        'last_event': 0,
+        'header_end': None,
+        'footer_start': None,
+    }
+    views: List[ViewRange] = []
+
+    def event_at() -> int:
+        position = parser.CurrentByteIndex
+        pending, state['pending'] = state['pending'], None
+        if pending == 'header':
+            state['header_end'] = position
+        elif pending == 'view':
+            start = state['view_start']
+            text = buffer[start - state['offset']:position - state['offset']].decode('utf-8')
+            views.append(ViewRange(start, position, count_tokens(text), state['view_id'],
+                                   tuple(dict.fromkeys(state['view_inputs']))))
+            state['view_start'] = None
+        state['last_event'] = position
+        return position
+
+    def start_element(name, attributes):
+        position = event_at()
+        state['depth'] += 1
+        if state['container'] is None and state['depth'] == CONTAINER_DEPTH and name.endswith('calculationViews'):
+            state['container'] = True
+            state['pending'] = 'header'
+        elif state['container'] and state['depth'] == CONTAINER_DEPTH + 1:
+            state['view_start'] = position
+            state['view_id'] = attributes.get('id', f"#{len(views) + 1}")
+            state['view_inputs'] = []
+        elif state['view_start'] is not None and name.split(':')[-1] == 'input' and attributes.get('node'):
+            state['view_inputs'].append(attributes['node'].lstrip('#'))
+
+    def end_element(name):
+        position = event_at()
+        if state['container'] and state['depth'] == CONTAINER_DEPTH + 1:
+            state['pending'] = 'view'
+        elif state['container'] and state['depth'] == CONTAINER_DEPTH:
+            state['container'] = False
+            state['footer_start'] = position
+        state['depth'] -= 1
+
+    def other_event(*args):
+        event_at()
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = other_event
+    parser.CommentHandler = other_event
+    parser.ProcessingInstructionHandler = other_event
+    parser.StartCdataSectionHandler = other_event
+
+    size = 0
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        size += len(chunk)
+        buffer.extend(chunk)
+        parser.Parse(chunk, False)
+        # Only the open view (or, outside views, the text expat has not reported yet) is kept
+        keep = state['view_start'] if state['view_start'] is not None else state['last_event']
+        del buffer[:keep - state['offset']]
+        state['offset'] = keep
+    parser.Parse(b'', True)
+
+    if state['header_end'] is None or state['footer_start'] is None:
+        raise ValueError("No calculationViews element found")
+    return CalcViewLayout(state['header_end'], views, state['footer_start'], size)
+
+
+def _read_range(f: BinaryIO, start: int, end: int) -> bytes:
+    f.seek(start)
+    return f.read(end - start)
+
+
+def group_views(views: List[ViewRange], base_tokens: int, max_tokens: int) -> List[List[ViewRange]]:
+    """
+    Group consecutive views so that base_tokens + the views' tokens stays within max_tokens.
+
+    A view that does not fit into an empty group gets a group of its own.
+    """
+    groups = []
+    group: List[ViewRange] = []
+    group_tokens = 0
+    for view in views:
+        if group and base_tokens + group_tokens + view.tokens > max_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(view)
+        group_tokens += view.tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def dependency_order(views: List[ViewRange]) -> List[ViewRange]:
+    """
+    Order views so that every view comes after the views it reads.
+
+    Depth-first from the views nobody reads (the outputs, in document order),
+    emitting a view after its inputs, so that each subtree is contiguous.
+    References to data sources are ignored; on a cycle the back reference is.
+    """
+    by_id = {view.id: view for view in views}
+    read = {node for view in views for node in view.inputs if node in by_id}
+    roots = [view for view in views if view.id not in read]
+    order: List[ViewRange] = []
+    visited = set()
+    for root in roots + views:
+        if root.id in visited:
+            continue
+        visited.add(root.id)
+        stack = [(root, iter(root.inputs))]
+        while stack:
+            view, inputs = stack[-1]
+            for node in inputs:
+                if node in by_id and node not in visited:
+                    visited.add(node)
+                    stack.append((by_id[node], iter(by_id[node].inputs)))
+                    break
+            else:
+                stack.pop()
+                order.append(view)
+    return order
+
+
+def group_views_by_dependencies(views: List[ViewRange], base_tokens: int, max_tokens: int) -> List[List[ViewRange]]:
+    """
+    Cut dependency_order(views) into groups within max_tokens with the fewest references between groups.
+
+    Dynamic program over the cut positions: best[j] is the fewest crossing
+    references (then the fewest groups) for the first j views, trying every
+    last group [i, j) that fits the budget. A view that does not fit into an
+    empty group gets a group of its own.
+    """
+    order = dependency_order(views)
+    position = {view.id: k for k, view in enumerate(order)}
+    inputs = [[position[node] for node in view.inputs if node in position] for view in order]
+    readers: List[List[int]] = [[] for _ in order]
+    for k, positions in enumerate(inputs):
+        for p in positions:
+            readers[p].append(k)
+
+    budget = max_tokens - base_tokens
+    best: List[Tuple[int, int]] = [(0, 0)] + [None] * len(order)
+    previous = [0] * (len(order) + 1)
+    for j in range(1, len(order) + 1):
+        tokens = cut = 0
+        for i in range(j - 1, -1, -1):
+            tokens += order[i].tokens
+            if tokens > budget and i < j - 1:
+                break
+            # order[i] joins the group [i + 1, j): its references from the group are no longer cut,
+            # its own references to views outside the group are
+            if readers[i]:
+                cut -= sum(1 for reader in readers[i] if i < reader < j)
+            if inputs[i]:
+                cut += sum(1 for p in inputs[i] if not i <= p < j)
+            candidate = (best[i][0] + cut, best[i][1] + 1)
+            if best[j] is None or candidate < best[j]:
+                best[j], previous[j] = candidate, i
+
+    groups = []
+    j = len(order)
+    while j:
+        groups.append(order[previous[j]:j])
+        j = previous[j]
+    return groups[::-1]
+
+
+def split_calc_view(input_path: str, output_dir: str, max_tokens: int,
+                    count_tokens: Optional[Callable[[str], int]] = None, verbose: bool = True) -> List[SplitFile]:
+    """
+    Split a calculation view XML into `<name>_grouped_<n>.xml` files within a token budget.
+
+    Every output file has the header and footer of the input and a run of
+    consecutive calculationViews, separated by the whitespace that preceded
+    the first view in the input.
+
+    Parameters:
+    input_path (str): Calculation view XML file
+    output_dir (str): Directory for the output files (created if needed)
+    max_tokens (int): Token budget of one output file
+    count_tokens (callable): text -> number of tokens (default: token_counter())
+    verbose (bool): Print a line per written file
+
+    Returns:
+    list: SplitFile per written file
+    """
+    return _split(input_path, output_dir, max_tokens, group_views, count_tokens, verbose)[0]
+
+
+def split_calc_view_by_dependencies(input_path: str, output_dir: str, max_tokens: int,
+                                    count_tokens: Optional[Callable[[str], int]] = None,
+                                    verbose: bool = True) -> DependencySplit:
+    """
+    Split a calculation view XML into `<name>_grouped_<n>.xml` files of views that read each other.
+
+    Like split_calc_view, but the views are grouped by group_views_by_dependencies
+    and written in dependency order (inputs first).
+
+    Parameters:
+    input_path (str): Calculation view XML file
+    output_dir (str): Directory for the output files (created if needed)
+    max_tokens (int): Token budget of one output file
+    count_tokens (callable): text -> number of tokens (default: token_counter())
+    verbose (bool): Print a line per written file and the references between files
+
+    Returns:
+    DependencySplit: written files, input references between files and the conversion waves
+    """
+    files, groups = _split(input_path, output_dir, max_tokens, group_views_by_dependencies, count_tokens, verbose)
+
+    file_of = {view.id: number for number, group in enumerate(groups, start=1) for view in group}
+    cut_edges = [CutEdge(node, view.id, file_of[node], number)
+                 for number, group in enumerate(groups, start=1) for view in group
+                 for node in view.inputs if node in file_of and file_of[node] != number]
+
+    # Wave of a file: one after the latest wave of the files it reads from
+    depends_on: Dict[int, set] = {number: set() for number in file_of.values()}
+    for edge in cut_edges:
+        depends_on[edge.view_file].add(edge.input_file)
+    wave_of: Dict[int, int] = {}
+    for number in range(1, len(groups) + 1):
+        wave_of[number] = 1 + max((wave_of[d] for d in depends_on[number] if d in wave_of), default=-1)
+    waves = [[] for _ in range(max(wave_of.values(), default=-1) + 1)]
+    for number, wave in wave_of.items():
+        waves[wave].append(number)
+
+    if verbose:
+        references = sum(1 for group in groups for view in group for node in view.inputs if node in file_of)
+        print(f"{len(file_of)} views in {len(groups)} files; {len(cut_edges)} of {references} "
+              f"input references cross files; conversion waves: {waves}")
+        for edge in cut_edges:
+            print(f"  {edge.view} (file {edge.view_file}) reads {edge.input} (file {edge.input_file})")
+    return DependencySplit(files, cut_edges, waves)
+
+
+def _split(input_path: str, output_dir: str, max_tokens: int, grouping: Callable, count_tokens: Optional[Callable[[str], int]],
+           verbose: bool) -> Tuple[List[SplitFile], List[List[ViewRange]]]:
+    """Scan input_path, group its views with grouping(views, base_tokens, max_tokens) and write a file per group."""
+    count_tokens = count_tokens or token_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    base_filename = os.path.basename(input_path)
+
+    with open(input_path, 'rb') as f:
+        layout = scan_calc_view(f, count_tokens)
+        header = _read_range(f, 0, layout.header_end)
+        footer = _read_range(f, layout.footer_start, layout.size)
+        indent = closing = b''
+        if layout.views:
+            # Indentation before the first view and before </calculationViews>, reused in every file
+            gap = _read_range(f, layout.header_end, layout.views[0].start)
+            indent = gap[len(gap.rstrip()):]
+            gap = _read_range(f, layout.views[-1].end, layout.footer_start)
+            closing = gap[len(gap.rstrip()):]
+        base_tokens = count_tokens(header.decode('utf-8')) + count_tokens(footer.decode('utf-8'))
+
+        results = []
+        groups = grouping(layout.views, base_tokens, max_tokens)
+        for file_idx, group in enumerate(groups, start=1):
+            out_file = os.path.join(output_dir, f"{base_filename}_grouped_{file_idx}.xml")
+            with open(out_file, 'wb') as out:
+                out.write(header)
+                for view in group:
+                    out.write(indent)
+                    out.write(_read_range(f, view.start, view.end))
+                out.write(closing)
+                out.write(footer)
+
+            group_tokens = sum(view.tokens for view in group)
+            results.append(SplitFile(out_file, len(group), base_tokens + group_tokens))
+            if verbose:
+                print(f"Wrote {out_file} — header+footer: {base_tokens}, "
+                      f"{len(group)} views: {group_tokens}, total: {base_tokens + group_tokens}")
+    return results, groups
@@ -0,0 +1,355 @@
+"""
+Batch conversion of SAP-converted SQL files into Databricks notebooks.
+
+`run_complete_workflow` (mapping_script.py) converts the single file named in
+CONFIG. This command converts a directory or glob of files (e.g. one per
+dataflow): the mapping workbook is read once, through the mapping cache, and
+the files are then rewritten, optionally annotated with SAP field
+descriptions and written as notebooks by a pool of worker processes.
+
+Every output is byte-identical to the serial path (`--workers 1`), which
+produces the same bytes as process_sql_file + create_databricks_notebook.
+With --stream each file is read and written statement by statement instead
+of being loaded whole (see sql_pipeline.build_pipeline).
+
+Converted statements are kept in a manifest (--manifest-dir, see
+incremental.py): on the next run only statements whose SQL or mapping
+entries changed are rewritten, and the summary reports how many were reused.
+
+Usage:
+    python convert_sql_files.py DF_SQL/ 'other/*.txt' --excel table.xlsx --output-dir notebooks --workers 8
+    python convert_sql_files.py DF_SQL/ --comment-excel mapping.xlsx --keep-processed
+    python convert_sql_files.py DDL/ --comment-excel mapping.xlsx --structural-comments
+    python convert_sql_files.py huge_dataflow.sql --stream
+    python convert_sql_files.py DF_SQL/ --no-incremental
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from excel_ingest import read_field_mapping
+from field_lookup import load_field_lookup
+from incremental import ConversionManifest, MappingReferences
+from instrumentation import run_log
+from mapping_cache import shared_cache
+from sql_conversion import compile_mappings, make_sql_rewriter
+from sql_pipeline import convert_sql_file
+
+# File patterns searched for when an input is a directory
+DEFAULT_PATTERNS = ['*.sql', '*.txt']
+
+
+class ConversionTask(NamedTuple):
+    input_file: str
+    notebook_file: str
+    processed_file: Optional[str]
+
+
+class FileResult(NamedTuple):
+    input_file: str
+    notebook_file: str
+    statements: int
+    comments: int
+    seconds: float
+    error: Optional[str] = None
+    manifest_updates: Optional[Dict] = None  # ConversionManifest.take_pending() of a pool worker
+    metrics: Optional[Dict] = None  # run_log.take_metrics() of a pool worker
+
+
+def _inside(path: str, directories: Sequence[str]) -> bool:
+    """True if `path` is one of `directories` or below one of them."""
+    path = os.path.realpath(path)
+    return any(os.path.commonpath([path, directory]) == directory for directory in directories)
+
+
+def find_sql_files(inputs: Sequence[str], patterns: Sequence[str] = DEFAULT_PATTERNS,
+                   exclude_dirs: Sequence[str] = ()) -> List[str]:
+    """
+    Expand directories (searched recursively for `patterns`), globs and file names.
+
+    Parameters:
+    exclude_dirs (list): Directories left out of the directory search, e.g. the
+        output directory, whose `*_processed.txt` files would otherwise be
+        converted again on the next run
+
+    Returns:
+    list: Unique file paths, sorted within each input
+    """
+    excluded = [os.path.realpath(directory) for directory in exclude_dirs]
+    files = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            matches = [path for pattern in patterns
+                       for path in glob.glob(os.path.join(entry, '**', pattern), recursive=True)
+                       if not _inside(path, excluded)]
+        elif glob.has_magic(entry):
+            matches = glob.glob(entry, recursive=True)
+        else:
+            matches = [entry] if os.path.isfile(entry) else []
+            if not matches:
+                print(f"✗ SQL input file not found: {entry}")
+        files.extend(sorted(path for path in matches if os.path.isfile(path)))
+    return list(dict.fromkeys(os.path.normpath(path) for path in files))
+
+
+def plan_tasks(input_files: Sequence[str], output_dir: str, keep_processed: bool = False) -> List[ConversionTask]:
+    """
+    Map every input file to its output paths.
+
+    Outputs keep the directory layout below the common parent of the inputs:
+    `<output_dir>/<relative dir>/<stem>.py` for the notebook and, with
+    keep_processed, `<stem>_processed.txt` for the spark.sql() file. Files
+    that only differ by extension (a.sql and a.txt) keep it in the name
+    (a_sql.py, a_txt.py) instead of overwriting each other's outputs.
+
+    Raises:
+    ValueError: if two inputs would still write the same output file
+    """
+    if not input_files:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in input_files])
+
+    stems = []
+    for input_file in input_files:
+        relative = os.path.relpath(os.path.abspath(input_file), root)
+        stems.append(os.path.splitext(os.path.join(output_dir, relative)))
+    stem_counts: Dict[str, int] = {}
+    for stem, _ in stems:
+        stem_counts[os.path.normcase(stem)] = stem_counts.get(os.path.normcase(stem), 0) + 1
+
+    tasks = []
+    outputs: Dict[str, str] = {}
+    for input_file, (stem, extension) in zip(input_files, stems):
+        if stem_counts[os.path.normcase(stem)] > 1 and extension:
+            stem = f"{stem}_{extension[1:]}"
+        other = outputs.setdefault(os.path.normcase(stem), input_file)
+        if other != input_file:
+            raise ValueError(f"{other} and {input_file} would both be converted to {stem}.py")
+        tasks.append(ConversionTask(
+            input_file=input_file,
+            notebook_file=stem + '.py',
+            processed_file=stem + '_processed.txt' if keep_processed else None
+        ))
+    return tasks
+
+
+def load_conversion_mappings(excel_file: str, comment_excel: Optional[str] = None,
+                             cache_dir: str = '.mapping_cache', use_cache: bool = True,
+                             refresh_cache: bool = False) -> Tuple[Dict, Optional[Dict[str, str]]]:
+    """
+    Load the compiled SQL mappings and, if requested, the field description lookup.
+
+    The cache namespaces are the ones used by mapping_script.py and
+    end_to_end_sql_converter.py, so the notebooks and this command share entries.
+
+    Returns:
+    tuple: (compiled mappings as returned by compile_mappings, field lookup or None)
+    """
+    cache = shared_cache(cache_dir)
+
+    def build() -> Dict:
+        return compile_mappings(read_field_mapping(excel_file))
+
+    if use_cache:
+        compiled = cache.get_or_build(excel_file, build, namespace='mapping_script', refresh=refresh_cache)
+    else:
+        compiled = build()
+
+    field_lookup = None
+    if comment_excel:
+        field_lookup = load_field_lookup(comment_excel, use_cache=use_cache, refresh_cache=refresh_cache,
+                                         cache=cache)
+    return compiled, field_lookup
+
+
+def convert_file(task: ConversionTask, compiled: Dict, field_lookup: Optional[Dict[str, str]] = None,
+                 token_aware: bool = True, stream: bool = False,
+                 manifest: Optional[ConversionManifest] = None, structural_comments: bool = False) -> FileResult:
+    """
+    Rewrite, annotate and format one SQL file and write its outputs.
+
+    Errors are returned in the result instead of raised, so one bad file
+    does not stop the batch.
+    """
+    start = time.perf_counter()
+    try:
+        rewrite = make_sql_rewriter(compiled['field_mappings'], compiled['table_mappings'],
+                                    compiled.get('rewriter'), token_aware=token_aware)
+        references = None
+        if manifest is not None:
+            references = MappingReferences(compiled['field_mappings'], compiled['table_mappings'],
+                                           compiled.get('rewriter'), token_aware=token_aware)
+        os.makedirs(os.path.dirname(task.notebook_file) or '.', exist_ok=True)
+        num_statements, comments_added = convert_sql_file(task.input_file, task.notebook_file, task.processed_file,
+                                                          rewrite, field_lookup, streaming=stream,
+                                                          manifest=manifest, references=references,
+                                                          structural_comments=structural_comments)
+    except Exception as e:
+        return FileResult(task.input_file, task.notebook_file, 0, 0, time.perf_counter() - start, str(e))
+
+    return FileResult(task.input_file, task.notebook_file, num_statements, comments_added,
+                      time.perf_counter() - start)
+
+
+# Per-process state of the pool workers, set once by _init_worker
+_worker_state: Dict = {}
+
+
+def _init_worker(compiled: Dict, field_lookup: Optional[Dict[str, str]], token_aware: bool, stream: bool,
+                 manifest_dir: Optional[str], structural_comments: bool) -> None:
+    # Workers read the manifest and store converted statements; only the parent saves manifest.json
+    manifest = ConversionManifest(manifest_dir) if manifest_dir else None
+    _worker_state.update(compiled=compiled, field_lookup=field_lookup, token_aware=token_aware, stream=stream,
+                         manifest=manifest, structural_comments=structural_comments)
+
+
+def _convert_in_worker(task: ConversionTask) -> FileResult:
+    manifest = _worker_state['manifest']
+    result = convert_file(task, _worker_state['compiled'], _worker_state['field_lookup'],
+                          _worker_state['token_aware'], _worker_state['stream'], manifest,
+                          _worker_state['structural_comments'])
+    if manifest is not None:
+        result = result._replace(manifest_updates=manifest.take_pending())
+    return result._replace(metrics=run_log.take_metrics())
+
+
+def _print_progress(done: int, total: int, result: FileResult) -> None:
+    status = f"✗ {result.error}" if result.error else f"✓ {result.statements} statements"
+    print(f"[{done:>{len(str(total))}}/{total}] {result.input_file} ({result.seconds:.2f}s) {status}")
+
+
+def run_batch(tasks: Sequence[ConversionTask], compiled: Dict, field_lookup: Optional[Dict[str, str]] = None,
+              workers: int = 1, token_aware: bool = True, stream: bool = False,
+              manifest: Optional[ConversionManifest] = None, structural_comments: bool = False) -> List[FileResult]:
+    """
+    Convert all tasks, serially for workers <= 1, otherwise in a process pool.
+
+    The mappings are sent to each worker once, when the worker starts. The
+    manifest updates and stage timings of the workers are merged into
+    `manifest` and run_log.
+
+    Returns:
+    list: One FileResult per task, in task order
+    """
+    results = []
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            results.append(convert_file(task, compiled, field_lookup, token_aware, stream, manifest,
+                                        structural_comments))
+            _print_progress(len(results), len(tasks), results[-1])
+        return results
+
+    # Only what the workers need; the nested field mapping stays here
+    worker_mappings = {key: compiled[key] for key in ('field_mappings', 'table_mappings', 'rewriter')}
+    order = {task.input_file: i for i, task in enumerate(tasks)}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(worker_mappings, field_lookup, token_aware, stream,
+                                       manifest.directory if manifest else None, structural_comments)) as pool:
+        futures = [pool.submit(_convert_in_worker, task) for task in tasks]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if manifest is not None and results[-1].manifest_updates:
+                manifest.merge(results[-1].manifest_updates)
+            if results[-1].metrics:
+                run_log.merge_metrics(results[-1].metrics)
+            _print_progress(len(results), len(tasks), results[-1])
+    return sorted(results, key=lambda result: order[result.input_file])
+
+
+def print_summary(results: Sequence[FileResult], wall_seconds: float, workers: int) -> None:
+    """Print a table with one row per file followed by the totals."""
+    name_width = max([len('File')] + [len(result.input_file) for result in results])
+    print(f"\n{'File':<{name_width}} {'Statements':>10} {'Comments':>9} {'Seconds':>8}  Status")
+    print("-" * (name_width + 40))
+    for result in results:
+        status = f"✗ {result.error}" if result.error else "✓"
+        print(f"{result.input_file:<{name_width}} {result.statements:>10} {result.comments:>9} "
+              f"{result.seconds:>8.2f}  {status}")
+    print("-" * (name_width + 40))
+
+    failed = sum(1 for result in results if result.error)
+    busy_seconds = sum(result.seconds for result in results)
+    print(f"Files: {len(results)} ({len(results) - failed} converted, {failed} failed)")
+    print(f"Statements: {sum(result.statements for result in results)}, "
+          f"comments: {sum(result.comments for result in results)}")
+    print(f"Time: {wall_seconds:.2f}s wall, {busy_seconds:.2f}s in conversion, {workers} worker(s)")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help="SQL files, directories or glob patterns")
+    parser.add_argument('--excel', default='table.xlsx', help="Field mapping workbook (default: table.xlsx)")
+    parser.add_argument('--comment-excel', help="Workbook with SAP field descriptions; adds COMMENT() to columns")
+    parser.add_argument('--output-dir', default='converted_notebooks')
+    parser.add_argument('--pattern', action='append', dest='patterns',
+                        help="File pattern for directory inputs (repeatable, default: *.sql and *.txt)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--structural-comments', action='store_true',
+                        help="With --comment-excel: only annotate CREATE TABLE column lists, keep existing COMMENTs")
+    parser.add_argument('--keep-processed', action='store_true', help="Also write the spark.sql() files")
+    parser.add_argument('--stream', action='store_true',
+                        help="Process statement by statement with bounded memory (splits on every ';' "
+                             "outside literals and comments)")
+    parser.add_argument('--no-token-aware', action='store_true',
+                        help="Plain text replacement instead of the token-aware rewrite")
+    parser.add_argument('--manifest-dir', default='.conversion_manifest',
+                        help="Where converted statements are kept for incremental runs")
+    parser.add_argument('--no-incremental', action='store_true', help="Convert every statement again")
+    parser.add_argument('--metrics-file', help="Write the run log, counters and stage timings as JSON lines")
+    parser.add_argument('--cache-dir', default='.mapping_cache')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--refresh-cache', action='store_true')
+    args = parser.parse_args(argv)
+
+    # Outputs, manifest and cache may live below an input directory
+    input_files = find_sql_files(args.inputs, args.patterns or DEFAULT_PATTERNS,
+                                 exclude_dirs=[args.output_dir, args.manifest_dir, args.cache_dir])
+    if not input_files:
+        print("✗ No SQL files found")
+        return 1
+    for excel_file in filter(None, [args.excel, args.comment_excel]):
+        if not os.path.exists(excel_file):
+            print(f"✗ Excel file not found: {excel_file}")
+            return 1
+
+    try:
+        tasks = plan_tasks(input_files, args.output_dir, args.keep_processed)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+
+    start = time.perf_counter()
+    compiled, field_lookup = load_conversion_mappings(args.excel, args.comment_excel, args.cache_dir,
+                                                      use_cache=not args.no_cache,
+                                                      refresh_cache=args.refresh_cache)
+    if not compiled:
+        print(f"✗ No field mappings found in {args.excel}")
+        return 1
+    print(f"✓ Loaded {len(compiled['field_mappings'])} field mappings and "
+          f"{len(compiled['table_mappings'])} table mappings in {time.perf_counter() - start:.2f}s")
+
+    workers = max(1, min(args.workers, len(tasks)))
+    print(f"Converting {len(tasks)} files with {workers} worker(s) into {args.output_dir}")
+
+    manifest = None if args.no_incremental else ConversionManifest(args.manifest_dir)
+    start = time.perf_counter()
+    results = run_batch(tasks, compiled, field_lookup, workers, token_aware=not args.no_token_aware,
+                        stream=args.stream, manifest=manifest, structural_comments=args.structural_comments)
+    print_summary(results, time.perf_counter() - start, workers)
+    if manifest is not None:
+        manifest.save()
+        manifest.report()
+    run_log.print_summary()
+    if args.metrics_file:
+        run_log.export_jsonl(args.metrics_file)
+        print(f"✓ Run log written to: {args.metrics_file}")
+    return 1 if any(result.error for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,387 @@
+"""
+Columnar ingestion of the Excel field mapping sheets.
+
+`read_field_mapping` builds the per-calculation-view field mapping of
+`mapping_script.py` from the 'Field' sheets of `table.xlsx`;
+`read_excel_mapping` builds the nested 'ADSO GCM' mapping of the end-to-end
+comment converter. Both notebooks and the batch converter import them from
+here.
+
+`read_mapping_from_excel` (mapping_script.py) and `read_excel_mapping`
+(end_to_end_sql_converter.py) used to walk every sheet with `df.iterrows()`
+and de-duplicate values with `if value not in list`, which is quadratic per
+calculation view. The functions below produce the same structures with
+pandas factorize/drop_duplicates/groupby instead.
+
+The row-by-row versions are kept as `collect_field_values_rowwise` and
+`build_nested_mapping_rowwise`; they are the reference for the benchmark.
+"""
+
+import warnings
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import DEBUG, EXCEL_LOAD, INFO, run_log
+
+# Candidate names of the column holding the consuming calculation view
+USED_BY_COLUMNS = ['ADSO GCM', 'Used_by', 'Used by']
+
+# Excel column -> data_storage key
+FIELD_COLUMNS = [
+    ('Base SAP CV - equivalent of DBX Table', 'base_sap_cv_values'),
+    ('SAP Field Name', 'sap_field_name_values'),
+    ('DBX Field name', 'dbx_field_name_values'),
+    ('DBX Table', 'dbx_table_values'),
+    ('Comments', 'comments_values')
+]
+
+STORAGE_KEYS = ['used_by_values'] + [storage_key for _, storage_key in FIELD_COLUMNS]
+
+# Excel column -> key in the nested mapping of read_excel_mapping
+NESTED_MAPPING_COLUMNS = [
+    ('SAP Field Name', 'SAP_Field_Name'),
+    ('SAP Field description', 'SAP_Field_Description'),
+    ('DBX Table', 'DBX_Table'),
+    ('DBX Field name', 'DBX_Field_Name')
+]
+
+
+def find_used_by_column(df: pd.DataFrame) -> Optional[str]:
+    """Return the first 'Used_by' style column present in the sheet, or None."""
+    for col_name in USED_BY_COLUMNS:
+        if col_name in df.columns:
+            return col_name
+    return None
+
+
+def empty_field_storage() -> Dict[str, Dict[str, List]]:
+    """Return an empty data_storage structure as consumed by create_field_mapping."""
+    return {storage_key: {} for storage_key in STORAGE_KEYS}
+
+
+def collect_field_values(sheets: Dict[str, pd.DataFrame], verbose: bool = False) -> Dict[str, Dict[str, List]]:
+    """
+    Collect the unique values per calculation view from the field sheets.
+
+    Every distinct 'Used_by' value of a sheet becomes a composite key
+    `{sheet_name}_{n}`, numbered in order of first appearance. For each
+    composite key the unique non-empty values of every field column are kept
+    in order of first appearance.
+
+    Parameters:
+    sheets (dict): Sheet name -> DataFrame, in workbook order
+    verbose (bool): Print a line per processed sheet
+
+    Returns:
+    dict: data_storage (storage key -> composite key -> list of values)
+    """
+    data_storage = empty_field_storage()
+
+    for sheet_name, df in sheets.items():
+        used_by_column = find_used_by_column(df)
+        if not used_by_column:
+            run_log.warning("⚠️  No 'Used_by' column found in sheet '%s'. Skipping.", sheet_name)
+            continue
+
+        df = df[df[used_by_column].notna()]
+        if df.empty:
+            continue
+
+        used_by = df[used_by_column].map(lambda value: str(value).strip())
+        codes, uniques = pd.factorize(used_by, sort=False)
+        composite_keys = [f"{sheet_name}_{num}" for num in range(1, len(uniques) + 1)]
+
+        for composite_key, used_by_value in zip(composite_keys, uniques):
+            for storage_key in STORAGE_KEYS:
+                data_storage[storage_key][composite_key] = []
+            data_storage['used_by_values'][composite_key].append(used_by_value)
+
+        for col_name, storage_key in FIELD_COLUMNS:
+            if col_name not in df.columns:
+                continue
+            values = pd.DataFrame({'code': codes, 'value': df[col_name].to_numpy(dtype=object)})
+            values = values[values['value'].notna()].drop_duplicates()
+            if values.empty:
+                continue
+
+            # Stable sort by view keeps first-appearance order inside each view
+            view_codes = values['code'].to_numpy()
+            order = np.argsort(view_codes, kind='stable')
+            view_codes = view_codes[order]
+            view_values = values['value'].to_numpy(dtype=object)[order]
+            starts = np.flatnonzero(np.r_[True, view_codes[1:] != view_codes[:-1]])
+            ends = np.r_[starts[1:], len(view_codes)]
+            for start, end in zip(starts, ends):
+                data_storage[storage_key][composite_keys[view_codes[start]]] = view_values[start:end].tolist()
+
+        run_log.log(INFO if verbose else DEBUG, "Processed sheet '%s': %d calculation views", sheet_name, len(uniques))
+
+    return data_storage
+
+
+def collect_field_values_rowwise(sheets: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, List]]:
+    """Row-by-row reference implementation of collect_field_values (iterrows)."""
+    data_storage = empty_field_storage()
+    unique_used_by_sets = {}
+
+    for sheet_name, df in sheets.items():
+        next_num = 1
+        used_by_column = find_used_by_column(df)
+        if not used_by_column:
+            continue
+
+        for _, row in df.iterrows():
+            if pd.isna(row[used_by_column]):
+                continue
+
+            used_by_value = str(row[used_by_column]).strip()
+            sheet_used_by_key = (sheet_name, used_by_value)
+            if sheet_used_by_key not in unique_used_by_sets:
+                unique_used_by_sets[sheet_used_by_key] = next_num
+                next_num += 1
+            composite_key = f"{sheet_name}_{unique_used_by_sets[sheet_used_by_key]}"
+
+            for storage_key in data_storage:
+                if composite_key not in data_storage[storage_key]:
+                    data_storage[storage_key][composite_key] = []
+
+            if used_by_value not in data_storage['used_by_values'][composite_key]:
+                data_storage['used_by_values'][composite_key].append(used_by_value)
+
+            for col_name, storage_key in FIELD_COLUMNS:
+                if col_name in df.columns and not pd.isna(row[col_name]):
+                    value = row[col_name]
+                    if value not in data_storage[storage_key][composite_key]:
+                        data_storage[storage_key][composite_key].append(value)
+
+    return data_storage
+
+
+def create_field_mapping(view_keys: List[str], used_by_values: Dict = None,
+                        base_sap_cv_values: Dict = None, sap_field_name_values: Dict = None,
+                        dbx_field_name_values: Dict = None, dbx_table_values: Dict = None,
+                        comments_values: Dict = None) -> Dict:
+    """
+    Create a field mapping dictionary for calculation views.
+
+    Parameters:
+    view_keys (list): List of composite keys to include in the mapping
+    *_values (dict): Dictionaries mapping composite keys to lists of values
+
+    Returns:
+    dict: The field mapping dictionary
+    """
+    # Initialize empty dictionaries for None parameters
+    data_dicts = {
+        'used_by_values': used_by_values or {},
+        'base_sap_cv_values': base_sap_cv_values or {},
+        'sap_field_name_values': sap_field_name_values or {},
+        'dbx_field_name_values': dbx_field_name_values or {},
+        'dbx_table_values': dbx_table_values or {},
+        'comments_values': comments_values or {}
+    }
+
+    field_mapping = {}
+
+    for key in view_keys:
+        # Get maximum number of records for this view
+        max_records = max(
+            len(data_dict.get(key, [])) for data_dict in data_dicts.values()
+        )
+        max_records = max(max_records, 1)  # At least one record
+
+        # Create records
+        records = []
+        table_name = data_dicts['dbx_table_values'].get(key, [""])[0] if data_dicts['dbx_table_values'].get(key, []) else ""
+        base_sap_cv = data_dicts['base_sap_cv_values'].get(key, [""])[0] if data_dicts['base_sap_cv_values'].get(key, []) else ""
+
+        for i in range(max_records):
+            record = {
+                'Used_by': _get_value_at_index(data_dicts['used_by_values'], key, i),
+                'Base SAP CV - equivalent of DBX Table': _get_value_at_index(data_dicts['base_sap_cv_values'], key, i, base_sap_cv),
+                'SAP Field Name': _get_value_at_index(data_dicts['sap_field_name_values'], key, i),
+                'DBX Field name': _get_value_at_index(data_dicts['dbx_field_name_values'], key, i),
+                'DBX Table': _get_value_at_index(data_dicts['dbx_table_values'], key, i, table_name),
+                'Comments': _get_value_at_index(data_dicts['comments_values'], key, i)
+            }
+            records.append(record)
+
+        field_mapping[f'calculation_view_{key}'] = records
+
+    return field_mapping
+
+def _get_value_at_index(data_dict: Dict, key: str, index: int, default: str = "") -> str:
+    """Helper function to safely get value at index from data dictionary."""
+    values = data_dict.get(key, [])
+    return values[index] if index < len(values) else default
+
+
+@run_log.timed(EXCEL_LOAD)
+def read_field_mapping(excel_file: str, verbose: bool = False) -> Dict:
+    """
+    Read the 'Field' sheets of the mapping workbook into a field mapping.
+
+    Parameters:
+    excel_file (str): Path to the Excel file
+    verbose (bool): Print the sheets being processed
+
+    Returns:
+    dict: calculation_view_{key} -> list of records, or {} if there are no field sheets
+    """
+    # Read all sheet names
+    xl = pd.ExcelFile(excel_file)
+    level = INFO if verbose else DEBUG
+    run_log.log(level, "Excel file contains sheets: %s", xl.sheet_names)
+
+    # Find sheets with 'Field' in their name
+    field_sheets = [sheet for sheet in xl.sheet_names if 'Field' in sheet]
+    run_log.log(level, "Processing field sheets: %s", field_sheets)
+
+    if not field_sheets:
+        run_log.warning("⚠️  No sheets with 'Field' in name found.")
+        return {}
+
+    # Read all field sheets with a single open of the workbook
+    sheets = pd.read_excel(xl, sheet_name=field_sheets)
+
+    # Collect unique values per calculation view (columnar, no iterrows)
+    data_storage = collect_field_values(sheets, verbose=verbose)
+
+    # Create field mapping
+    view_keys = sorted(list(data_storage['used_by_values'].keys()))
+    return create_field_mapping(view_keys, **data_storage)
+
+
+def extract_sql_mappings(field_mapping: Dict) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Extract flat SAP -> DBX field and table lookups from a field mapping.
+
+    Returns:
+    tuple: (field_mappings, table_mappings)
+    """
+    field_mappings = {}
+    table_mappings = {}
+
+    # Extract mappings from all calculation views
+    for calc_view, records in field_mapping.items():
+        for record in records:
+            sap_field = str(record.get('SAP Field Name', '')).strip()
+            dbx_field = str(record.get('DBX Field name', '')).strip()
+            sap_table = str(record.get('Base SAP CV - equivalent of DBX Table', '')).strip()
+            dbx_table = str(record.get('DBX Table', '')).strip()
+
+            if sap_field and dbx_field:
+                field_mappings[sap_field.upper()] = dbx_field
+
+            if sap_table and dbx_table:
+                table_mappings[sap_table] = dbx_table
+
+    return field_mappings, table_mappings
+
+
+def build_nested_mapping(df: pd.DataFrame, key_column: str = 'ADSO GCM') -> Dict:
+    """
+    Group mapping rows by `key_column` into lists of entry dictionaries.
+
+    Rows without a key are skipped; empty cells become None.
+
+    Parameters:
+    df (DataFrame): Mapping sheet containing key_column and NESTED_MAPPING_COLUMNS
+
+    Returns:
+    dict: key -> list of {'SAP_Field_Name', 'SAP_Field_Description', 'DBX_Table', 'DBX_Field_Name'}
+    """
+    df = df[df[key_column].notna()]
+    columns = [col_name for col_name, _ in NESTED_MAPPING_COLUMNS]
+    entries = df[columns].astype(object)
+    entries = entries.where(entries.notna(), None)
+    entries.columns = [entry_key for _, entry_key in NESTED_MAPPING_COLUMNS]
+
+    # One records conversion for the whole sheet, then group the records
+    # by key in order of first appearance
+    records = entries.to_dict('records')
+    codes, keys = pd.factorize(df[key_column], sort=False)
+    nested_mapping = {key: [] for key in keys}
+    groups = list(nested_mapping.values())
+    for code, record in zip(codes.tolist(), records):
+        groups[code].append(record)
+    return nested_mapping
+
+
+def build_nested_mapping_rowwise(df: pd.DataFrame, key_column: str = 'ADSO GCM') -> Dict:
+    """Row-by-row reference implementation of build_nested_mapping (iterrows)."""
+    nested_mapping = {}
+    for _, row in df.iterrows():
+        key = row[key_column]
+        if pd.isna(key):
+            continue
+        if key not in nested_mapping:
+            nested_mapping[key] = []
+        nested_mapping[key].append({
+            entry_key: row[col_name] if not pd.isna(row[col_name]) else None
+            for col_name, entry_key in NESTED_MAPPING_COLUMNS
+        })
+    return nested_mapping
+
+
+@run_log.timed(EXCEL_LOAD)
+def read_excel_mapping(file_path: str = "mapping.xlsx") -> Optional[Dict]:
+    """
+    Read Excel file and create nested mapping structure.
+
+    Args:
+        file_path: Path to the Excel file
+
+    Returns:
+        Nested mapping dictionary or None if failed
+    """
+    try:
+        run_log.info("Reading Excel file: %s", file_path)
+
+        # Open the workbook once and pick the sheet from its sheet list
+        excel_file = pd.ExcelFile(file_path)
+        if 'EWD field mapping_NN' in excel_file.sheet_names:
+            df = excel_file.parse('EWD field mapping_NN')
+            run_log.info("Successfully loaded sheet 'EWD field mapping_NN'")
+        else:
+            warnings.warn("Could not read sheet 'EWD field mapping_NN': sheet not found")
+            # Try to find any sheet with '_NN' in the name
+            nn_sheets = [sheet for sheet in excel_file.sheet_names if "_NN" in sheet]
+            if nn_sheets:
+                df = excel_file.parse(nn_sheets[0])
+                run_log.info("Using alternative sheet: %s", nn_sheets[0])
+            else:
+                warnings.warn("No sheets with '_NN' found. Using first sheet.")
+                df = excel_file.parse(0)
+
+        run_log.info("Original shape: %s", df.shape)
+
+        # Check for required columns
+        required_columns = ['ADSO GCM', 'SAP Field Name', 'SAP Field description', 'DBX Table', 'DBX Field name']
+        missing_columns = [col for col in required_columns if col not in df.columns]
+
+        if missing_columns:
+            warnings.warn(f"Missing required columns: {missing_columns}")
+            run_log.info("Available columns:")
+            for col in df.columns:
+                run_log.info("  - '%s'", col)
+            return None
+
+        # Remove rows where all required columns are NaN
+        df_clean = df.dropna(subset=required_columns, how='all')
+        run_log.info("Shape after removing empty rows: %s", df_clean.shape)
+
+        # Create nested mapping, grouped by ADSO GCM (rows without ADSO GCM are skipped)
+        nested_mapping = build_nested_mapping(df_clean, key_column='ADSO GCM')
+        processed_rows = sum(len(entries) for entries in nested_mapping.values())
+
+        run_log.info("Successfully processed %d rows", processed_rows)
+        run_log.info("Created nested mapping with %d ADSO GCM entries", len(nested_mapping))
+
+        return nested_mapping
+
+    except Exception as e:
+        warnings.warn(f"Error reading Excel file: {e}")
+        return None
@@ -0,0 +1,189 @@
+"""
+Local fake of an OpenAI-compatible chat completions endpoint.
+
+For trying out model_scheduler.py (or a notebook's model calls) without an
+Azure OpenAI deployment: answers POST .../chat/completions (OpenAI and Azure
+URL forms) after a configurable latency, enforces its own requests-per-minute
+limit with 429 + Retry-After like the real service, and can inject 429/500
+errors at random or answer the first requests with 429. It counts what it saw, including the highest number of
+requests in flight.
+
+Usage:
+    with FakeChatServer(latency=0.2, requests_per_minute=60) as base_url:
+        sender = http_chat_sender(base_url)
+        ...
+
+    python fake_openai_server.py [--port 8000] [--latency 0.5] [--error-rate 0.1]
+"""
+
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+
+def default_reply(request: Dict) -> str:
+    """Echo the first line of the last user message as a SQL comment."""
+    messages = request.get('messages') or [{}]
+    first_line = str(messages[-1].get('content') or '').strip().split('\n')[0]
+    return f"-- Converted: {first_line[:80]}\nSELECT 1;"
+
+
+class FakeChatServer:
+    """
+    Threaded HTTP server answering chat completion requests.
+
+    Parameters:
+    host, port (str, int): Address to listen on; port 0 picks a free port
+    latency (float): Seconds before each answer
+    requests_per_minute (int): Server-side limit; None for no limit
+    error_rate (float): Share of requests answered with 429 or 500 at random
+    retry_after (float): Retry-After of the 429 answers, in seconds
+    rate_limit_first (int): Answer this many first requests with 429, e.g. to test retries
+    reply (callable): request dict -> completion text
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05,
+                 requests_per_minute: Optional[int] = None, error_rate: float = 0.0, retry_after: float = 1.0,
+                 reply: Callable[[Dict], str] = default_reply, seed: int = 0, rate_limit_first: int = 0):
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.reply = reply
+        self.rate_limit_first = rate_limit_first
+        self.rng = random.Random(seed)
+        self.stats = {'requests': 0, 'completed': 0, 'rate_limited': 0, 'errors': 0, 'max_in_flight': 0}
+        self._in_flight = 0
+        self._recent = deque()  # arrival times within the last minute
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _admit(self) -> Optional[int]:
+        """Count an arriving request; returns the error status to answer with, if any."""
+        with self._lock:
+            self.stats['requests'] += 1
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            if (self.stats['requests'] <= self.rate_limit_first
+                    or self.requests_per_minute and len(self._recent) >= self.requests_per_minute):
+                self.stats['rate_limited'] += 1
+                return 429
+            self._recent.append(now)
+            if self.rng.random() < self.error_rate:
+                status = self.rng.choice([429, 500])
+                self.stats['rate_limited' if status == 429 else 'errors'] += 1
+                return status
+            self._in_flight += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+        return None
+
+    def _complete(self, request: Dict) -> Dict:
+        time.sleep(self.latency)
+        content = self.reply(request)
+        prompt_chars = sum(len(str(message.get('content') or '')) for message in request.get('messages', []))
+        usage = {'prompt_tokens': prompt_chars // 4 + 1, 'completion_tokens': len(content) // 4 + 1}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        with self._lock:
+            self._in_flight -= 1
+            self.stats['completed'] += 1
+        return {
+            'id': f"chatcmpl-fake-{self.stats['completed']}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': usage,
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None) -> None:
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                path = urlsplit(self.path).path
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+                if not path.endswith('/chat/completions'):
+                    return self._send_json(404, {'error': {'message': f"Unknown path {path}"}})
+                if '/deployments/' in path and 'model' not in request:
+                    request['model'] = path.split('/deployments/')[1].split('/')[0]
+
+                status = server._admit()
+                if status == 429:
+                    return self._send_json(429, {'error': {'message': 'Rate limit exceeded'}},
+                                           {'Retry-After': f"{server.retry_after:g}"})
+                if status is not None:
+                    return self._send_json(status, {'error': {'message': 'Internal server error'}})
+                self._send_json(200, server._complete(request))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        """Serve in a background thread; returns the base URL (http://host:port/v1)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name='fake-openai-server', daemon=True)
+            self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> str:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--requests-per-minute', type=int, default=None)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake_server = FakeChatServer(args.host, args.port, args.latency, args.requests_per_minute, args.error_rate)
+    print(f"Fake chat completions endpoint at {fake_server.base_url} (Ctrl+C to stop)")
+    try:
+        fake_server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake_server._server.server_close()
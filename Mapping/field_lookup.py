@@ -0,0 +1,231 @@
+"""
+Field name -> SAP description lookup with an underscore-insensitive index.
+
+`find_field_description` falls back to matching field names without
+underscores (`ltst_sal_p` == `ltstsal_p`). Scanning every key for that on
+each miss made large DDL batches quadratic. `FieldLookup` keeps a second,
+normalized index next to the exact one so both lookups are a single dict hit.
+
+`create_field_lookup` and `load_field_lookup` build the lookup from the nested
+mapping of `read_excel_mapping`; they are shared by the end-to-end comment
+converter notebook and the batch converter.
+"""
+
+import os
+import warnings
+from typing import Dict, List, Optional, Tuple
+
+from excel_ingest import read_excel_mapping
+from instrumentation import LOOKUP_BUILD, run_log
+from mapping_cache import MappingCache, shared_cache
+
+
+def normalize_field_name(field_name: str) -> str:
+    """Lower-case a field name and drop underscores and surrounding whitespace."""
+    return field_name.lower().strip().replace('_', '')
+
+
+class FieldLookup(dict):
+    """
+    Dictionary of lower-cased DBX field names to SAP field descriptions.
+
+    Behaves like the plain dictionary returned before, plus:
+    - `normalized`: normalized field name -> description of the first field
+      with that normalized name (the same one the linear scan returned)
+    - `collisions`: normalized name -> all DBX field names sharing it, for
+      names that collide with different descriptions
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self.normalized: Dict[str, str] = {}
+        self._normalized_source: Dict[str, str] = {}
+        self.collisions: Dict[str, List[str]] = {}
+        for key, value in dict.items(self):
+            self._index(key, value)
+
+    def _index(self, key: str, value: str) -> None:
+        normalized_key = key.replace('_', '')
+        first_key = self._normalized_source.setdefault(normalized_key, key)
+        if first_key == key:
+            # The first field with this normalized name wins, with its latest description
+            self.normalized[normalized_key] = value
+        elif self.normalized[normalized_key] != value:
+            names = self.collisions.setdefault(normalized_key, [first_key])
+            if key not in names:
+                names.append(key)
+
+    # Every dict mutator goes through the indexes: additions one key at a
+    # time, removals by rebuilding them (the next field may become the first)
+
+    def __setitem__(self, key: str, value: str) -> None:
+        super().__setitem__(key, value)
+        self._index(key, value)
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __or__(self, other):
+        merged = self.copy()
+        merged.update(other)
+        return merged
+
+    def copy(self) -> 'FieldLookup':
+        return self.__class__(self)
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        self._reindex()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._reindex()
+        return value
+
+    def popitem(self) -> Tuple[str, str]:
+        item = super().popitem()
+        self._reindex()
+        return item
+
+    def clear(self) -> None:
+        super().clear()
+        self._reindex()
+
+    def __reduce__(self):
+        # Rebuild the indexes through __init__ when unpickled (mapping cache)
+        return (self.__class__, (dict(self),))
+
+    def find(self, field_name: str) -> Optional[str]:
+        """
+        Look up a field: exact (case-insensitive) match first, then without underscores.
+
+        Returns:
+            SAP field description if found, None otherwise
+        """
+        field_lower = field_name.lower().strip()
+        description = self.get(field_lower)
+        if description is not None:
+            return description
+        return self.normalized.get(field_lower.replace('_', ''))
+
+    def collision_report(self) -> List[Tuple[str, List[str]]]:
+        """Return (normalized name, DBX field names) for every ambiguous normalized name."""
+        return sorted(self.collisions.items())
+
+
+@run_log.timed(LOOKUP_BUILD)
+def create_field_lookup(nested_mapping: Dict) -> FieldLookup:
+    """
+    Create a lookup dictionary from DBX_Field_Name to SAP_Field_Description.
+
+    Besides the exact (lower-cased) index, the lookup keeps an index of field
+    names without underscores, so find_field_description never has to scan.
+
+    Args:
+        nested_mapping: The nested mapping dictionary
+
+    Returns:
+        FieldLookup (dictionary) mapping DBX field names to SAP field descriptions
+    """
+    field_lookup = FieldLookup()
+
+    if not nested_mapping:
+        warnings.warn("No mapping data provided")
+        return field_lookup
+
+    for adso_gcm, entries in nested_mapping.items():
+        for entry in entries:
+            dbx_field = entry.get('DBX_Field_Name')
+            sap_description = entry.get('SAP_Field_Description')
+
+            if dbx_field and sap_description:
+                # Convert to lowercase for case-insensitive matching
+                field_lookup[dbx_field.lower()] = sap_description
+
+    run_log.info("Created field lookup with %d mappings", len(field_lookup))
+
+    # Field names that only differ by underscores but have different descriptions
+    for normalized_name, dbx_fields in field_lookup.collision_report():
+        warnings.warn(f"Fields {dbx_fields} all match '{normalized_name}' without underscores; "
+                      f"using the description of '{dbx_fields[0]}'")
+
+    return field_lookup
+
+
+def load_field_lookup(excel_file: str, use_cache: bool = True, refresh_cache: bool = False,
+                      cache: Optional[MappingCache] = None) -> Dict[str, str]:
+    """
+    Read the Excel mapping and build the field lookup, using the mapping cache.
+
+    Args:
+        excel_file: Path to the Excel mapping file
+        use_cache: Reuse the compiled lookup from a previous run if the file is unchanged
+        refresh_cache: Rebuild the cached lookup even if the file is unchanged
+        cache: Mapping cache to use; default the shared one of '.mapping_cache' (see shared_cache)
+
+    Returns:
+        Dictionary mapping DBX field names to SAP field descriptions
+    """
+    def build() -> Dict[str, str]:
+        nested_mapping = read_excel_mapping(excel_file)
+
+        if not nested_mapping:
+            warnings.warn("Failed to create mapping from Excel. Using empty mapping.")
+            nested_mapping = {}
+
+        return create_field_lookup(nested_mapping)
+
+    if not use_cache or not os.path.exists(excel_file):
+        return build()
+
+    try:
+        return (cache or shared_cache()).get_or_build(excel_file, build, namespace="end_to_end_field_lookup", refresh=refresh_cache)
+    except OSError as e:
+        warnings.warn(f"Mapping cache unavailable: {e}")
+        return build()
+
+
+def find_field_description(field_name: str, field_lookup: Dict[str, str]) -> Optional[str]:
+    """
+    Find the SAP field description for a given field name.
+
+    Args:
+        field_name: The field name to look up
+        field_lookup: Dictionary mapping field names to descriptions
+
+    Returns:
+        SAP field description if found, None otherwise
+    """
+    if not field_lookup:
+        return None
+
+    # Indexed lookup: exact match, then without underscores
+    if isinstance(field_lookup, FieldLookup):
+        return field_lookup.find(field_name)
+
+    # Try exact match first (case-insensitive)
+    field_lower = field_name.lower().strip()
+
+    if field_lower in field_lookup:
+        return field_lookup[field_lower]
+
+    # Try without underscores
+    field_no_underscore = field_lower.replace('_', '')
+    for key, value in field_lookup.items():
+        if key.replace('_', '') == field_no_underscore:
+            return value
+
+    return None
@@ -0,0 +1,320 @@
+"""
+Indexed fuzzy matching of SAP field names against DBX field names.
+
+`calculate_similarity` compares two names. Finding the best DBX names for a
+SAP name used to mean scoring it against every DBX name (or, in the data type
+comparison notebooks, a substring scan over all columns). `FuzzyIndex`
+generates candidates from inverted indexes with prefilters derived from the
+score, so no name scoring at least the minimum is dropped, and only re-ranks
+those candidates with `calculate_similarity`.
+
+`create_fuzzy_mapping` and `create_fuzzy_candidates` are the field mapping
+steps of mapping_script.py built on these, importable for the benchmarks.
+
+Usage:
+    index = FuzzyIndex(dbx_field_names)
+    index.top_k('ZLTSALDT', k=5)   # [(dbx_field, score), ...]
+"""
+
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Removed (anywhere in the name) before comparing names
+SUFFIXES_TO_REMOVE = ['_p', '_r', '_cd', '_dat', '_code']
+
+
+def clean_field_name(field_name: str) -> str:
+    """Lower-case a field name and strip the common SAP/DBX suffixes."""
+    cleaned = field_name.lower().strip()
+    for suffix in SUFFIXES_TO_REMOVE:
+        cleaned = cleaned.replace(suffix, '')
+    return cleaned
+
+
+def calculate_similarity(str1: str, str2: str) -> float:
+    """
+    Calculate similarity between two strings using multiple methods.
+    Returns a score between 0 and 1, where 1 is identical.
+    """
+    if not str1 or not str2:
+        return 0.0
+
+    # Convert to lowercase for comparison
+    s1 = str1.lower().strip()
+    s2 = str2.lower().strip()
+
+    # Exact match
+    if s1 == s2:
+        return 1.0
+
+    # Remove common suffixes/prefixes for better matching
+    s1_clean = clean_field_name(s1)
+    s2_clean = clean_field_name(s2)
+
+    if s1_clean == s2_clean:
+        return 0.9
+
+    # Check if one is contained in the other
+    if s1_clean in s2_clean or s2_clean in s1_clean:
+        return 0.8
+
+    # Character overlap ratio
+    set1 = set(s1_clean)
+    set2 = set(s2_clean)
+    intersection = len(set1.intersection(set2))
+    union = len(set1.union(set2))
+
+    if union == 0:
+        return 0.0
+
+    char_similarity = intersection / union
+
+    # Length similarity factor
+    len_diff = abs(len(s1_clean) - len(s2_clean))
+    max_len = max(len(s1_clean), len(s2_clean))
+    len_similarity = 1 - (len_diff / max_len) if max_len > 0 else 0
+
+    # Combined score
+    return (char_similarity * 0.7) + (len_similarity * 0.3)
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    """
+    Character n-grams of `text` with underscores removed, so `mut_nr` and
+    `mutnr` share all their grams. Texts shorter than n are their own gram.
+    """
+    text = text.replace('_', '')
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class FuzzyIndex:
+    """
+    Candidate index over DBX field names.
+
+    The prefilters are derived from calculate_similarity, so for a given
+    min_score they never drop a DBX name that scores at least min_score:
+    - cleaned names containing each other score 0.8 or more. A name that
+      contains another has all of its n-grams, so those candidates come
+      from an n-gram inverted index; names shorter than n are kept in a
+      short list and checked by containment.
+    - all other pairs score 0.7 * (Jaccard of the character sets) + 0.3 *
+      (length similarity). Reaching min_score needs a Jaccard of at least
+      t = (min_score - 0.3) / 0.7, so the candidate shares at least
+      ceil(t * |query chars|) characters with the query and therefore one of
+      the query's rarest |query chars| - that + 1 characters (prefix
+      filtering). Those candidates come from a character inverted index and
+      are checked against the exact score.
+    Candidates are then ranked by calculate_similarity. With min_score <= 0.3
+    every name can qualify and every name is a candidate.
+    """
+
+    def __init__(self, dbx_fields: Iterable[str], n: int = 3):
+        self.n = n
+
+        self.fields: List[str] = []
+        self._cleaned: List[str] = []
+        self._gram_counts: List[int] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._short_ids: List[int] = []
+        self._char_bits: Dict[str, int] = {}
+        self._char_masks: List[int] = []  # character set of the cleaned name as a bit mask
+        self._char_counts: List[int] = []
+        self._char_postings: Dict[str, List[int]] = defaultdict(list)
+
+        seen = set()
+        for field in dbx_fields:
+            if not field or field in seen:
+                continue
+            seen.add(field)
+            field_id = len(self.fields)
+            cleaned = clean_field_name(field)
+            grams = ngrams(cleaned, n)
+            self.fields.append(field)
+            self._cleaned.append(cleaned)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(field_id)
+            if len(cleaned.replace('_', '')) < n:
+                self._short_ids.append(field_id)
+            chars = set(cleaned)
+            self._char_masks.append(self._mask(chars))
+            self._char_counts.append(len(chars))
+            for char in chars:
+                self._char_postings[char].append(field_id)
+        self._postings = dict(self._postings)
+        self._char_postings = dict(self._char_postings)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def _mask(self, chars: Iterable[str]) -> int:
+        mask = 0
+        for char in chars:
+            mask |= self._char_bits.setdefault(char, 1 << len(self._char_bits))
+        return mask
+
+    def _containing(self, cleaned: str) -> Set[int]:
+        """Ids of DBX fields whose cleaned name contains `cleaned` or is contained in it."""
+        grams = ngrams(cleaned, self.n)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for field_id in self._postings.get(gram, ()):
+                shared[field_id] += 1
+
+        # The contained name has all of its grams in the other one
+        result = {field_id for field_id, count in shared.items()
+                  if count == min(len(grams), self._gram_counts[field_id])
+                  and (cleaned in self._cleaned[field_id] or self._cleaned[field_id] in cleaned)}
+
+        # Names shorter than n only match by containment
+        short_query = len(cleaned.replace('_', '')) < self.n
+        for field_id in (range(len(self.fields)) if short_query else self._short_ids):
+            candidate = self._cleaned[field_id]
+            if cleaned in candidate or candidate in cleaned:
+                result.add(field_id)
+        return result
+
+    def candidates(self, sap_field: str, min_score: float = 0.0) -> List[int]:
+        """Return the ids of DBX fields that can score at least min_score, in the order they were added."""
+        cleaned = clean_field_name(sap_field)
+        required = (min_score - 0.3) / 0.7
+        if not cleaned or required <= 0:
+            # An empty cleaned name is contained in every name
+            return list(range(len(self.fields)))
+        result = self._containing(cleaned)
+
+        # Characters the index does not know cannot be shared
+        chars = set(cleaned)
+        query_mask = self._mask(char for char in chars if char in self._char_bits)
+        min_shared = math.ceil(required * len(chars) - 1e-9)
+        if min_shared <= len(chars):
+            rarest = sorted(chars, key=lambda char: (len(self._char_postings.get(char, ())), char))
+            length = len(cleaned)
+            checked = set(result)
+            for char in rarest[:len(chars) - min_shared + 1]:
+                for field_id in self._char_postings.get(char, ()):
+                    if field_id in checked:
+                        continue
+                    checked.add(field_id)
+                    shared = (query_mask & self._char_masks[field_id]).bit_count()
+                    if shared < min_shared:
+                        continue
+                    candidate_length = len(self._cleaned[field_id])
+                    score = (0.7 * shared / (len(chars) + self._char_counts[field_id] - shared)
+                             + 0.3 * (1 - abs(length - candidate_length) / max(length, candidate_length)))
+                    if score >= min_score - 1e-9:
+                        result.add(field_id)
+        return sorted(result)
+
+    def top_k(self, sap_field: str, k: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        Return the k best DBX field names for a SAP field name.
+
+        Parameters:
+        sap_field (str): SAP field name
+        k (int): Maximum number of candidates
+        min_score (float): Minimum calculate_similarity score
+
+        Returns:
+        list: (dbx_field, score) tuples, best first
+        """
+        if not sap_field:
+            return []
+        scored = []
+        for field_id in self.candidates(sap_field, min_score):
+            score = calculate_similarity(sap_field, self.fields[field_id])
+            if score >= min_score:
+                scored.append((-score, field_id))
+        # Ties are broken by the order in which the DBX names were added
+        scored.sort()
+        return [(self.fields[field_id], -score) for score, field_id in scored[:k]]
+
+    def best_match(self, sap_field: str, min_score: float = 0.0) -> Optional[str]:
+        """Return the single best DBX field name, or None."""
+        matches = self.top_k(sap_field, k=1, min_score=min_score)
+        return matches[0][0] if matches else None
+
+
+def create_fuzzy_mapping(field_mapping: Dict, similarity_threshold: float = 0.6) -> Dict:
+    """
+    Create a fuzzy mapping containing only records where SAP Field Name
+    and DBX Field name have similarity above the threshold.
+
+    Parameters:
+    field_mapping (dict): The complete field mapping
+    similarity_threshold (float): Minimum similarity score (0-1)
+
+    Returns:
+    dict: Fuzzy mapping containing only similar field name pairs
+    """
+    fuzzy_mapping = {}
+
+    for calc_view, records in field_mapping.items():
+        fuzzy_records = []
+
+        for record in records:
+            sap_field = record.get('SAP Field Name', '')
+            dbx_field = record.get('DBX Field name', '')
+
+            # Skip empty fields
+            if not sap_field or not dbx_field:
+                continue
+
+            # Calculate similarity
+            similarity = calculate_similarity(sap_field, dbx_field)
+
+            # Only include if similarity is above threshold but not exact match
+            if similarity >= similarity_threshold and similarity < 1.0:
+                fuzzy_record = record.copy()
+                fuzzy_record['Similarity_Score'] = round(similarity, 3)
+                fuzzy_record['Match_Type'] = 'Fuzzy'
+                fuzzy_records.append(fuzzy_record)
+
+        # Only add calculation view if it has fuzzy matches
+        if fuzzy_records:
+            fuzzy_mapping[calc_view] = fuzzy_records
+
+    return fuzzy_mapping
+
+
+def create_fuzzy_candidates(field_mapping: Dict, top_k: int = 5, similarity_threshold: float = 0.6) -> Dict:
+    """
+    Suggest DBX field names for SAP fields that have no DBX field name yet.
+
+    All DBX field names in the mapping are indexed once (FuzzyIndex); each
+    unmapped SAP field is then matched against the index instead of against
+    every DBX field.
+
+    Parameters:
+    field_mapping (dict): The complete field mapping
+    top_k (int): Maximum number of suggestions per SAP field
+    similarity_threshold (float): Minimum similarity score (0-1)
+
+    Returns:
+    dict: SAP field name -> list of {'DBX Field name', 'Similarity_Score'}
+    """
+    dbx_fields = [
+        str(record.get('DBX Field name', '')).strip()
+        for records in field_mapping.values()
+        for record in records
+    ]
+    index = FuzzyIndex(dbx_fields)
+
+    fuzzy_candidates = {}
+    for records in field_mapping.values():
+        for record in records:
+            sap_field = str(record.get('SAP Field Name', '')).strip()
+            if not sap_field or record.get('DBX Field name') or sap_field in fuzzy_candidates:
+                continue
+
+            matches = index.top_k(sap_field, k=top_k, min_score=similarity_threshold)
+            if matches:
+                fuzzy_candidates[sap_field] = [
+                    {'DBX Field name': dbx_field, 'Similarity_Score': round(score, 3)}
+                    for dbx_field, score in matches
+                ]
+
+    return fuzzy_candidates
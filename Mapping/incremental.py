@@ -0,0 +1,343 @@
+"""
+Incremental re-conversion: only rewrite statements whose SQL or mapping changed.
+
+A change to one row of `table.xlsx` used to mean re-running the whole
+conversion on every file. The manifest in this module records, per input
+file, the hash of every statement and the mapping entries the statement can
+be affected by (see SqlRewriter.references). A statement's cache key is the
+hash of its text, those entries and the conversion settings, so on a re-run
+a statement is only rewritten (and annotated) when its SQL changed or one of
+its own mapping entries changed; everything else is read back from the
+cache.
+
+An input file whose content hash, mapping and settings are all unchanged is
+not even split again: its final statements were stored as one object when it
+was last converted and are copied to the writers as they are, without
+tokenizing a statement or opening a per-statement object.
+
+Layout of the manifest directory:
+    manifest.json             file -> content hash, file key and statement keys, statement key -> entry
+    objects/ab/abcd....sql    converted statement text, one file per key
+    files/ab/abcd....jsonl    final statements of an unchanged input file, one JSON string per line
+
+Usage:
+    manifest = ConversionManifest('.conversion_manifest')
+    references = MappingReferences(field_mappings, table_mappings, rewriter)
+    convert_sql_file(..., manifest=manifest, references=references)
+    manifest.save()
+    manifest.report()
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sql_rewriter import SqlRewriter
+
+# Bump when the meaning of cached statement outputs changes
+MANIFEST_VERSION = 2
+
+STAT_KEYS = ['files', 'files_reused', 'statements', 'reused', 'rewritten', 'new_sql', 'mapping_changed', 'chars',
+             'reused_chars']
+
+
+def text_sha256(text: str) -> str:
+    """Return the SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path: str, text: str) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _remove_dead_objects(directory: str, suffix: str, live: Set[str]) -> None:
+    if not os.path.isdir(directory):
+        return
+    for shard in os.listdir(directory):
+        shard_dir = os.path.join(directory, shard)
+        for name in os.listdir(shard_dir):
+            if name.endswith(suffix) and name[:-len(suffix)] not in live:
+                os.remove(os.path.join(shard_dir, name))
+
+
+class MappingReferences:
+    """
+    Maps a statement to the mapping entries its conversion depends on.
+
+    With the token-aware rewriter every statement only depends on the entries
+    returned by SqlRewriter.references. The plain text rewrite applies table
+    replacements in sequence, so there the whole mapping goes into the
+    fingerprint and any change invalidates every statement.
+    """
+
+    def __init__(self, field_mappings: Dict[str, str], table_mappings: Dict[str, str],
+                 rewriter: Optional[SqlRewriter] = None, token_aware: bool = True):
+        self.rewriter = (rewriter or SqlRewriter(field_mappings, table_mappings)) if token_aware else None
+        untracked = {} if token_aware else {
+            'fields': list(field_mappings.items()),
+            'tables': list(table_mappings.items())
+        }
+        self.fingerprint = text_sha256(json.dumps(
+            {'version': MANIFEST_VERSION, 'token_aware': token_aware, 'untracked': untracked}))
+        # The whole mapping, for reusing unchanged files (see IncrementalStage.file_key)
+        self.digest = text_sha256(json.dumps([sorted(field_mappings.items()), sorted(table_mappings.items())]))
+
+    def __call__(self, statement: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+        if self.rewriter is None:
+            return {}, {}
+        return self.rewriter.references(statement)
+
+
+class ConversionManifest:
+    """
+    Content-addressed cache of converted statements plus the per-file manifest.
+
+    Updates made while converting are also collected in `pending`, so pool
+    workers can send them to the parent process (take_pending / merge), which
+    is the only one that saves the manifest.
+    """
+
+    def __init__(self, directory: str = '.conversion_manifest'):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.files_dir = os.path.join(directory, 'files')
+        self.files: Dict[str, Dict] = {}
+        self.statements: Dict[str, Dict] = {}
+        self.stats = dict.fromkeys(STAT_KEYS, 0)
+        self.pending = self._empty_pending()
+        self.load()
+        # Statement texts converted before this run, to tell SQL changes from mapping changes
+        self.known_statements = {entry['statement'] for entry in self.statements.values()}
+
+    @staticmethod
+    def _empty_pending() -> Dict:
+        return {'files': {}, 'statements': {}, 'stats': dict.fromkeys(STAT_KEYS, 0)}
+
+    def load(self) -> None:
+        """Read manifest.json; a missing, unreadable or outdated manifest starts empty."""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable conversion manifest {self.manifest_path}: {str(e)}")
+            return
+        if data.get('version') != MANIFEST_VERSION:
+            return
+        self.files = data.get('files', {})
+        self.statements = data.get('statements', {})
+
+    def _object_path(self, key: str) -> str:
+        return os.path.join(self.objects_dir, key[:2], f"{key}.sql")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Return the converted text for a statement key, or None."""
+        if key not in self.statements:
+            return None
+        try:
+            with open(self._object_path(key), 'r', encoding='utf-8', newline='') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def store(self, key: str, entry: Dict, output: str) -> None:
+        """Store the converted text of a statement and its manifest entry."""
+        _write_atomic(self._object_path(key), output)
+        self.statements[key] = entry
+        self.pending['statements'][key] = entry
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add to one of the STAT_KEYS counters."""
+        self.pending['stats'][name] += amount
+
+    def _file_path(self, file_key: str) -> str:
+        return os.path.join(self.files_dir, file_key[:2], f"{file_key}.jsonl")
+
+    def reusable_file(self, input_file: str, sha256: str, file_key: str) -> Optional[Dict]:
+        """Return the record of an input file converted before with the same content and file key, or None."""
+        record = self.files.get(os.path.abspath(input_file))
+        if not record or record.get('sha256') != sha256 or record.get('key') != file_key:
+            return None
+        if not os.path.exists(self._file_path(file_key)):
+            return None
+        return record
+
+    def file_output(self, file_key: str) -> Iterator[str]:
+        """Read back the final statements stored by a FileOutputWriter."""
+        with open(self._file_path(file_key), 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def reuse_file(self, input_file: str, record: Dict) -> None:
+        """Keep the record of a reused file and count its statements as reused."""
+        self.record_file(input_file, record)
+        self.count('files')
+        self.count('files_reused')
+        self.count('statements', len(record['statements']))
+        self.count('reused', len(record['statements']))
+        self.count('chars', record['chars'])
+        self.count('reused_chars', record['chars'])
+
+    def record_file(self, input_file: str, record: Dict) -> None:
+        """
+        Record a converted input file: its content hash ('sha256'), file key
+        ('key'), statement keys in conversion order ('statements') and the
+        totals returned for it ('outputs', 'comments_added', 'chars').
+        """
+        self.files[os.path.abspath(input_file)] = record
+        self.pending['files'][os.path.abspath(input_file)] = record
+
+    def take_pending(self) -> Dict:
+        """Return and clear the updates collected since the last call."""
+        pending, self.pending = self.pending, self._empty_pending()
+        return pending
+
+    def merge(self, pending: Dict) -> None:
+        """Apply updates collected by take_pending (possibly in another process)."""
+        self.files.update(pending['files'])
+        self.statements.update(pending['statements'])
+        for name, amount in pending['stats'].items():
+            self.stats[name] += amount
+
+    def save(self) -> None:
+        """Write manifest.json and drop statements and objects no file refers to anymore."""
+        self.merge(self.take_pending())
+        live = {key for record in self.files.values() for key in record['statements']}
+        self.statements = {key: entry for key, entry in self.statements.items() if key in live}
+
+        os.makedirs(self.directory, exist_ok=True)
+        _write_atomic(self.manifest_path, json.dumps(
+            {'version': MANIFEST_VERSION, 'files': self.files, 'statements': self.statements}))
+
+        _remove_dead_objects(self.objects_dir, '.sql', live)
+        _remove_dead_objects(self.files_dir, '.jsonl', {record.get('key') for record in self.files.values()})
+
+    def report(self, reset: bool = False) -> Dict:
+        """Print and return how much work was skipped; reset starts counting anew."""
+        stats = dict(self.stats)
+        if reset:
+            self.stats = dict.fromkeys(STAT_KEYS, 0)
+        statements = stats['statements']
+        stats['reused_ratio'] = round(stats['reused'] / statements, 3) if statements else 0.0
+        stats['reused_chars_ratio'] = round(stats['reused_chars'] / stats['chars'], 3) if stats['chars'] else 0.0
+        print(f"Incremental conversion: {stats['files_reused']} of {stats['files']} files reused unchanged; "
+              f"{stats['reused']} of {statements} statements reused "
+              f"({stats['reused_ratio']:.0%}, {stats['reused_chars_ratio']:.0%} of the SQL text); "
+              f"{stats['rewritten']} rewritten ({stats['new_sql']} new or changed SQL, "
+              f"{stats['mapping_changed']} for mapping or setting changes)")
+        return stats
+
+
+class IncrementalStage:
+    """
+    Pipeline stage that applies `stages` (rewrite, annotate) to one statement
+    at a time, reusing the manifest's output when the cache key matches.
+    """
+
+    def __init__(self, manifest: ConversionManifest, stages: Sequence[Callable[[Iterable[str]], Iterator[str]]],
+                 references: Optional[MappingReferences] = None, fingerprint: str = ''):
+        """
+        Parameters:
+        manifest (ConversionManifest): Where outputs are looked up and stored
+        stages (list): Stages applied to each statement that has to be converted
+        references (MappingReferences): Mapping entries per statement; None if there is no rewrite
+        fingerprint (str): Everything else the output depends on, e.g. the field lookup digest
+        """
+        self.manifest = manifest
+        self.stages = list(stages)
+        self.references = references
+        self.fingerprint = text_sha256(f"{references.fingerprint if references else ''}\0{fingerprint}")
+        self.keys: List[str] = []
+        self.chars = 0
+
+    def file_key(self, sha256: str, layout: str = '') -> str:
+        """
+        Key of a whole input file: its content hash, this stage's fingerprint
+        and the complete mapping, since reusing a file skips the per-statement
+        references. `layout` names anything after this stage that shapes the
+        final statements, e.g. the batch or streaming split.
+        """
+        return text_sha256(json.dumps([self.fingerprint, self.references.digest if self.references else '',
+                                       layout, sha256]))
+
+    def _convert(self, statement: str) -> str:
+        texts: Iterable[str] = iter([statement])
+        for stage in self.stages:
+            texts = stage(texts)
+        return ''.join(texts)
+
+    def _counters(self) -> List[Tuple[object, str]]:
+        return [(stage, name) for stage in self.stages
+                for name in ('comments_added', 'fields_processed') if hasattr(stage, name)]
+
+    def __call__(self, statements: Iterable[str]) -> Iterator[str]:
+        for statement in statements:
+            statement_hash = text_sha256(statement)
+            fields, tables = self.references(statement) if self.references else ({}, {})
+            key = text_sha256(json.dumps([self.fingerprint, statement_hash,
+                                          sorted(fields.items()), sorted(tables.items())]))
+            self.keys.append(key)
+            self.manifest.count('statements')
+            self.manifest.count('chars', len(statement))
+            self.chars += len(statement)
+
+            output = self.manifest.lookup(key)
+            if output is not None:
+                # Keep the counters of the skipped stages right
+                for stage, name in self._counters():
+                    setattr(stage, name, getattr(stage, name) + self.manifest.statements[key].get(name, 0))
+                self.manifest.count('reused')
+                self.manifest.count('reused_chars', len(statement))
+                yield output
+                continue
+
+            before = {(id(stage), name): getattr(stage, name) for stage, name in self._counters()}
+            output = self._convert(statement)
+            entry = {'statement': statement_hash, 'fields': sorted(fields), 'tables': sorted(tables)}
+            for stage, name in self._counters():
+                entry[name] = getattr(stage, name) - before[(id(stage), name)]
+            self.manifest.store(key, entry, output)
+
+            self.manifest.count('rewritten')
+            self.manifest.count('mapping_changed' if statement_hash in self.manifest.known_statements else 'new_sql')
+            yield output
+
+
+class FileOutputWriter:
+    """
+    Pipeline writer that stores the final statements of an input file under
+    its file key. The object only replaces a previous one on commit(), so an
+    interrupted conversion never leaves a partial file to be reused.
+    """
+
+    def __init__(self, manifest: ConversionManifest, file_key: str):
+        self.path = manifest._file_path(file_key)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        self.out = os.fdopen(fd, 'w', encoding='utf-8')
+
+    def write(self, statement: str) -> None:
+        self.out.write(json.dumps(statement) + '\n')
+
+    def commit(self) -> None:
+        self.out.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        self.out.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
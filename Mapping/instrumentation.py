@@ -0,0 +1,263 @@
+"""
+Run log, counters and stage timers for the Mapping scripts and the conversion notebooks.
+
+The notebooks used to print every message and append it to an unbounded
+global `log_messages` list, and the Mapping scripts printed whenever
+`verbose_output` was set. A RunLog replaces both:
+
+- leveled messages, formatted only when they are printed or exported
+  (`run_log.info("Read %s", path)` costs nothing below the console level)
+- a bounded ring buffer of the latest messages for the run log file
+- thread-safe counters and per-stage timers (excel load, lookup build,
+  rewrite, annotate, notebook write, model call, task)
+- export of messages, counters and timers as JSON lines
+
+A RunLog can stand in for the `log_messages` list: append/extend store a
+preformatted message and iterating yields the formatted messages, so
+`"\n".join(log_messages)` keeps working.
+
+Usage:
+    from instrumentation import run_log, REWRITE
+
+    run_log.info("Processing %s", sql_file)
+    with run_log.timer(REWRITE):
+        sql = rewrite(sql)
+    run_log.count('statements', num_statements)
+    run_log.print_summary()
+    run_log.export_jsonl('run_log.jsonl')
+"""
+
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, TextIO, Union
+
+# Levels (same values as the logging module)
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+# Standard stage names for RunLog.timer
+EXCEL_LOAD = 'excel_load'
+LOOKUP_BUILD = 'lookup_build'
+REWRITE = 'rewrite'
+ANNOTATE = 'annotate'
+NOTEBOOK_WRITE = 'notebook_write'
+SQL_WRITE = 'sql_write'
+MODEL_CALL = 'model_call'
+TASK = 'task'
+
+# Messages kept for the run log; older ones are dropped
+DEFAULT_CAPACITY = 10000
+
+
+class LogRecord(NamedTuple):
+    time: float
+    level: int
+    message: str
+    args: tuple = ()
+    action: Optional[str] = None
+
+    def text(self) -> str:
+        """The message with its arguments filled in."""
+        return self.message % self.args if self.args else self.message
+
+    def format(self) -> str:
+        """The message as written to the run log (`**action**:` heading, as log_to_blob did)."""
+        if self.action is None:
+            return self.text()
+        return f"**{self.action}**:\n{self.text()}\n"
+
+
+class RunLog:
+    """
+    Leveled messages, counters and stage timers of one run.
+
+    Parameters:
+    capacity (int): Number of messages kept in the ring buffer
+    console_level (int): Messages at or above this level are printed
+    record_level (int): Messages at or above this level are kept in the buffer
+    stream (TextIO): Where messages are printed (default: sys.stdout at print time)
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, console_level: int = INFO,
+                 record_level: int = INFO, stream: Optional[TextIO] = None):
+        self.records: deque = deque(maxlen=capacity)
+        self.console_level = console_level
+        self.record_level = record_level
+        self.stream = stream
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timers: Dict[str, list] = {}  # stage -> [calls, seconds]
+
+    # Messages
+
+    def log(self, level: int, message: str, *args, action: Optional[str] = None) -> None:
+        """Record and/or print a message; `message % args` is only built when needed."""
+        if level < self.console_level and level < self.record_level:
+            return
+        record = LogRecord(time.time(), level, message, args, action)
+        if level >= self.record_level:
+            if len(self.records) == self.records.maxlen:
+                self.dropped += 1
+            self.records.append(record)
+        if level >= self.console_level:
+            print(record.text(), file=self.stream or sys.stdout)
+
+    def debug(self, message: str, *args, action: Optional[str] = None) -> None:
+        self.log(DEBUG, message, *args, action=action)
+
+    def info(self, message: str, *args, action: Optional[str] = None) -> None:
+        self.log(INFO, message, *args, action=action)
+
+    def warning(self, message: str, *args, action: Optional[str] = None) -> None:
+        self.log(WARNING, message, *args, action=action)
+
+    def error(self, message: str, *args, action: Optional[str] = None) -> None:
+        self.log(ERROR, message, *args, action=action)
+
+    def is_enabled(self, level: int) -> bool:
+        """True if a message at `level` would be printed or recorded."""
+        return level >= self.console_level or level >= self.record_level
+
+    # List interface for notebooks that collect `log_messages`
+
+    def append(self, text: str) -> None:
+        """Store an already formatted message (not printed)."""
+        if len(self.records) == self.records.maxlen:
+            self.dropped += 1
+        self.records.append(LogRecord(time.time(), INFO, text))
+
+    def extend(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            self.append(text)
+
+    def __iter__(self) -> Iterator[str]:
+        for record in list(self.records):
+            yield record.format()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    # Counters and timers
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def add_time(self, stage: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            timer = self._timers.setdefault(stage, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Add the duration of the block to `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str):
+        """Decorator: add the duration of every call to `stage`."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def stage_durations(self) -> Dict[str, Dict]:
+        """Stage -> {'calls': n, 'seconds': total}."""
+        with self._lock:
+            return {stage: {'calls': calls, 'seconds': seconds} for stage, (calls, seconds) in self._timers.items()}
+
+    def take_metrics(self) -> Dict:
+        """Return the counters and timers and start counting anew (e.g. in a pool worker)."""
+        with self._lock:
+            metrics = {'counters': self._counters, 'timers': self._timers}
+            self._counters, self._timers = {}, {}
+        return metrics
+
+    def merge_metrics(self, metrics: Dict) -> None:
+        """Add counters and timers returned by take_metrics (possibly in another process)."""
+        for name, amount in metrics['counters'].items():
+            self.count(name, amount)
+        for stage, (calls, seconds) in metrics['timers'].items():
+            self.add_time(stage, seconds, calls)
+
+    def reset(self) -> 'RunLog':
+        """Clear messages, counters and timers; returns the run log (`log_messages = run_log.reset()`)."""
+        self.records.clear()
+        self.dropped = 0
+        self.take_metrics()
+        return self
+
+    # Output
+
+    def print_summary(self) -> None:
+        """Print the stage durations and counters."""
+        durations = self.stage_durations()
+        if durations:
+            print("Stage durations:")
+            for stage, timer in sorted(durations.items(), key=lambda item: -item[1]['seconds']):
+                print(f"  {stage:<16} {timer['seconds']:>9.3f}s  ({timer['calls']} calls)")
+        counters = self.counters
+        if counters:
+            print("Counters: " + ", ".join(f"{name}={value}" for name, value in sorted(counters.items())))
+        if self.dropped:
+            print(f"Run log: {self.dropped} older messages dropped (capacity {self.records.maxlen})")
+
+    def iter_jsonl(self) -> Iterator[str]:
+        """JSON lines: one per buffered message, counter and stage timer."""
+        for record in list(self.records):
+            yield json.dumps({
+                'type': 'log',
+                'time': record.time,
+                'level': logging.getLevelName(record.level),
+                'action': record.action,
+                'message': record.text()
+            }, ensure_ascii=False)
+        for name, value in sorted(self.counters.items()):
+            yield json.dumps({'type': 'counter', 'name': name, 'value': value})
+        for stage, timer in sorted(self.stage_durations().items()):
+            yield json.dumps({'type': 'timer', 'name': stage, 'calls': timer['calls'], 'seconds': timer['seconds']})
+
+    def to_jsonl(self) -> str:
+        """The run log as JSON lines text, e.g. for dbutils.fs.put."""
+        return ''.join(line + '\n' for line in self.iter_jsonl())
+
+    def export_jsonl(self, target: Union[str, TextIO]) -> int:
+        """
+        Write the run log as JSON lines to a file path or open file.
+
+        Returns:
+        int: Number of lines written
+        """
+        if isinstance(target, str):
+            with open(target, 'w', encoding='utf-8') as f:
+                return self.export_jsonl(f)
+        lines = 0
+        for line in self.iter_jsonl():
+            target.write(line + '\n')
+            lines += 1
+        return lines
+
+
+# Run log shared by the Mapping modules of this process
+run_log = RunLog()
@@ -0,0 +1,375 @@
+"""
+Task scheduler with dependencies and a checkpoint journal for the conversion notebooks.
+
+CodeConvertFromXMLtoSQL_v2 gave every group of files to one thread of a
+ThreadPoolExecutor and processed the files of a group one after another, so
+the group without a group_id (usually most of the files) kept the run waiting
+while the other threads were idle. Progress was only visible in the archive
+(files are moved there once converted), so an exception or a restarted
+cluster meant starting over.
+
+JobScheduler runs tasks instead of groups:
+
+- a task is one unit of work (convert a file, read a file of a group, convert
+  a group) and may depend on other tasks; it starts as soon as its
+  dependencies are done, so only a group's combined conversion waits for the
+  files of that group
+- idle workers take the next ready task from one shared queue, highest
+  priority first (e.g. the biggest files), so no worker sits idle while
+  tasks are waiting
+- a failed task only skips the tasks that depend on it
+
+CheckpointJournal is an append-only JSON lines file on local disk. A task's
+result is appended when it is done, and a task can record the results of its
+own steps (e.g. the initial model conversion) on the way. A restarted run
+with the same journal returns the recorded results of finished tasks without
+running them again and resumes unfinished tasks after their last recorded
+step. Results and step values must be JSON serializable.
+
+Usage:
+    journal = CheckpointJournal('/local_disk0/tmp/checkpoints/DF34.jsonl')
+    scheduler = JobScheduler(max_workers=8, journal=journal)
+    scheduler.add('read:a.xml', read_file, 'a.xml', checkpoint=False)
+    scheduler.add('group:7', convert_group, deps=['read:a.xml', 'read:b.xml'], fingerprint='...')
+    results = scheduler.run()
+
+    def convert_file(task, file):
+        output = task.step('initial', call_model, model, prompt)
+        ...
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from instrumentation import TASK, run_log
+
+# Task statuses
+DONE = 'done'
+RESUMED = 'resumed'  # result read back from the journal
+FAILED = 'failed'
+SKIPPED = 'skipped'  # a dependency failed
+
+
+class TaskResult(NamedTuple):
+    key: str
+    status: str
+    result: Any = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of finished tasks and task steps.
+
+    Every record is one JSON line, written and fsynced while holding a lock,
+    so a crash loses at most the record being written; a torn last line is
+    ignored when the journal is read back. Records only count for a task
+    whose fingerprint matches, so a changed input file is processed again.
+
+    Parameters:
+    path (str): Journal file (on local disk); created with its directory if missing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict] = {}  # key -> task record
+        self._steps: Dict[tuple, Dict] = {}  # (key, step) -> step record
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for number, line in enumerate(lines, start=1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                run_log.warning("⚠️  Ignoring unreadable line %d of checkpoint journal %s", number, self.path)
+                continue
+            self._apply(record)
+
+    def _apply(self, record: Dict) -> None:
+        if record.get('step') is None:
+            if record.get('status') == DONE:
+                self._tasks[record['key']] = record
+            else:
+                self._tasks.pop(record['key'], None)
+        else:
+            self._steps[(record['key'], record['step'])] = record
+
+    def _append(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def done(self, key: str, fingerprint: str = '') -> Optional[Dict]:
+        """The record of a finished task with this fingerprint, or None."""
+        record = self._tasks.get(key)
+        return record if record is not None and record.get('fingerprint') == fingerprint else None
+
+    def record_done(self, key: str, result: Any, fingerprint: str = '', seconds: float = 0.0) -> None:
+        self._append({'key': key, 'step': None, 'status': DONE, 'fingerprint': fingerprint,
+                      'result': result, 'seconds': round(seconds, 3), 'time': time.time()})
+
+    def record_failed(self, key: str, error: str, fingerprint: str = '') -> None:
+        """Record a failure (for the report; a failed task runs again on the next run)."""
+        self._append({'key': key, 'step': None, 'status': FAILED, 'fingerprint': fingerprint,
+                      'error': error, 'time': time.time()})
+
+    def step(self, key: str, step: str, fingerprint: str = '') -> Optional[Dict]:
+        """The record of a finished step of a task with this fingerprint, or None."""
+        record = self._steps.get((key, step))
+        return record if record is not None and record.get('fingerprint') == fingerprint else None
+
+    def record_step(self, key: str, step: str, value: Any, fingerprint: str = '') -> None:
+        self._append({'key': key, 'step': step, 'status': DONE, 'fingerprint': fingerprint,
+                      'value': value, 'time': time.time()})
+
+    def finished(self) -> List[str]:
+        """Keys of the finished tasks."""
+        return list(self._tasks)
+
+    def compact(self) -> None:
+        """Rewrite the journal with only the latest record per task and step."""
+        with self._lock:
+            records = list(self._tasks.values()) + [record for (key, _), record in self._steps.items()
+                                                    if key not in self._tasks]
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        """Forget all checkpoints (the next run starts from scratch)."""
+        with self._lock:
+            self._tasks.clear()
+            self._steps.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class TaskContext:
+    """
+    What a task function gets as its first argument.
+
+    Attributes:
+    key (str): Key of the task
+    inputs (dict): Dependency key -> result of that dependency
+    """
+
+    def __init__(self, key: str, inputs: Dict[str, Any], journal: Optional[CheckpointJournal], fingerprint: str):
+        self.key = key
+        self.inputs = inputs
+        self._journal = journal
+        self._fingerprint = fingerprint
+
+    def step(self, name: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run func(*args, **kwargs) once per task and fingerprint.
+
+        The value is recorded in the journal; when the task runs again after a
+        restart, the recorded value is returned instead of calling func.
+        """
+        if self._journal is None:
+            return func(*args, **kwargs)
+        record = self._journal.step(self.key, name, self._fingerprint)
+        if record is not None:
+            run_log.count('steps_resumed')
+            return record['value']
+        value = func(*args, **kwargs)
+        self._journal.record_step(self.key, name, value, self._fingerprint)
+        return value
+
+
+class _Task(NamedTuple):
+    key: str
+    func: Callable
+    args: tuple
+    kwargs: Dict
+    deps: Sequence[str]
+    fingerprint: str
+    priority: float
+    checkpoint: bool
+    order: int
+
+
+class JobScheduler:
+    """
+    Runs tasks on a thread pool as soon as their dependencies are done.
+
+    Parameters:
+    max_workers (int): Number of worker threads
+    journal (CheckpointJournal): Checkpoints of finished tasks and steps; None for no checkpoints
+    log: RunLog for messages, the 'tasks_*' counters and the TASK stage timer
+    """
+
+    def __init__(self, max_workers: int = 8, journal: Optional[CheckpointJournal] = None, log=run_log):
+        self.max_workers = max_workers
+        self.journal = journal
+        self.log = log
+        self._tasks: Dict[str, _Task] = {}
+
+    def add(self, key: str, func: Callable, *args, deps: Sequence[str] = (), fingerprint: str = '',
+            priority: float = 0, checkpoint: bool = True, **kwargs) -> str:
+        """
+        Add a task that runs func(TaskContext, *args, **kwargs).
+
+        Parameters:
+        key (str): Unique name of the task (also its key in the journal)
+        deps (list): Keys of the tasks that have to be done first
+        fingerprint (str): Identity of the task's inputs (e.g. file size and modification time);
+            journal records with another fingerprint are ignored
+        priority (float): Ready tasks with a higher priority start first
+        checkpoint (bool): Record the result in the journal; False for cheap tasks
+            or results that are not JSON serializable (they run again after a restart)
+
+        Returns:
+        str: The key
+        """
+        if key in self._tasks:
+            raise ValueError(f"Duplicate task key: {key}")
+        self._tasks[key] = _Task(key, func, args, kwargs, tuple(deps), fingerprint, priority, checkpoint,
+                                 len(self._tasks))
+        return key
+
+    def _execute(self, task: _Task, inputs: Dict[str, Any]) -> TaskResult:
+        started = time.perf_counter()
+        try:
+            with self.log.timer(TASK):
+                result = task.func(TaskContext(task.key, inputs, self.journal if task.checkpoint else None,
+                                               task.fingerprint), *task.args, **task.kwargs)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if self.journal is not None and task.checkpoint:
+                self.journal.record_failed(task.key, error, task.fingerprint)
+            return TaskResult(task.key, FAILED, None, error, time.perf_counter() - started)
+        seconds = time.perf_counter() - started
+        if self.journal is not None and task.checkpoint:
+            self.journal.record_done(task.key, result, task.fingerprint, seconds)
+        return TaskResult(task.key, DONE, result, None, seconds)
+
+    def _topological_order(self, dependents: Dict[str, List[str]]) -> List[str]:
+        waiting = {key: len(task.deps) for key, task in self._tasks.items()}
+        order = [key for key, count in waiting.items() if count == 0]
+        for key in order:
+            for dependent in dependents[key]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    order.append(dependent)
+        if len(order) < len(self._tasks):
+            cycle = sorted(key for key, count in waiting.items() if count > 0)
+            raise ValueError(f"Tasks with circular dependencies: {', '.join(cycle)}")
+        return order
+
+    def run(self) -> Dict[str, TaskResult]:
+        """
+        Run all added tasks; returns key -> TaskResult in the order the tasks were added.
+
+        Tasks finished in an earlier run (per the journal) are not run again, and
+        neither are unfinished tasks only needed by those (e.g. reading the files
+        of a group whose conversion is done); both are reported as resumed.
+        """
+        dependents: Dict[str, List[str]] = {key: [] for key in self._tasks}
+        for task in self._tasks.values():
+            for dep in task.deps:
+                if dep not in self._tasks:
+                    raise ValueError(f"Task {task.key} depends on unknown task {dep}")
+                dependents[dep].append(task.key)
+        order = self._topological_order(dependents)
+
+        results: Dict[str, TaskResult] = {}
+        finished = {}
+        if self.journal is not None:
+            for key, task in self._tasks.items():
+                record = self.journal.done(key, task.fingerprint) if task.checkpoint else None
+                if record is not None:
+                    finished[key] = record
+        # A task runs if it is not finished and it has no dependents or one of them runs
+        runs: Dict[str, bool] = {}
+        for key in reversed(order):
+            runs[key] = key not in finished and (not dependents[key] or any(runs[d] for d in dependents[key]))
+        for key in order:
+            if not runs[key]:
+                results[key] = TaskResult(key, RESUMED, finished[key].get('result') if key in finished else None)
+                self.log.count(f"tasks_{RESUMED}")
+
+        waiting = {key: sum(1 for dep in task.deps if dep not in results) for key, task in self._tasks.items()}
+        ready: List[tuple] = []  # heap of (-priority, order, key)
+
+        def finish(result: TaskResult) -> None:
+            """Store a result and release or skip the tasks waiting for it."""
+            results[result.key] = result
+            self.log.count(f"tasks_{result.status}")
+            if result.status == FAILED:
+                self.log.error("Task %s failed: %s", result.key, result.error, action="Error")
+            pending = [result]
+            while pending:
+                current = pending.pop()
+                for key in dependents[current.key]:
+                    if key in results:
+                        continue
+                    if current.status in (FAILED, SKIPPED):
+                        skipped = TaskResult(key, SKIPPED, error=f"dependency {current.key} {current.status}")
+                        results[key] = skipped
+                        self.log.count(f"tasks_{SKIPPED}")
+                        pending.append(skipped)
+                        continue
+                    waiting[key] -= 1
+                    if waiting[key] == 0:
+                        task = self._tasks[key]
+                        heapq.heappush(ready, (-task.priority, task.order, key))
+
+        for key in order:
+            if key not in results and waiting[key] == 0:
+                task = self._tasks[key]
+                heapq.heappush(ready, (-task.priority, task.order, key))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job') as executor:
+            running = {}
+            while ready or running:
+                # Idle workers take the ready task with the highest priority
+                while ready and len(running) < self.max_workers:
+                    task = self._tasks[heapq.heappop(ready)[2]]
+                    inputs = {dep: results[dep].result for dep in task.deps}
+                    running[executor.submit(self._execute, task, inputs)] = task.key
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    finish(future.result())
+
+        return {key: results[key] for key in self._tasks}
+
+    @staticmethod
+    def summary(results: Dict[str, TaskResult]) -> Dict[str, int]:
+        """Number of tasks per status."""
+        counts = dict.fromkeys([DONE, RESUMED, FAILED, SKIPPED], 0)
+        for result in results.values():
+            counts[result.status] += 1
+        return counts
+
+    def print_summary(self, results: Dict[str, TaskResult]) -> None:
+        counts = self.summary(results)
+        print(f"Tasks: {counts[DONE]} done, {counts[RESUMED]} resumed from the checkpoint journal, "
+              f"{counts[FAILED]} failed, {counts[SKIPPED]} skipped")
+        for result in results.values():
+            if result.status in (FAILED, SKIPPED):
+                print(f"  {result.key}: {result.status} ({result.error})")
@@ -0,0 +1,215 @@
+"""
+Table lineage diagrams as DOT, Mermaid or JSON.
+
+The digraph cell of data_lineage_collect.ipynb collected the distinct
+(target table, source table) pairs three times, cut the schema off every
+name with substring(name, 7, 1000) (right only for six-character schemas
+like 'nntst.') and built the DOT text with `+=`, copying the whole text
+for every node and edge.
+
+table_diagram takes the table level edges of a LineageGraph once, for the
+whole lineage or for the tables around one calculation view:
+
+- root: the table to start from (case-insensitive)
+- direction: UPSTREAM (the tables the root reads), DOWNSTREAM (the tables
+  that read the root) or BOTH
+- depth: the number of table hops from the root; default no limit
+
+short_names turns names into labels without their catalog and schema
+(or HANA package path), and keeps the qualified name where two tables
+would get the same label.
+
+iter_dot, iter_mermaid and iter_json yield the output line by line, so it
+can be written to a file as it is produced or joined once; write_diagram
+writes one of them to an open file.
+
+Usage:
+    diagram = table_diagram(graph, root='CV_030_POLICY_DERIVATIONS', depth=3)
+    print(''.join(iter_dot(diagram)))
+
+    python lineage_diagram.py file.sql [--root name] [--depth n] [--format dot|mermaid|json]
+"""
+
+import json
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple
+
+from lineage_graph import LineageGraph
+
+UPSTREAM = 'upstream'
+DOWNSTREAM = 'downstream'
+BOTH = 'both'
+
+DOT = 'dot'
+MERMAID = 'mermaid'
+JSON = 'json'
+
+# Styles of the original digraph cell: tables read by nothing in the lineage are base tables
+NODE_STYLE = 'shape="ellipse" style="filled" fillcolor="#1f77b4"'
+BASE_NODE_STYLE = 'shape="polygon" style="filled" fillcolor="#ff7f0e"'
+EDGE_STYLE = 'fillcolor="#a6cee3" color="#1f78b4"'
+
+
+class TableDiagram(NamedTuple):
+    nodes: List[str]  # table names
+    edges: List[Tuple[str, str, int]]  # (target table, source table, number of column edges)
+    base: Set[str]  # tables no lineage row writes
+    labels: Dict[str, str]  # table name -> label
+
+
+def short_name(name: str) -> str:
+    """Table name without catalog, schema or HANA package path."""
+    name = name.replace('"', '').replace('`', '')
+    for separator in ('::', '/'):
+        if separator in name:
+            name = name.rsplit(separator, 1)[1]
+    return name.rsplit('.', 1)[-1]
+
+
+def short_names(names: Iterable[str]) -> Dict[str, str]:
+    """Name -> short_name(name), or the name itself where two names would get the same label."""
+    names = list(dict.fromkeys(names))
+    counts: Dict[str, int] = {}
+    for name in names:
+        counts[short_name(name).lower()] = counts.get(short_name(name).lower(), 0) + 1
+    return {name: short_name(name) if counts[short_name(name).lower()] == 1 else name for name in names}
+
+
+def table_diagram(graph: LineageGraph, root: Optional[str] = None, depth: Optional[int] = None,
+                  direction: str = UPSTREAM, shorten: bool = True) -> TableDiagram:
+    """
+    Tables and table edges of a lineage graph, all or around one table.
+
+    Parameters:
+    graph (LineageGraph): Column lineage
+    root (str): Table to start from; default the whole lineage. Matched on the full or short name
+    depth (int): Table hops from the root; default no limit
+    direction (str): UPSTREAM, DOWNSTREAM or BOTH
+    shorten (bool): Labels without catalog and schema (short_names)
+
+    Returns:
+    TableDiagram
+    """
+    # one name per table, whatever the spelling of each edge
+    names: Dict[str, str] = {}
+    edge_counts: Dict[Tuple[str, str], int] = {}
+    for (target, source), count in graph.table_edges().items():
+        target = names.setdefault(target.lower(), target)
+        source = names.setdefault(source.lower(), source)
+        edge_counts[target, source] = edge_counts.get((target, source), 0) + count
+    upstream: Dict[str, List[Tuple[str, str, int]]] = {}
+    downstream: Dict[str, List[Tuple[str, str, int]]] = {}
+    for (target, source), count in edge_counts.items():
+        upstream.setdefault(target.lower(), []).append((target, source, count))
+        downstream.setdefault(source.lower(), []).append((target, source, count))
+
+    if root is None:
+        nodes = list(names.values())
+        edges = [(target, source, count) for (target, source), count in edge_counts.items()]
+    else:
+        start = root.lower()
+        if start not in names:
+            matches = [key for key in names if short_name(key) == short_name(start)]
+            if len(matches) != 1:
+                raise KeyError(f"table {root!r} is {'ambiguous' if matches else 'not in the lineage'}")
+            start = matches[0]
+        seen = {start: 0}
+        edges = []
+        queue = deque([start])
+        while queue:
+            key = queue.popleft()
+            if depth is not None and seen[key] >= depth:
+                continue
+            steps = []
+            if direction in (UPSTREAM, BOTH):
+                steps += [(edge, edge[1]) for edge in upstream.get(key, ())]
+            if direction in (DOWNSTREAM, BOTH):
+                steps += [(edge, edge[0]) for edge in downstream.get(key, ())]
+            for edge, other in steps:
+                edges.append(edge)
+                if other.lower() not in seen:
+                    seen[other.lower()] = seen[key] + 1
+                    queue.append(other.lower())
+        edges = list(dict.fromkeys(edges))
+        nodes = [names[key] for key in seen]
+
+    base = {name for name in nodes if name.lower() not in upstream}
+    labels = short_names(nodes) if shorten else {name: name for name in nodes}
+    return TableDiagram(nodes, edges, base, labels)
+
+
+def _dot_quote(text: str) -> str:
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def iter_dot(diagram: TableDiagram) -> Iterator[str]:
+    """DOT lines; edges point from the target table to its source tables, as in the notebook."""
+    yield "strict digraph {\n"
+    for name in diagram.nodes:
+        style = BASE_NODE_STYLE if name in diagram.base else NODE_STYLE
+        yield f" {_dot_quote(diagram.labels[name])} [{style}]\n"
+    for target, source, _ in diagram.edges:
+        yield f" {_dot_quote(diagram.labels[target])} -> {_dot_quote(diagram.labels[source])} [{EDGE_STYLE}]\n"
+    yield "}\n"
+
+
+def iter_mermaid(diagram: TableDiagram) -> Iterator[str]:
+    """Mermaid flowchart lines; nodes get ids n0, n1, ... and the labels as text."""
+    ids = {name: f"n{number}" for number, name in enumerate(diagram.nodes)}
+    yield "flowchart LR\n"
+    for name in diagram.nodes:
+        label = diagram.labels[name].replace('"', '#quot;')
+        shape = f'[("{label}")]' if name in diagram.base else f'["{label}"]'
+        yield f"    {ids[name]}{shape}\n"
+    for target, source, _ in diagram.edges:
+        yield f"    {ids[target]} --> {ids[source]}\n"
+
+
+def iter_json(diagram: TableDiagram) -> Iterator[str]:
+    """A JSON document {"nodes": [...], "edges": [...]}, one node or edge per line."""
+    yield '{"nodes": [\n'
+    for number, name in enumerate(diagram.nodes):
+        node = {'name': name, 'label': diagram.labels[name], 'base': name in diagram.base}
+        yield ('  ' if number == 0 else ' ,') + json.dumps(node, ensure_ascii=False) + '\n'
+    yield '], "edges": [\n'
+    for number, (target, source, count) in enumerate(diagram.edges):
+        edge = {'target_table': target, 'source_table': source, 'columns': count}
+        yield ('  ' if number == 0 else ' ,') + json.dumps(edge, ensure_ascii=False) + '\n'
+    yield ']}\n'
+
+
+WRITERS = {DOT: iter_dot, MERMAID: iter_mermaid, JSON: iter_json}
+
+
+def write_diagram(diagram: TableDiagram, out: TextIO, output_format: str = DOT) -> None:
+    """Write a diagram as DOT, Mermaid or JSON to an open file."""
+    out.writelines(WRITERS[output_format](diagram))
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+
+    from sql_lineage import extract_lineage
+
+    parser = argparse.ArgumentParser(description="Table lineage diagram of SQL files")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--root', default=None)
+    parser.add_argument('--depth', type=int, default=None)
+    parser.add_argument('--direction', choices=(UPSTREAM, DOWNSTREAM, BOTH), default=UPSTREAM)
+    parser.add_argument('--format', choices=sorted(WRITERS), default=DOT)
+    parser.add_argument('--full-names', action='store_true', help="Do not shorten table names")
+    args = parser.parse_args()
+
+    catalog = {}
+    lineage_rows = []
+    for sql_file in args.files:
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            lineage_rows.extend(extract_lineage(f.read(), catalog=catalog))
+    started = time.perf_counter()
+    table_graph = table_diagram(LineageGraph(lineage_rows), args.root, args.depth, args.direction,
+                                not args.full_names)
+    write_diagram(table_graph, sys.stdout, args.format)
+    print(f"{len(table_graph.nodes)} tables, {len(table_graph.edges)} edges in "
+          f"{time.perf_counter() - started:.3f}s", file=sys.stderr)
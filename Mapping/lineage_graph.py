@@ -0,0 +1,376 @@
+"""
+Column lineage graph with memoized upstream and downstream traversal.
+
+The lineage walk of data_lineage_collect.ipynb took every distinct
+(target column, target table) pair of the `{data_flow}_lineage` table and
+followed it upstream with one self-join of `start_df` per level, renaming
+the columns at every level: a few Spark jobs per level per column, and no
+end if the lineage contains a cycle.
+
+A LineageGraph holds the lineage rows in memory with adjacency lists keyed
+by (table, column), upstream and downstream, case-insensitive:
+
+- base_columns / base_tables: the columns and tables a column comes from
+  in the end (tables no statement of the lineage writes)
+- final_columns: the columns a column ends up in (columns nothing reads)
+- upstream_paths / downstream_paths: every path of edges, with the
+  transformation of each step
+- table_edges: the table level graph, for diagrams (lineage_diagram.py)
+- path_records: one flat record per upstream path of every target column,
+  the rows the notebook built with self-joins
+
+Every traversal is a depth-first search whose results are memoized per
+node, so sub-paths shared by many columns are computed once and, after
+the first query (or closure()), lookups are dictionary reads. Columns
+that feed each other (a strongly connected component, found with Tarjan's
+algorithm) are a cycle: it is recorded in `cycles`, its columns share
+their base and final columns, and a path through it visits each of its
+columns at most once, whichever column was asked for first. A view column
+selected with `*` from a table whose columns are not known is followed
+through the table's '*' row.
+
+Usage:
+    graph = LineageGraph(spark.table(lineage_table).collect())
+    graph.base_tables('nntst.CV_030_POLICY_DERIVATIONS', 'ZSTDTPROJ')
+    display(pd.DataFrame(graph.path_records()))
+
+    python lineage_graph.py file.sql [--column table.column]
+"""
+
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+Node = Tuple[str, str]  # (table, column)
+
+# Paths kept per node; more paths are dropped and the node is listed in `truncated`
+DEFAULT_MAX_PATHS = 10000
+
+LINEAGE_COLUMNS = ('TARGET_TABLE_NAME', 'TARGET_COLUMN_NAME', 'SOURCE_TABLE_NAME', 'SOURCE_COLUMN_NAME', 'TRANSFORMATION')
+
+
+class LineageEdge(NamedTuple):
+    target_table: str
+    target_column: str
+    source_table: str
+    source_column: str
+    transformation: str = ''
+
+
+class LineageGraph:
+    """
+    Lineage rows as a graph of (table, column) nodes.
+
+    Parameters:
+    rows (iterable): (target table, target column, source table, source column, transformation)
+                     tuples, e.g. sql_lineage.LineageRow or Spark Rows of the lineage table;
+                     rows with an empty source table (columns computed from literals) add no edge
+    max_paths (int): Paths kept per node by upstream_paths / downstream_paths
+    """
+
+    def __init__(self, rows: Iterable[Sequence[str]] = (), max_paths: int = DEFAULT_MAX_PATHS):
+        self.max_paths = max_paths
+        self.cycles: List[List[Node]] = []
+        self.truncated: Set[Node] = set()
+        self._upstream: Dict[Node, List[LineageEdge]] = {}
+        self._downstream: Dict[Node, List[LineageEdge]] = {}
+        self._names: Dict[Node, Node] = {}  # key -> (table, column) as first written
+        self._tables: Dict[str, str] = {}  # lower-case table -> table as first written
+        self._positions: Dict[Node, int] = {}  # key -> order in which it was added
+        self._star_names: Dict[Node, Node] = {}  # names of columns only reached through a '*' row
+        self._targets: Set[Node] = set()
+        self._memo: Dict[Tuple[str, bool], Dict[Node, object]] = {}
+        self._cycle_keys: Set[FrozenSet[Node]] = set()
+        for row in rows:
+            self.add(*(value or '' for value in tuple(row)[:5]))
+
+    # Building
+
+    def _key(self, table: str, column: str) -> Node:
+        key = (table.lower(), column.lower())
+        if key not in self._names:
+            # one spelling per table (the first one seen), so `:it_x` and `IT_X` are one table everywhere
+            self._names[key] = (self._tables.setdefault(key[0], table), column)
+            self._positions[key] = len(self._positions)
+        return key
+
+    def add(self, target_table: str, target_column: str, source_table: str = '', source_column: str = '',
+            transformation: str = '') -> None:
+        """Add one lineage row."""
+        target = self._key(target_table, target_column)
+        self._targets.add(target)
+        self._memo.clear()
+        if not source_table:
+            return
+        source = self._key(source_table, source_column)
+        edge = LineageEdge(*self._names[target], *self._names[source], transformation)
+        self._upstream.setdefault(target, []).append(edge)
+        self._downstream.setdefault(source, []).append(edge)
+
+    def __len__(self) -> int:
+        return sum(len(edges) for edges in self._upstream.values())
+
+    def nodes(self) -> List[Node]:
+        return list(self._names.values())
+
+    def target_columns(self) -> List[Node]:
+        """Columns written by the lineage, in the order they were added."""
+        return [self._names[key] for key in self._names if key in self._targets]
+
+    def table_edges(self) -> Dict[Tuple[str, str], int]:
+        """(target table, source table) -> number of column edges between them."""
+        counts: Dict[Tuple[str, str], int] = {}
+        names: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        for edges in self._upstream.values():
+            for edge in edges:
+                key = (edge.target_table.lower(), edge.source_table.lower())
+                names.setdefault(key, (edge.target_table, edge.source_table))
+                counts[key] = counts.get(key, 0) + 1
+        return {names[key]: count for key, count in counts.items()}
+
+    def _name(self, key: Node) -> Node:
+        """(table, column) as first written, also for columns only reached through a '*' row."""
+        return self._names.get(key) or self._star_names.get(key, key)
+
+    # Direct edges
+
+    def _edges(self, key: Node, upstream: bool) -> List[LineageEdge]:
+        edges = (self._upstream if upstream else self._downstream).get(key)
+        if edges is None and key[1] != '*':
+            # columns that pass through `SELECT *` of a table with unknown columns
+            star = (self._upstream if upstream else self._downstream).get((key[0], '*'))
+            if star:
+                column = self._name(key)[1]
+                edges = [edge._replace(target_column=column, source_column=column) for edge in star]
+                for edge in edges:
+                    other = edge.source_table if upstream else edge.target_table
+                    self._star_names.setdefault((other.lower(), key[1]), (other, column))
+        return edges or []
+
+    def sources(self, table: str, column: str) -> List[LineageEdge]:
+        """Rows that write the column."""
+        return self._edges((table.lower(), column.lower()), True)
+
+    def targets(self, table: str, column: str) -> List[LineageEdge]:
+        """Rows that read the column."""
+        return self._edges((table.lower(), column.lower()), False)
+
+    # Traversal
+
+    def _record_cycle(self, component: List[Node]) -> None:
+        if frozenset(component) not in self._cycle_keys:
+            self._cycle_keys.add(frozenset(component))
+            self.cycles.append([self._name(node) for node in component + component[:1]])
+
+    def _solve(self, start: Node, upstream: bool, name: str, leaf: Callable[[Node], object],
+               combine: Callable[[Node, List[Tuple[LineageEdge, object]]], object],
+               combine_cycle: Callable[[List[Node], Dict[Node, List[LineageEdge]], Callable[[LineageEdge], Node],
+                                        Dict[Node, object]], Dict[Node, object]]):
+        """
+        Result of `start`, memoized per node, computed on the graph of strongly connected components.
+
+        Tarjan's algorithm (iterative) finds the components reachable from `start` sinks first,
+        so the results of every edge leaving a component are known when it is finished:
+        leaf(node) gives the result of a node without edges, combine(node, [(edge, result of
+        the node at the other end)]) the result of the others, and combine_cycle(members, edges,
+        child, memo) the results of the members of a cycle. A node's result therefore does not
+        depend on where the search started.
+        """
+        memo = self._memo.setdefault((name, upstream), {})
+        if start in memo:
+            return memo[start]
+        end = slice(2, 4) if upstream else slice(0, 2)
+
+        def child(edge: LineageEdge) -> Node:
+            return tuple(part.lower() for part in edge[end])
+
+        index: Dict[Node, int] = {}
+        low: Dict[Node, int] = {}
+        edges_of: Dict[Node, List[LineageEdge]] = {}
+        component_stack: List[Node] = []
+        on_stack: Set[Node] = set()
+        frames = []
+
+        def visit(key: Node) -> None:
+            index[key] = low[key] = len(index)
+            component_stack.append(key)
+            on_stack.add(key)
+            edges_of[key] = self._edges(key, upstream)
+            frames.append((key, iter(edges_of[key])))
+
+        visit(start)
+        while frames:
+            key, pending = frames[-1]
+            for edge in pending:
+                other = child(edge)
+                if other in memo:
+                    continue
+                if other not in index:
+                    visit(other)
+                    break
+                if other in on_stack:
+                    low[key] = min(low[key], index[other])
+            else:
+                frames.pop()
+                if frames:
+                    parent = frames[-1][0]
+                    low[parent] = min(low[parent], low[key])
+                if low[key] != index[key]:
+                    continue
+                members = []
+                while True:
+                    member = component_stack.pop()
+                    on_stack.discard(member)
+                    members.append(member)
+                    if member == key:
+                        break
+                edges = edges_of[key]
+                if len(members) == 1 and all(child(edge) != key for edge in edges):
+                    memo[key] = combine(key, [(edge, memo[child(edge)]) for edge in edges]) if edges else leaf(key)
+                else:
+                    members.sort(key=lambda member: self._positions.get(member, len(self._positions)))
+                    self._record_cycle(members)
+                    memo.update(combine_cycle(members, edges_of, child, memo))
+        return memo[start]
+
+    def _leaves(self, table: str, column: str, upstream: bool) -> FrozenSet[Node]:
+        def leaf(key):
+            # a written column without edges is computed from literals only
+            if upstream and key in self._targets:
+                return frozenset()
+            return frozenset([self._name(key)])
+
+        def combine(key, results):
+            return frozenset().union(*(result for _, result in results))
+
+        def combine_cycle(members, edges_of, child, memo):
+            # the columns of a cycle all come from (or end up in) everything the cycle reaches
+            inside = set(members)
+            result = combine(None, [(edge, memo[child(edge)]) for member in members
+                                    for edge in edges_of[member] if child(edge) not in inside])
+            return {member: result for member in members}
+
+        return self._solve((table.lower(), column.lower()), upstream, 'leaves', leaf, combine, combine_cycle)
+
+    def base_columns(self, table: str, column: str) -> FrozenSet[Node]:
+        """(table, column) of the base tables the column comes from."""
+        return self._leaves(table, column, True)
+
+    def base_tables(self, table: str, column: str) -> Set[str]:
+        return {base_table for base_table, _ in self.base_columns(table, column)}
+
+    def final_columns(self, table: str, column: str) -> FrozenSet[Node]:
+        """(table, column) of the columns the column ends up in that nothing reads."""
+        return self._leaves(table, column, False)
+
+    def _paths(self, table: str, column: str, upstream: bool) -> Tuple[Tuple[LineageEdge, ...], ...]:
+        def leaf(key):
+            return ((),)
+
+        def extend(key, paths, edge, sub_paths):
+            for path in sub_paths:
+                if len(paths) == self.max_paths:
+                    self.truncated.add(self._name(key))
+                    return False
+                paths.append((edge,) + path)
+            return True
+
+        def combine(key, results):
+            paths = []
+            for edge, sub_paths in results:
+                if not extend(key, paths, edge, sub_paths):
+                    break
+            return tuple(paths)
+
+        def combine_cycle(members, edges_of, child, memo):
+            # paths through a cycle visit each of its columns at most once
+            inside = set(members)
+
+            def walk(key, on_path):
+                paths = []
+                for edge in edges_of[key]:
+                    other = child(edge)
+                    if other in on_path:
+                        continue
+                    sub_paths = walk(other, on_path | {other}) if other in inside else memo[other]
+                    if not extend(key, paths, edge, sub_paths):
+                        break
+                return tuple(paths)
+
+            return {member: walk(member, frozenset([member])) for member in members}
+
+        return self._solve((table.lower(), column.lower()), upstream, 'paths', leaf, combine, combine_cycle)
+
+    def upstream_paths(self, table: str, column: str) -> Tuple[Tuple[LineageEdge, ...], ...]:
+        """Paths of edges from the column to its base columns; ((),) for a base column."""
+        return self._paths(table, column, True)
+
+    def downstream_paths(self, table: str, column: str) -> Tuple[Tuple[LineageEdge, ...], ...]:
+        """Paths of edges from the column to its final columns; ((),) for a final column."""
+        return self._paths(table, column, False)
+
+    def closure(self) -> Dict[Node, FrozenSet[Node]]:
+        """Base columns of every column, computed in one traversal of the graph."""
+        return {node: self.base_columns(*node) for node in self.nodes()}
+
+    # Records
+
+    def path_records(self, columns: Optional[Iterable[Node]] = None) -> Iterator[Dict[str, str]]:
+        """
+        One record per upstream path of each column: the first step under the lineage table
+        column names, step n under the same names with suffix n, and the number of steps as DEPTH.
+
+        Parameters:
+        columns (iterable): (table, column) pairs; default every target column
+        """
+        for table, column in columns if columns is not None else self.target_columns():
+            for path in self.upstream_paths(table, column):
+                if not path:
+                    continue
+                record = {'DEPTH': len(path)}
+                for level, edge in enumerate(path, 1):
+                    suffix = '' if level == 1 else str(level)
+                    for name, value in zip(LINEAGE_COLUMNS, edge):
+                        record[name + suffix] = value
+                yield record
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from sql_lineage import extract_lineage
+
+    parser = argparse.ArgumentParser(description="Lineage graph of SQL files")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--column', default=None, help="table.column to print the base columns and paths of")
+    args = parser.parse_args()
+
+    lineage_rows = []
+    catalog = {}
+    for sql_file in args.files:
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            lineage_rows.extend(extract_lineage(f.read(), catalog=catalog))
+
+    started = time.perf_counter()
+    graph = LineageGraph(lineage_rows)
+    built = time.perf_counter()
+    closure = graph.closure()
+    closed = time.perf_counter()
+    records = sum(1 for _ in graph.path_records())
+    walked = time.perf_counter()
+    print(f"{len(graph)} edges, {len(graph.nodes())} columns: graph {built - started:.3f}s, "
+          f"closure {closed - built:.3f}s, {records} path records {walked - closed:.3f}s")
+    print(f"{len(graph.cycles)} cycles, {len(graph.truncated)} columns with more than {graph.max_paths} paths")
+
+    probes = graph.target_columns()
+    started = time.perf_counter()
+    for probe in probes:
+        graph.base_tables(*probe)
+    if probes:
+        print(f"base_tables: {(time.perf_counter() - started) / len(probes) * 1e6:.1f}us per column")
+
+    if args.column:
+        probe_table, _, probe_column = args.column.rpartition('.')
+        for base in sorted(graph.base_columns(probe_table, probe_column)):
+            print('base:', '.'.join(base))
+        for path in graph.upstream_paths(probe_table, probe_column)[:20]:
+            print(' <- '.join([args.column] + [f"{edge.source_table}.{edge.source_column}" for edge in path]))
@@ -0,0 +1,216 @@
+"""
+Persistent cache for mapping structures compiled from the Excel workbook.
+
+Reading `table.xlsx` through pandas/openpyxl and turning it into lookups takes
+seconds on every run. The cache stores whatever a builder function returns
+(nested field mapping, field/table lookups, compiled rewriter, ...) as a
+pickle, keyed by the SHA-256 of the workbook bytes and its sheet list, so a
+warm run never touches Excel or the intermediate JSON.
+
+Every caller in a process should use the same instance per cache
+directory (shared_cache), so hit/miss statistics and reports cover all of
+them.
+
+Usage:
+    cache = shared_cache('.mapping_cache')
+    compiled = cache.get_or_build('table.xlsx', build_function, namespace='mapping_script')
+    cache.report()
+    cache.invalidate('table.xlsx')
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import zipfile
+from typing import Any, Callable, Dict, List, Optional
+
+from instrumentation import DEBUG, INFO, run_log
+
+# Bump when the structure of cached objects changes
+CACHE_VERSION = 3
+
+_SHEET_NAME_RE = re.compile(rb'<(?:\w+:)?sheet\b[^>]*\bname="([^"]*)"')
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def workbook_sheet_names(path: str) -> List[str]:
+    """
+    Return the sheet names of an .xlsx workbook without loading it.
+
+    The names are read straight from `xl/workbook.xml` inside the zip
+    container. Non-xlsx files return an empty list.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            workbook_xml = archive.read('xl/workbook.xml')
+    except (zipfile.BadZipFile, KeyError):
+        return []
+    return [name.decode('utf-8') for name in _SHEET_NAME_RE.findall(workbook_xml)]
+
+
+class MappingCache:
+    """On-disk cache of compiled mapping structures, one pickle per workbook version."""
+
+    def __init__(self, cache_dir: str = '.mapping_cache', verbose: bool = True):
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidated': 0}
+
+    @staticmethod
+    def _path_tag(excel_file: str) -> str:
+        return hashlib.sha256(os.path.abspath(excel_file).encode('utf-8')).hexdigest()[:12]
+
+    def cache_key(self, excel_file: str, namespace: str = 'default') -> str:
+        """Build the cache key from workbook content, sheet list, namespace and cache version."""
+        digest = hashlib.sha256()
+        digest.update(file_sha256(excel_file).encode('ascii'))
+        digest.update('\0'.join(workbook_sheet_names(excel_file)).encode('utf-8'))
+        digest.update(f"{namespace}\0{CACHE_VERSION}".encode('utf-8'))
+        return digest.hexdigest()[:32]
+
+    def _entry_path(self, excel_file: str, namespace: str, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{namespace}-{self._path_tag(excel_file)}-{key}.pkl")
+
+    def get(self, excel_file: str, namespace: str = 'default') -> Optional[Any]:
+        """Return the cached object for the current workbook version, or None."""
+        entry = self._entry_path(excel_file, namespace, self.cache_key(excel_file, namespace))
+        try:
+            with open(entry, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            value = None
+        except Exception as e:
+            run_log.warning("⚠️  Ignoring unreadable mapping cache entry %s: %s", entry, e)
+            value = None
+
+        if value is None:
+            self.stats['misses'] += 1
+            run_log.log(INFO if self.verbose else DEBUG, "✗ Mapping cache miss: %s (%s)", excel_file, namespace)
+        else:
+            self.stats['hits'] += 1
+            run_log.log(INFO if self.verbose else DEBUG, "✓ Mapping cache hit: %s (%s)", excel_file, namespace)
+        return value
+
+    def put(self, excel_file: str, value: Any, namespace: str = 'default') -> str:
+        """
+        Store `value` for the current workbook version.
+
+        Older entries for the same workbook and namespace are removed. The
+        write goes through a temporary file so readers never see a partial
+        pickle.
+
+        Returns:
+        str: Path of the cache entry
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self._entry_path(excel_file, namespace, self.cache_key(excel_file, namespace))
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{namespace}-{self._path_tag(excel_file)}-*.pkl")):
+            if stale != entry:
+                os.remove(stale)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.stats['stores'] += 1
+        return entry
+
+    def get_or_build(self, excel_file: str, builder: Callable[[], Any], namespace: str = 'default',
+                     refresh: bool = False) -> Any:
+        """
+        Return the cached object, building and storing it on a miss.
+
+        Parameters:
+        excel_file (str): Path to the mapping workbook
+        builder (callable): Builds the object from the workbook; falsy results are not cached
+        namespace (str): Separates different compiled structures for the same workbook
+        refresh (bool): Ignore any existing entry and rebuild
+
+        Returns:
+        The cached or freshly built object
+        """
+        if refresh:
+            self.invalidate(excel_file, namespace)
+        else:
+            value = self.get(excel_file, namespace)
+            if value is not None:
+                return value
+
+        value = builder()
+        if value:
+            try:
+                self.put(excel_file, value, namespace)
+            except Exception as e:
+                run_log.warning("⚠️  Could not write mapping cache: %s", e)
+        return value
+
+    def invalidate(self, excel_file: Optional[str] = None, namespace: Optional[str] = None) -> int:
+        """
+        Delete cache entries.
+
+        Parameters:
+        excel_file (str): Only entries for this workbook (default: all workbooks)
+        namespace (str): Only entries for this namespace (default: all namespaces)
+
+        Returns:
+        int: Number of entries removed
+        """
+        path_tag = self._path_tag(excel_file) if excel_file else '*'
+        pattern = os.path.join(self.cache_dir, f"{namespace or '*'}-{path_tag}-*.pkl")
+        removed = 0
+        for entry in glob.glob(pattern):
+            os.remove(entry)
+            removed += 1
+        self.stats['invalidated'] += removed
+        if removed:
+            run_log.log(INFO if self.verbose else DEBUG, "✓ Removed %d mapping cache entries", removed)
+        return removed
+
+    def hit_rate(self) -> float:
+        """Fraction of lookups served from the cache."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def report(self) -> Dict[str, Any]:
+        """Print and return hit/miss statistics."""
+        summary = dict(self.stats, hit_rate=round(self.hit_rate(), 3))
+        print(f"Mapping cache: {summary['hits']} hits, {summary['misses']} misses, "
+              f"{summary['stores']} stores, {summary['invalidated']} invalidated "
+              f"(hit rate {summary['hit_rate']:.0%})")
+        return summary
+
+
+_shared_caches: Dict[str, MappingCache] = {}
+
+
+def shared_cache(cache_dir: str = '.mapping_cache', verbose: Optional[bool] = None) -> MappingCache:
+    """
+    Return the process-wide MappingCache of a cache directory, creating it on first use.
+
+    Parameters:
+    cache_dir (str): Cache directory
+    verbose (bool): Log hits and misses at INFO level; None keeps the current setting
+    """
+    key = os.path.abspath(cache_dir)
+    cache = _shared_caches.get(key)
+    if cache is None:
+        cache = _shared_caches[key] = MappingCache(cache_dir, verbose=True if verbose is None else verbose)
+    elif verbose is not None:
+        cache.verbose = verbose
+    return cache
@@ -17,11 +17,18 @@
 # COMMAND ----------
 
 import json
-import pandas as pd
 import os
-import re
 import shutil
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Tuple, Optional
+
+from excel_ingest import extract_sql_mappings, read_field_mapping
+from fuzzy_index import create_fuzzy_candidates, create_fuzzy_mapping
+from incremental import ConversionManifest, MappingReferences
+from instrumentation import INFO, WARNING, run_log
+from mapping_cache import shared_cache
+from sql_conversion import build_notebook, compile_mappings, make_sql_rewriter, read_chunks, stream_notebook
+from sql_pipeline import convert_sql_file
+from sql_rewriter import SqlRewriter
 
 print("All required libraries imported successfully!")
 
@@ -38,17 +45,30 @@ CONFIG = {
     'notebook_output_file': 'converted_databricks_notebook_complete.py',
     'field_mapping_json': 'field_mapping_from_excel.json',
     'fuzzy_mapping_json': 'fuzzy_mapping.json',
+    'fuzzy_candidates_json': 'fuzzy_candidates.json',
+    'mapping_cache_dir': '.mapping_cache',
+    'conversion_manifest_dir': '.conversion_manifest',
 
     # Processing parameters
     'fuzzy_similarity_threshold': 0.8,
     'max_fuzzy_examples': 5,
+    'token_aware_rewrite': True,  # Skip string literals, comments and qualified names when renaming
+    'stream_sql_files': False,  # Process SQL statement by statement (bounded memory for very large files)
+    'incremental_conversion': True,  # Only rewrite statements whose SQL or mapping entries changed
 
     # Output settings
     'save_json_files': True,
+    'write_processed_sql': True,  # Also write sql_output_file (spark.sql() calls); the notebook does not need it
     'verbose_output': True,
+    'run_log_jsonl': None,  # Path to write the run log, counters and stage timings as JSON lines
+    'use_mapping_cache': True,  # Reuse compiled mappings while the Excel file is unchanged
+    'refresh_mapping_cache': False,  # Set to True to force a rebuild from Excel
     'auto_replace_original': False  # Set to True to automatically replace original SQL file
 }
 
+# Messages below WARNING are only printed with verbose_output (see instrumentation.py)
+run_log.console_level = INFO if CONFIG['verbose_output'] else WARNING
+
 print("Configuration loaded successfully!")
 print(f"Excel file: {CONFIG['excel_file']}")
 print(f"SQL input file: {CONFIG['sql_input_file']}")
@@ -64,11 +84,10 @@ print(f"Fuzzy similarity threshold: {CONFIG['fuzzy_similarity_threshold']}")
 def validate_file_exists(filepath: str, description: str = "File") -> bool:
     """Validate that a file exists and provide user feedback."""
     if os.path.exists(filepath):
-        if CONFIG['verbose_output']:
-            print(f"✓ {description} found: {filepath}")
+        run_log.info("✓ %s found: %s", description, filepath)
         return True
     else:
-        print(f"✗ {description} not found: {filepath}")
+        run_log.warning("✗ %s not found: %s", description, filepath)
         return False
 
 def safe_file_operation(operation_func, *args, **kwargs):
@@ -106,258 +125,17 @@ def read_mapping_from_excel(excel_file: str) -> Dict:
         return {}
 
     try:
-        # Read all sheet names
-        xl = pd.ExcelFile(excel_file)
-        if CONFIG['verbose_output']:
-            print(f"Excel file contains sheets: {xl.sheet_names}")
-
-        # Find sheets with 'Field' in their name
-        field_sheets = [sheet for sheet in xl.sheet_names if 'Field' in sheet]
-        if CONFIG['verbose_output']:
-            print(f"Processing field sheets: {field_sheets}")
-
-        if not field_sheets:
-            print("⚠️  No sheets with 'Field' in name found.")
-            return {}
-
-        # Initialize data storage
-        data_storage = {
-            'used_by_values': {},
-            'base_sap_cv_values': {},
-            'sap_field_name_values': {},
-            'dbx_field_name_values': {},
-            'dbx_table_values': {},
-            'comments_values': {}
-        }
-
-        unique_used_by_sets = {}
-
-        # Process each field sheet
-        for sheet_name in field_sheets:
-            if CONFIG['verbose_output']:
-                print(f"\nProcessing sheet: {sheet_name}")
-
-            df = pd.read_excel(excel_file, sheet_name=sheet_name)
-            next_num = 1
-
-            # Find the appropriate 'Used_by' column
-            used_by_column = None
-            for col_name in ['ADSO GCM', 'Used_by', 'Used by']:
-                if col_name in df.columns:
-                    used_by_column = col_name
-                    break
-
-            if not used_by_column:
-                print(f"⚠️  No 'Used_by' column found in sheet '{sheet_name}'. Skipping.")
-                continue
-
-            # Process each row
-            for _, row in df.iterrows():
-                if pd.isna(row[used_by_column]):
-                    continue
-
-                used_by_value = str(row[used_by_column]).strip()
-                sheet_used_by_key = (sheet_name, used_by_value)
-
-                # Assign number if new
-                if sheet_used_by_key not in unique_used_by_sets:
-                    unique_used_by_sets[sheet_used_by_key] = next_num
-                    next_num += 1
-
-                num = unique_used_by_sets[sheet_used_by_key]
-                composite_key = f"{sheet_name}_{num}"
-
-                # Initialize lists if needed
-                for storage_key in data_storage:
-                    if composite_key not in data_storage[storage_key]:
-                        data_storage[storage_key][composite_key] = []
-
-                # Store data
-                _store_field_data(row, df, composite_key, data_storage, used_by_value)
-
-        # Create field mapping
-        view_keys = sorted(list(data_storage['used_by_values'].keys()))
-        return create_field_mapping(view_keys, **data_storage)
-
+        return read_field_mapping(excel_file, verbose=CONFIG['verbose_output'])
     except Exception as e:
-        print(f"Error reading Excel file: {str(e)}")
+        run_log.error("Error reading Excel file: %s", e)
         return {}
 
-def _store_field_data(row, df, composite_key: str, data_storage: Dict, used_by_value: str):
-    """Helper function to store field data from Excel row."""
-    # Store Used_by value
-    if used_by_value not in data_storage['used_by_values'][composite_key]:
-        data_storage['used_by_values'][composite_key].append(used_by_value)
-
-    # Store other field data
-    field_mappings = [
-        ('Base SAP CV - equivalent of DBX Table', 'base_sap_cv_values'),
-        ('SAP Field Name', 'sap_field_name_values'),
-        ('DBX Field name', 'dbx_field_name_values'),
-        ('DBX Table', 'dbx_table_values'),
-        ('Comments', 'comments_values')
-    ]
-
-    for col_name, storage_key in field_mappings:
-        if col_name in df.columns and not pd.isna(row[col_name]):
-            value = row[col_name]
-            if value not in data_storage[storage_key][composite_key]:
-                data_storage[storage_key][composite_key].append(value)
-
-def create_field_mapping(view_keys: List[str], used_by_values: Dict = None, 
-                        base_sap_cv_values: Dict = None, sap_field_name_values: Dict = None,
-                        dbx_field_name_values: Dict = None, dbx_table_values: Dict = None,
-                        comments_values: Dict = None) -> Dict:
-    """
-    Create a field mapping dictionary for calculation views.
-
-    Parameters:
-    view_keys (list): List of composite keys to include in the mapping
-    *_values (dict): Dictionaries mapping composite keys to lists of values
-
-    Returns:
-    dict: The field mapping dictionary
-    """
-    # Initialize empty dictionaries for None parameters
-    data_dicts = {
-        'used_by_values': used_by_values or {},
-        'base_sap_cv_values': base_sap_cv_values or {},
-        'sap_field_name_values': sap_field_name_values or {},
-        'dbx_field_name_values': dbx_field_name_values or {},
-        'dbx_table_values': dbx_table_values or {},
-        'comments_values': comments_values or {}
-    }
-
-    field_mapping = {}
-
-    for key in view_keys:
-        # Get maximum number of records for this view
-        max_records = max(
-            len(data_dict.get(key, [])) for data_dict in data_dicts.values()
-        )
-        max_records = max(max_records, 1)  # At least one record
-
-        # Create records
-        records = []
-        table_name = data_dicts['dbx_table_values'].get(key, [""])[0] if data_dicts['dbx_table_values'].get(key, []) else ""
-        base_sap_cv = data_dicts['base_sap_cv_values'].get(key, [""])[0] if data_dicts['base_sap_cv_values'].get(key, []) else ""
-
-        for i in range(max_records):
-            record = {
-                'Used_by': _get_value_at_index(data_dicts['used_by_values'], key, i),
-                'Base SAP CV - equivalent of DBX Table': _get_value_at_index(data_dicts['base_sap_cv_values'], key, i, base_sap_cv),
-                'SAP Field Name': _get_value_at_index(data_dicts['sap_field_name_values'], key, i),
-                'DBX Field name': _get_value_at_index(data_dicts['dbx_field_name_values'], key, i),
-                'DBX Table': _get_value_at_index(data_dicts['dbx_table_values'], key, i, table_name),
-                'Comments': _get_value_at_index(data_dicts['comments_values'], key, i)
-            }
-            records.append(record)
-
-        field_mapping[f'calculation_view_{key}'] = records
-
-    return field_mapping
-
-def _get_value_at_index(data_dict: Dict, key: str, index: int, default: str = "") -> str:
-    """Helper function to safely get value at index from data dictionary."""
-    values = data_dict.get(key, [])
-    return values[index] if index < len(values) else default
-
 print("Excel processing functions loaded successfully!")
 
 
 # COMMAND ----------
 
-def calculate_similarity(str1: str, str2: str) -> float:
-    """
-    Calculate similarity between two strings using multiple methods.
-    Returns a score between 0 and 1, where 1 is identical.
-    """
-    if not str1 or not str2:
-        return 0.0
-
-    # Convert to lowercase for comparison
-    s1 = str1.lower().strip()
-    s2 = str2.lower().strip()
-
-    # Exact match
-    if s1 == s2:
-        return 1.0
-
-    # Remove common suffixes/prefixes for better matching
-    suffixes_to_remove = ['_p', '_r', '_cd', '_dat', '_code']
-    s1_clean = s1
-    s2_clean = s2
-
-    for suffix in suffixes_to_remove:
-        s1_clean = s1_clean.replace(suffix, '')
-        s2_clean = s2_clean.replace(suffix, '')
-
-    if s1_clean == s2_clean:
-        return 0.9
-
-    # Check if one is contained in the other
-    if s1_clean in s2_clean or s2_clean in s1_clean:
-        return 0.8
-
-    # Character overlap ratio
-    set1 = set(s1_clean)
-    set2 = set(s2_clean)
-    intersection = len(set1.intersection(set2))
-    union = len(set1.union(set2))
-
-    if union == 0:
-        return 0.0
-
-    char_similarity = intersection / union
-
-    # Length similarity factor
-    len_diff = abs(len(s1_clean) - len(s2_clean))
-    max_len = max(len(s1_clean), len(s2_clean))
-    len_similarity = 1 - (len_diff / max_len) if max_len > 0 else 0
-
-    # Combined score
-    return (char_similarity * 0.7) + (len_similarity * 0.3)
-
-def create_fuzzy_mapping(field_mapping: Dict, similarity_threshold: float = 0.6) -> Dict:
-    """
-    Create a fuzzy mapping containing only records where SAP Field Name
-    and DBX Field name have similarity above the threshold.
-
-    Parameters:
-    field_mapping (dict): The complete field mapping
-    similarity_threshold (float): Minimum similarity score (0-1)
-
-    Returns:
-    dict: Fuzzy mapping containing only similar field name pairs
-    """
-    fuzzy_mapping = {}
-
-    for calc_view, records in field_mapping.items():
-        fuzzy_records = []
-
-        for record in records:
-            sap_field = record.get('SAP Field Name', '')
-            dbx_field = record.get('DBX Field name', '')
-
-            # Skip empty fields
-            if not sap_field or not dbx_field:
-                continue
-
-            # Calculate similarity
-            similarity = calculate_similarity(sap_field, dbx_field)
-
-            # Only include if similarity is above threshold but not exact match
-            if similarity >= similarity_threshold and similarity < 1.0:
-                fuzzy_record = record.copy()
-                fuzzy_record['Similarity_Score'] = round(similarity, 3)
-                fuzzy_record['Match_Type'] = 'Fuzzy'
-                fuzzy_records.append(fuzzy_record)
-
-        # Only add calculation view if it has fuzzy matches
-        if fuzzy_records:
-            fuzzy_mapping[calc_view] = fuzzy_records
-
-    return fuzzy_mapping
+# create_fuzzy_mapping and create_fuzzy_candidates are defined in fuzzy_index.py
 
 print("Fuzzy matching functions loaded successfully!")
 
@@ -378,38 +156,47 @@ def load_field_mappings(json_file: str) -> Tuple[Dict[str, str], Dict[str, str]]
         with open(json_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
 
-        field_mappings = {}
-        table_mappings = {}
+        field_mappings, table_mappings = extract_sql_mappings(data)
 
-        # Extract mappings from all calculation views
-        for calc_view, records in data.items():
-            for record in records:
-                sap_field = str(record.get('SAP Field Name', '')).strip()
-                dbx_field = str(record.get('DBX Field name', '')).strip()
-                sap_table = str(record.get('Base SAP CV - equivalent of DBX Table', '')).strip()
-                dbx_table = str(record.get('DBX Table', '')).strip()
-
-                if sap_field and dbx_field:
-                    field_mappings[sap_field.upper()] = dbx_field
-
-                if sap_table and dbx_table:
-                    table_mappings[sap_table] = dbx_table
-
-        if CONFIG['verbose_output']:
-            print(f"Loaded {len(field_mappings)} field mappings")
-            print(f"Loaded {len(table_mappings)} table mappings")
+        run_log.info("Loaded %d field mappings", len(field_mappings))
+        run_log.info("Loaded %d table mappings", len(table_mappings))
 
         return field_mappings, table_mappings
 
     except Exception as e:
-        print(f"Error loading field mappings: {str(e)}")
+        run_log.error("Error loading field mappings: %s", e)
         return {}, {}
 
+def incremental_options(field_mappings: Dict[str, str], table_mappings: Dict[str, str],
+                        rewriter: Optional[SqlRewriter] = None) -> Dict:
+    """
+    Manifest arguments for convert_sql_file, or {} when incremental conversion is off.
+    """
+    if not CONFIG['incremental_conversion']:
+        return {}
+    return {
+        'manifest': conversion_manifest,
+        'references': MappingReferences(field_mappings, table_mappings, rewriter,
+                                        token_aware=CONFIG['token_aware_rewrite'])
+    }
+
+def save_conversion_manifest() -> None:
+    """Save the conversion manifest and report how many statements were reused."""
+    if not CONFIG['incremental_conversion']:
+        return
+    conversion_manifest.save()
+    if CONFIG['verbose_output']:
+        conversion_manifest.report(reset=True)
+
 def process_sql_file(input_file: str, output_file: str, 
-                    field_mappings: Dict[str, str], table_mappings: Dict[str, str]) -> int:
+                    field_mappings: Dict[str, str], table_mappings: Dict[str, str],
+                    rewriter: Optional[SqlRewriter] = None) -> int:
     """
     Process SQL file to replace field names and table names.
 
+    Parameters:
+    rewriter (SqlRewriter): Precompiled rewriter for the mappings (e.g. from the mapping cache)
+
     Returns:
     int: Number of SQL statements processed
     """
@@ -417,46 +204,21 @@ def process_sql_file(input_file: str, output_file: str,
         return 0
 
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # Replace field names (case-insensitive)
-        for sap_field, dbx_field in field_mappings.items():
-            pattern = r'\b' + re.escape(sap_field) + r'\b'
-            content = re.sub(pattern, dbx_field, content, flags=re.IGNORECASE)
-
-        # Replace table names
-        for sap_table, dbx_table in table_mappings.items():
-            content = content.replace(sap_table, dbx_table)
-
-        # Split content into SQL statements
-        sql_statements = re.split(r';\s*\n\s*\n', content.strip())
-
-        # Format as Databricks notebook with spark.sql() wrapper
-        formatted_statements = []
-        for statement in sql_statements:
-            statement = statement.strip()
-            if statement:
-                if not statement.endswith(';'):
-                    statement += ';'
-                formatted_statement = f'spark.sql("""\n{statement}\n""")'
-                formatted_statements.append(formatted_statement)
-
-        # Join all statements
-        final_content = '\n\n'.join(formatted_statements)
-
-        # Write to output file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(final_content)
+        # Replace field and table names, split into statements and wrap each one in spark.sql()
+        rewrite = make_sql_rewriter(field_mappings, table_mappings, rewriter,
+                                    token_aware=CONFIG['token_aware_rewrite'])
+        num_statements, _ = convert_sql_file(input_file, processed_file=output_file, rewrite=rewrite,
+                                             streaming=CONFIG['stream_sql_files'],
+                                             **incremental_options(field_mappings, table_mappings, rewriter))
+        save_conversion_manifest()
 
-        if CONFIG['verbose_output']:
-            print(f"✓ Processed {len(formatted_statements)} SQL statements")
-            print(f"✓ Output saved to: {output_file}")
+        run_log.info("✓ Processed %d SQL statements", num_statements)
+        run_log.info("✓ Output saved to: %s", output_file)
 
-        return len(formatted_statements)
+        return num_statements
 
     except Exception as e:
-        print(f"Error processing SQL file: {str(e)}")
+        run_log.error("Error processing SQL file: %s", e)
         return 0
 
 def create_databricks_notebook(input_file: str, output_file: str) -> int:
@@ -470,44 +232,66 @@ def create_databricks_notebook(input_file: str, output_file: str) -> int:
         return 0
 
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # Split content by spark.sql statements
-        statements = content.split('spark.sql("""')
-
-        # Start with notebook header
-        notebook_content = [
-            "# Databricks notebook source",
-            "# MAGIC %md",
-            "# MAGIC # Converted SQL Statements for Databricks",
-            "# MAGIC This notebook contains SQL statements converted from SAP field names to DBX field names",
-            ""
-        ]
-
-        # Process each SQL statement
-        for i, statement in enumerate(statements):
-            if statement.strip() and i > 0:  # Skip first empty part
-                notebook_content.extend([
-                    "# COMMAND ----------",
-                    "",
-                    'spark.sql("""' + statement.strip(),
-                    ""
-                ])
-
-        # Write to output file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(notebook_content))
-
-        num_statements = len(statements) - 1
-        if CONFIG['verbose_output']:
-            print(f"✓ Created Databricks notebook with {num_statements} SQL statements")
-            print(f"✓ Output saved to: {output_file}")
+        if CONFIG['stream_sql_files']:
+            # Write the cells while reading the spark.sql statements
+            with open(input_file, 'r', encoding='utf-8') as src, open(output_file, 'w', encoding='utf-8') as out:
+                num_statements = stream_notebook(read_chunks(src), out)
+        else:
+            with open(input_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+            # One notebook cell per spark.sql statement
+            notebook_content, num_statements = build_notebook(content)
+
+            # Write to output file
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(notebook_content)
+
+        run_log.info("✓ Created Databricks notebook with %d SQL statements", num_statements)
+        run_log.info("✓ Output saved to: %s", output_file)
 
         return num_statements
 
     except Exception as e:
-        print(f"Error creating Databricks notebook: {str(e)}")
+        run_log.error("Error creating Databricks notebook: %s", e)
+        return 0
+
+def convert_sql_to_notebook(input_file: str, notebook_file: str,
+                            field_mappings: Dict[str, str], table_mappings: Dict[str, str],
+                            rewriter: Optional[SqlRewriter] = None, processed_file: Optional[str] = None) -> int:
+    """
+    Process SQL file and write the Databricks notebook in one pass.
+
+    Same output as process_sql_file followed by create_databricks_notebook,
+    without writing and re-reading the intermediate spark.sql() file.
+
+    Parameters:
+    processed_file (str): Also write the spark.sql() formatted statements here
+
+    Returns:
+    int: Number of SQL statements in the notebook
+    """
+    if not validate_file_exists(input_file, "SQL input file"):
+        return 0
+
+    try:
+        rewrite = make_sql_rewriter(field_mappings, table_mappings, rewriter,
+                                    token_aware=CONFIG['token_aware_rewrite'])
+        num_statements, _ = convert_sql_file(input_file, notebook_file, processed_file, rewrite=rewrite,
+                                             streaming=CONFIG['stream_sql_files'],
+                                             **incremental_options(field_mappings, table_mappings, rewriter))
+        save_conversion_manifest()
+
+        run_log.info("✓ Processed %d SQL statements", num_statements)
+        if processed_file:
+            run_log.info("✓ Output saved to: %s", processed_file)
+        run_log.info("✓ Created Databricks notebook with %d SQL statements", num_statements)
+        run_log.info("✓ Output saved to: %s", notebook_file)
+
+        return num_statements
+
+    except Exception as e:
+        run_log.error("Error converting SQL file: %s", e)
         return 0
 
 def replace_original_file(notebook_file: str, target_file: str) -> bool:
@@ -519,32 +303,71 @@ def replace_original_file(notebook_file: str, target_file: str) -> bool:
     """
     try:
         shutil.copy2(notebook_file, target_file)
-        if CONFIG['verbose_output']:
-            print(f"✓ Successfully replaced {target_file} with formatted notebook")
-            print("  - SAP field names converted to DBX field names")
-            print("  - SAP table names converted to DBX table names")
-            print("  - All SQL statements wrapped with spark.sql() syntax")
-            print("  - Proper Databricks notebook formatting")
+        run_log.info("✓ Successfully replaced %s with formatted notebook", target_file)
+        run_log.info("  - SAP field names converted to DBX field names")
+        run_log.info("  - SAP table names converted to DBX table names")
+        run_log.info("  - All SQL statements wrapped with spark.sql() syntax")
+        run_log.info("  - Proper Databricks notebook formatting")
         return True
     except Exception as e:
-        print(f"Error replacing original file: {str(e)}")
+        run_log.error("Error replacing original file: %s", e)
         return False
 
 print("SQL processing functions loaded successfully!")
 
 
+# COMMAND ----------
+
+# DBTITLE 1,Mapping cache
+# The same instance load_field_lookup and convert_sql_files use for this directory
+mapping_cache = shared_cache(CONFIG['mapping_cache_dir'], verbose=CONFIG['verbose_output'])
+
+# Converted statements of previous runs (see incremental.py)
+conversion_manifest = ConversionManifest(CONFIG['conversion_manifest_dir'])
+
+def build_compiled_mappings(excel_file: str) -> Dict:
+    """
+    Read the Excel file and compile everything the SQL steps need.
+
+    Returns:
+    dict: field_mapping, field_mappings, table_mappings and rewriter, or {} if nothing was read
+    """
+    return compile_mappings(read_mapping_from_excel(excel_file))
+
+def load_compiled_mappings(excel_file: str) -> Dict:
+    """
+    Load compiled mappings from the cache, reading Excel only when the file changed.
+
+    Returns:
+    dict: See build_compiled_mappings
+    """
+    if not CONFIG['use_mapping_cache']:
+        return build_compiled_mappings(excel_file)
+
+    return mapping_cache.get_or_build(
+        excel_file,
+        lambda: build_compiled_mappings(excel_file),
+        namespace='mapping_script',
+        refresh=CONFIG['refresh_mapping_cache']
+    )
+
+print("Mapping cache ready!")
+
+
 # COMMAND ----------
 
 # Initialize variables
 field_mapping_from_excel = {}
 fuzzy_mapping = {}
+compiled_mappings = {}
 
 # Process Excel file if it exists
 if validate_file_exists(CONFIG['excel_file']):
     print("=== Step 1: Processing Excel File ===")
 
-    # Read mapping data from Excel
-    field_mapping_from_excel = read_mapping_from_excel(CONFIG['excel_file'])
+    # Read mapping data from Excel (or the mapping cache)
+    compiled_mappings = load_compiled_mappings(CONFIG['excel_file'])
+    field_mapping_from_excel = compiled_mappings.get('field_mapping', {})
 
     if field_mapping_from_excel:
         print(f"✓ Successfully processed Excel file")
@@ -581,20 +404,31 @@ else:
 field_mappings = {}
 table_mappings = {}
 num_sql_statements = 0
+sql_rewriter = None
+mappings_available = False
+
+# Prefer the compiled mappings from step 1, fall back to the saved JSON file
+if compiled_mappings:
+    field_mappings = compiled_mappings['field_mappings']
+    table_mappings = compiled_mappings['table_mappings']
+    sql_rewriter = compiled_mappings['rewriter']
+    mappings_available = True
+elif validate_file_exists(CONFIG['field_mapping_json']):
+    field_mappings, table_mappings = load_field_mappings(CONFIG['field_mapping_json'])
+    mappings_available = True
 
-if validate_file_exists(CONFIG['field_mapping_json']) and validate_file_exists(CONFIG['sql_input_file']):
+if mappings_available and validate_file_exists(CONFIG['sql_input_file']):
     print("=== Step 3: Processing SQL File ===")
 
-    # Load field mappings
-    field_mappings, table_mappings = load_field_mappings(CONFIG['field_mapping_json'])
-
     if field_mappings:
-        # Process SQL file
-        num_sql_statements = process_sql_file(
+        # Process SQL file and write the notebook in one pass
+        num_sql_statements = convert_sql_to_notebook(
             CONFIG['sql_input_file'],
-            CONFIG['sql_output_file'],
+            CONFIG['notebook_output_file'],
             field_mappings,
-            table_mappings
+            table_mappings,
+            rewriter=sql_rewriter,
+            processed_file=CONFIG['sql_output_file'] if CONFIG['write_processed_sql'] else None
         )
 
         if num_sql_statements > 0:
@@ -611,14 +445,11 @@ else:
 
 num_notebook_statements = 0
 
-if validate_file_exists(CONFIG['sql_output_file']):
+if num_sql_statements > 0 and validate_file_exists(CONFIG['notebook_output_file']):
     print("=== Step 4: Creating Databricks Notebook ===")
 
-    # Create Databricks notebook
-    num_notebook_statements = create_databricks_notebook(
-        CONFIG['sql_output_file'],
-        CONFIG['notebook_output_file']
-    )
+    # The notebook was written together with the SQL processing in step 3
+    num_notebook_statements = num_sql_statements
 
     if num_notebook_statements > 0:
         print(f"✓ Successfully created Databricks notebook with {num_notebook_statements} statements")
@@ -634,21 +465,18 @@ if validate_file_exists(CONFIG['sql_output_file']):
     else:
         print("⚠️  No statements were added to the notebook")
 else:
-    print("⚠️  Skipping notebook creation - processed SQL file not found")
+    print("⚠️  Skipping notebook creation - no notebook was written in step 3")
 
 
 # COMMAND ----------
 
 num_notebook_statements = 0
 
-if validate_file_exists(CONFIG['sql_output_file']):
+if num_sql_statements > 0 and validate_file_exists(CONFIG['notebook_output_file']):
     print("=== Step 4: Creating Databricks Notebook ===")
 
-    # Create Databricks notebook
-    num_notebook_statements = create_databricks_notebook(
-        CONFIG['sql_output_file'],
-        CONFIG['notebook_output_file']
-    )
+    # The notebook was written together with the SQL processing in step 3
+    num_notebook_statements = num_sql_statements
 
     if num_notebook_statements > 0:
         print(f"✓ Successfully created Databricks notebook with {num_notebook_statements} statements")
@@ -664,7 +492,7 @@ if validate_file_exists(CONFIG['sql_output_file']):
     else:
         print("⚠️  No statements were added to the notebook")
 else:
-    print("⚠️  Skipping notebook creation - processed SQL file not found")
+    print("⚠️  Skipping notebook creation - no notebook was written in step 3")
 
 
 # COMMAND ----------
@@ -696,6 +524,16 @@ if num_sql_statements > 0:
 else:
     print("✗ SQL Processing: Failed or skipped")
 
+# Mapping cache summary
+if CONFIG['use_mapping_cache']:
+    mapping_cache.report()
+
+# Stage durations (excel load, rewrite, notebook write, ...)
+run_log.print_summary()
+if CONFIG['run_log_jsonl']:
+    run_log.export_jsonl(CONFIG['run_log_jsonl'])
+    print(f"✓ Run log written to: {CONFIG['run_log_jsonl']}")
+
 # Notebook creation summary
 if num_notebook_statements > 0:
     print(f"✓ Notebook Creation: {num_notebook_statements} statements in notebook")
@@ -719,9 +557,11 @@ def run_complete_workflow():
     """Run the complete SQL conversion workflow in one function."""
     print("=== Starting Complete Workflow ===")
 
-    # Step 1: Process Excel
+    # Step 1: Process Excel (or load the compiled mappings from the cache)
+    compiled = {}
     if validate_file_exists(CONFIG['excel_file']):
-        field_mapping = read_mapping_from_excel(CONFIG['excel_file'])
+        compiled = load_compiled_mappings(CONFIG['excel_file'])
+        field_mapping = compiled.get('field_mapping', {})
         if CONFIG['save_json_files'] and field_mapping:
             with open(CONFIG['field_mapping_json'], 'w') as f:
                 json.dump(field_mapping, f, indent=4)
@@ -733,18 +573,27 @@ def run_complete_workflow():
             with open(CONFIG['fuzzy_mapping_json'], 'w') as f:
                 json.dump(fuzzy_map, f, indent=4)
 
-    # Step 3: Process SQL
-    if validate_file_exists(CONFIG['field_mapping_json']) and validate_file_exists(CONFIG['sql_input_file']):
+        fuzzy_candidates = create_fuzzy_candidates(field_mapping, CONFIG['max_fuzzy_examples'],
+                                                   CONFIG['fuzzy_similarity_threshold'])
+        if CONFIG['save_json_files'] and fuzzy_candidates:
+            with open(CONFIG['fuzzy_candidates_json'], 'w') as f:
+                json.dump(fuzzy_candidates, f, indent=4)
+
+    # Step 3 + 4: Process SQL and create the notebook in one pass
+    processed_file = CONFIG['sql_output_file'] if CONFIG['write_processed_sql'] else None
+    num_statements = 0
+    if compiled and validate_file_exists(CONFIG['sql_input_file']):
+        num_statements = convert_sql_to_notebook(CONFIG['sql_input_file'], CONFIG['notebook_output_file'],
+                                                 compiled['field_mappings'], compiled['table_mappings'],
+                                                 rewriter=compiled['rewriter'], processed_file=processed_file)
+    elif validate_file_exists(CONFIG['field_mapping_json']) and validate_file_exists(CONFIG['sql_input_file']):
         field_maps, table_maps = load_field_mappings(CONFIG['field_mapping_json'])
         if field_maps:
-            process_sql_file(CONFIG['sql_input_file'], CONFIG['sql_output_file'], field_maps, table_maps)
-
-    # Step 4: Create notebook
-    if validate_file_exists(CONFIG['sql_output_file']):
-        create_databricks_notebook(CONFIG['sql_output_file'], CONFIG['notebook_output_file'])
+            num_statements = convert_sql_to_notebook(CONFIG['sql_input_file'], CONFIG['notebook_output_file'],
+                                                     field_maps, table_maps, processed_file=processed_file)
 
-        if CONFIG['auto_replace_original']:
-            replace_original_file(CONFIG['notebook_output_file'], CONFIG['sql_input_file'])
+    if num_statements > 0 and CONFIG['auto_replace_original']:
+        replace_original_file(CONFIG['notebook_output_file'], CONFIG['sql_input_file'])
 
     print("=== Workflow Complete ===")
 
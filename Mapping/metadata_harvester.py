@@ -0,0 +1,350 @@
+"""
+Column metadata of Databricks tables and views, fetched in bulk per schema.
+
+The "EXTRACT DATABRICKS TABLE AND VIEW INFO" cell of data_type_comparison.ipynb
+and leap_data_type_comparison.ipynb ran SHOW TABLES and SHOW VIEWS for every
+catalog/schema pair and one DESCRIBE per table and view, one after another
+(two more for a view that SHOW TABLES listed too), appending a Row per
+column to a Python list. On a schema with a few hundred objects that is a
+few hundred Spark queries, each paying the full round trip.
+
+A MetadataHarvester fetches one schema at a time from a metadata source:
+
+- bulk: one information_schema query returns the columns and data types
+  of every table and view of the schema, with the object type
+- fallback: where the bulk query fails (hive_metastore has no
+  information_schema, missing privileges, ...) the objects are listed once
+  and described concurrently, max_workers DESCRIBEs at a time
+
+The schemas of one harvest are fetched concurrently as well. The columns
+of a schema are cached per catalog.schema for ttl_seconds, so re-running
+the cell (or harvesting an overlapping set of schemas) costs nothing until
+the entries expire or are invalidated.
+
+Names and data types are upper-cased as the notebooks did; DESCRIBE's
+partitioning and comment sections are not columns and are dropped.
+
+SparkMetadataSource reads a Databricks workspace through spark.sql.
+SqliteMetadataSource reads the tables and views of a SQLite database (an
+attached database per schema), so the harvester can be run and benchmarked
+without a cluster; `latency` adds a delay per query like a remote round trip.
+
+Usage:
+    harvester = MetadataHarvester(SparkMetadataSource(spark), ttl_seconds=900)
+    metadata_rows = harvester.harvest([('nn_catalogdevdev', 'sales'), ...])
+    dbx_metadata_df = spark.createDataFrame(metadata_rows, METADATA_SCHEMA)
+
+    python metadata_harvester.py [--schemas 4] [--objects 200] [--columns 20] [--latency 0.01] [--workers 16]
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from instrumentation import run_log
+
+TABLE = 'TABLE'
+VIEW = 'VIEW'
+
+# Cached schemas are fetched again after this many seconds
+DEFAULT_TTL_SECONDS = 15 * 60
+
+DEFAULT_WORKERS = 16
+
+# Spark schema of a harvest, for spark.createDataFrame (also when nothing was found)
+METADATA_SCHEMA = ('object_type string, catalog_name string, schema_name string, '
+                   'object_name string, column_name string, data_type string')
+
+# information_schema.tables.table_type values of views (everything else is a table)
+_VIEW_TYPES = {'VIEW', 'MATERIALIZED_VIEW'}
+
+
+class ColumnMetadata(NamedTuple):
+    object_type: str  # TABLE or VIEW
+    catalog_name: str
+    schema_name: str
+    object_name: str
+    column_name: str
+    data_type: str
+
+
+class SchemaObject(NamedTuple):
+    name: str
+    object_type: str
+
+
+def _quote(name: str) -> str:
+    return '`' + name.replace('`', '``') + '`'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def describe_columns(rows: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """(column, data type) pairs of DESCRIBE output, without the '# Partition Information' and later sections."""
+    columns = []
+    for column_name, data_type in rows:
+        if not column_name or column_name.startswith('#'):
+            break
+        columns.append((column_name, data_type))
+    return columns
+
+
+class SparkMetadataSource:
+    """
+    Metadata of a Databricks workspace through spark.sql.
+
+    The bulk query reads `{catalog}.information_schema.columns` joined with
+    information_schema.tables for the object type. full_data_type is the type
+    as DESCRIBE shows it (e.g. decimal(10,2)).
+    """
+
+    def __init__(self, spark):
+        self.spark = spark
+
+    def schema_columns(self, catalog: str, schema: str) -> List[Tuple[str, str, str, str]]:
+        """(object name, object type, column name, data type) of every column of a schema."""
+        info = f"{_quote(catalog)}.information_schema"
+        rows = self.spark.sql(f"""
+            SELECT c.table_name, t.table_type, c.column_name, c.full_data_type
+            FROM {info}.columns c
+            JOIN {info}.tables t
+              ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+            WHERE lower(c.table_schema) = lower({_literal(schema)})
+            ORDER BY c.table_name, c.ordinal_position
+        """).collect()
+        return [(row[0], VIEW if (row[1] or '').upper() in _VIEW_TYPES else TABLE, row[2], row[3])
+                for row in rows]
+
+    def list_objects(self, catalog: str, schema: str) -> List[SchemaObject]:
+        """Tables and views of a schema; SHOW TABLES lists the views too."""
+        name = f"{_quote(catalog)}.{_quote(schema)}"
+        views = {row['viewName'].lower() for row in self.spark.sql(f"SHOW VIEWS IN {name}").collect()
+                 if not row['isTemporary']}
+        tables = [row['tableName'] for row in self.spark.sql(f"SHOW TABLES IN {name}").collect()
+                  if not row['isTemporary']]
+        return [SchemaObject(table, VIEW if table.lower() in views else TABLE) for table in tables]
+
+    def describe(self, catalog: str, schema: str, object_name: str) -> List[Tuple[str, str]]:
+        """(column, data type) pairs of one table or view."""
+        rows = self.spark.sql(f"DESCRIBE {_quote(catalog)}.{_quote(schema)}.{_quote(object_name)}").collect()
+        return describe_columns((row['col_name'], row['data_type']) for row in rows)
+
+
+class SqliteMetadataSource:
+    """
+    Metadata of a SQLite database, the same queries as SparkMetadataSource asks of Databricks.
+
+    A schema is an attached database ('main' is the database file itself); the
+    catalog name is not used. One connection per thread.
+
+    Parameters:
+    path (str): Database file
+    schemas (dict): Schema name -> database file to attach
+    latency (float): Seconds added to every query, to simulate a remote metastore
+    """
+
+    def __init__(self, path: str, schemas: Optional[Dict[str, str]] = None, latency: float = 0.0):
+        self.path = path
+        self.schemas = dict(schemas or {})
+        self.latency = latency
+        self._local = threading.local()
+
+    def _query(self, sql: str, parameters: Sequence = ()) -> List[tuple]:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=60)
+            for schema, path in self.schemas.items():
+                connection.execute('ATTACH DATABASE ? AS "{}"'.format(schema.replace('"', '""')), (path,))
+        if self.latency:
+            time.sleep(self.latency)
+        return connection.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def _schema(schema: str) -> str:
+        return '"' + schema.replace('"', '""') + '"'
+
+    def schema_columns(self, catalog: str, schema: str) -> List[Tuple[str, str, str, str]]:
+        """(object name, object type, column name, data type) of every column of a schema."""
+        rows = self._query(f"""
+            SELECT m.name, m.type, p.name, p.type
+            FROM {self._schema(schema)}.sqlite_master m
+            JOIN pragma_table_info(m.name, ?) p
+            WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite\\_%' ESCAPE '\\'
+            ORDER BY m.name, p.cid
+        """, (schema,))
+        return [(name, VIEW if object_type == 'view' else TABLE, column, data_type)
+                for name, object_type, column, data_type in rows]
+
+    def list_objects(self, catalog: str, schema: str) -> List[SchemaObject]:
+        rows = self._query(f"SELECT name, type FROM {self._schema(schema)}.sqlite_master "
+                           f"WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' ORDER BY name")
+        return [SchemaObject(name, VIEW if object_type == 'view' else TABLE) for name, object_type in rows]
+
+    def describe(self, catalog: str, schema: str, object_name: str) -> List[Tuple[str, str]]:
+        rows = self._query("SELECT name, type FROM pragma_table_info(?, ?) ORDER BY cid", (object_name, schema))
+        return describe_columns(rows)
+
+
+class MetadataHarvester:
+    """
+    Column metadata per catalog.schema, fetched in bulk and cached.
+
+    Parameters:
+    source: SparkMetadataSource, SqliteMetadataSource or any object with
+            schema_columns, list_objects and describe
+    ttl_seconds (float): Seconds a fetched schema is served from the cache; 0 disables the cache
+    max_workers (int): Schemas fetched at the same time, and DESCRIBEs per schema in the fallback
+    bulk (bool): Use the bulk query; False always lists and describes
+    """
+
+    def __init__(self, source, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_workers: int = DEFAULT_WORKERS,
+                 bulk: bool = True, log=run_log):
+        self.source = source
+        self.ttl_seconds = ttl_seconds
+        self.max_workers = max_workers
+        self.bulk = bulk
+        self.log = log
+        self.errors: Dict[Tuple[str, str], str] = {}
+        self._cache: Dict[Tuple[str, str], Tuple[float, List[ColumnMetadata]]] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, catalog: Optional[str] = None, schema: Optional[str] = None) -> None:
+        """Drop cached schemas: one schema, every schema of a catalog, or everything."""
+        with self._lock:
+            for key in list(self._cache):
+                if (catalog is None or key[0] == catalog.lower()) and (schema is None or key[1] == schema.lower()):
+                    del self._cache[key]
+
+    def _fetch(self, catalog: str, schema: str) -> List[ColumnMetadata]:
+        rows = None
+        if self.bulk:
+            try:
+                rows = self.source.schema_columns(catalog, schema)
+                self.log.count('metadata_bulk_queries')
+            except Exception as e:
+                self.log.count('metadata_bulk_failures')
+                self.log.debug("Bulk metadata query of %s.%s failed, describing each object: %s", catalog, schema, e)
+        if rows is None:
+            objects = self.source.list_objects(catalog, schema)
+
+            def describe(obj: SchemaObject) -> List[Tuple[str, str, str, str]]:
+                return [(obj.name, obj.object_type, column, data_type)
+                        for column, data_type in self.source.describe(catalog, schema, obj.name)]
+
+            rows = []
+            if objects:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(objects)),
+                                        thread_name_prefix='metadata-describe') as pool:
+                    for described in pool.map(describe, objects):
+                        rows.extend(described)
+            self.log.count('metadata_describe_queries', len(objects))
+        return [ColumnMetadata(object_type, catalog, schema, name.upper(), column.upper(), (data_type or '').upper())
+                for name, object_type, column, data_type in rows]
+
+    def schema(self, catalog: str, schema: str, refresh: bool = False) -> List[ColumnMetadata]:
+        """Columns of every table and view of one schema, from the cache while it is fresh."""
+        key = (catalog.lower(), schema.lower())
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and not refresh and time.monotonic() - cached[0] < self.ttl_seconds:
+            self.log.count('metadata_schemas_cached')
+            return cached[1]
+        started = time.monotonic()
+        columns = self._fetch(catalog, schema)
+        self.log.count('metadata_schemas_fetched')
+        self.log.debug("Fetched %d columns of %s.%s in %.2fs", len(columns), catalog, schema,
+                       time.monotonic() - started)
+        if self.ttl_seconds > 0:
+            with self._lock:
+                self._cache[key] = (started, columns)
+        return columns
+
+    def harvest(self, pairs: Iterable[Sequence[str]], refresh: bool = False) -> List[ColumnMetadata]:
+        """
+        Columns of every table and view of the schemas, fetched concurrently.
+
+        A schema that cannot be read is logged, listed in `errors` and skipped,
+        so one missing schema does not lose the others.
+
+        Parameters:
+        pairs (iterable): (catalog, schema) pairs, e.g. Rows of CatalogName, SchemaName; duplicates are read once
+        refresh (bool): Fetch again even where the cache is fresh
+
+        Returns:
+        list: ColumnMetadata, schema by schema in the order of `pairs`
+        """
+        unique = list(dict.fromkeys((str(pair[0]), str(pair[1])) for pair in pairs))
+        if not unique:
+            return []
+
+        def fetch(pair: Tuple[str, str]) -> List[ColumnMetadata]:
+            try:
+                columns = self.schema(*pair, refresh=refresh)
+                self.errors.pop(pair, None)
+                return columns
+            except Exception as e:
+                self.errors[pair] = str(e)
+                self.log.error("Cannot read the metadata of %s.%s: %s", pair[0], pair[1], e)
+                return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique)),
+                                thread_name_prefix='metadata-schema') as pool:
+            return [column for columns in pool.map(fetch, unique) for column in columns]
+
+
+def _build_sample(directory: str, schemas: int, objects: int, columns: int) -> Tuple[str, Dict[str, str]]:
+    """A main database and `schemas` attached ones, each with `objects` tables and views of `columns` columns."""
+    types = ('NVARCHAR(40)', 'DECIMAL(15,2)', 'INTEGER', 'DATE', 'TIMESTAMP')
+    paths = {}
+    for number in range(schemas):
+        path = paths[f"schema_{number}"] = os.path.join(directory, f"schema_{number}.sqlite")
+        with sqlite3.connect(path) as connection:
+            for table in range(objects):
+                if table % 5 == 4:
+                    connection.execute(f'CREATE VIEW "V_{table}" AS SELECT * FROM "T_{table - 1}"')
+                else:
+                    cols = ', '.join(f'"C_{col}" {types[col % len(types)]}' for col in range(columns))
+                    connection.execute(f'CREATE TABLE "T_{table}" ({cols})')
+    main = os.path.join(directory, 'main.sqlite')
+    sqlite3.connect(main).close()
+    return main, paths
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Harvest the column metadata of a sample SQLite workspace")
+    parser.add_argument('--schemas', type=int, default=4)
+    parser.add_argument('--objects', type=int, default=200, help="Tables and views per schema")
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.01, help="Seconds per query")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as sample_dir:
+        main_path, schema_paths = _build_sample(sample_dir, args.schemas, args.objects, args.columns)
+        sample = SqliteMetadataSource(main_path, schema_paths, latency=args.latency)
+        sample_pairs = [('local', schema_name) for schema_name in schema_paths]
+
+        # The notebook cell: list, then one DESCRIBE after another
+        started = time.perf_counter()
+        serial = [(schema_name, obj.name, column) for _, schema_name in sample_pairs
+                  for obj in sample.list_objects('local', schema_name)
+                  for column in sample.describe('local', schema_name, obj.name)]
+        print(f"serial DESCRIBE:     {len(serial)} columns in {time.perf_counter() - started:.3f}s")
+
+        for label, harvester in (('concurrent DESCRIBE', MetadataHarvester(sample, max_workers=args.workers, bulk=False)),
+                                 ('bulk query', MetadataHarvester(sample, max_workers=args.workers))):
+            started = time.perf_counter()
+            harvested = harvester.harvest(sample_pairs)
+            print(f"{label + ':':20} {len(harvested)} columns in {time.perf_counter() - started:.3f}s")
+        started = time.perf_counter()
+        harvested = harvester.harvest(sample_pairs)
+        print(f"{'cached:':20} {len(harvested)} columns in {time.perf_counter() - started:.6f}s")
+    run_log.print_summary()
@@ -0,0 +1,520 @@
+"""
+Rate-limited, concurrent scheduler for chat completion (model) calls.
+
+The conversion notebooks call the model through blocking `client.chat.completions.create`
+calls from a default ThreadPoolExecutor: as many calls in flight as there are
+threads, no limit on requests or tokens per minute and no retry, so a run
+stalls or fails as soon as the deployment answers 429. ModelCallScheduler
+puts every call of the process through one asyncio event loop with
+
+- token buckets for requests per minute and tokens per minute (the prompt
+  size plus the completion budget is reserved up front and corrected with
+  the usage the response reports)
+- a bound on the number of calls in flight
+- retries of 429/5xx/connection errors with exponential backoff and full
+  jitter, honouring Retry-After; a 429 pauses all calls until it has passed
+- per-call metrics (queue wait, latency, attempts, tokens), also added to
+  the run log as the 'model_call' stage
+- optionally a ResponseCache (response_cache.py) that answers repeated
+  requests without calling the model
+
+How a request is sent is pluggable: openai_chat_sender wraps an (Azure)
+OpenAI client, http_chat_sender posts to any OpenAI-compatible endpoint with
+the standard library, e.g. the local fake server in fake_openai_server.py.
+
+Usage (notebooks; the scheduler runs its loop in a background thread):
+    scheduler = ModelCallScheduler(openai_chat_sender(client.with_options(max_retries=0)),
+                                   requests_per_minute=60, tokens_per_minute=150000)
+    response = scheduler.call_sync({'model': 'o1', 'messages': messages})
+
+Usage (asyncio):
+    responses = await scheduler.map(requests)
+    scheduler.print_summary()
+
+    python model_scheduler.py --fake [--calls 50] [--error-rate 0.2] [--cache-dir /tmp/model_cache]
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from instrumentation import DEFAULT_CAPACITY, MODEL_CALL, RunLog, run_log
+
+# Sends one chat completion request (the keyword arguments of chat.completions.create)
+Sender = Callable[[Dict], Awaitable[object]]
+
+# HTTP statuses worth another attempt
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Rough size of a token in characters, for reserving tokens before the call
+CHARS_PER_TOKEN = 4
+
+
+class ModelCallError(Exception):
+    """An HTTP error answer of the model endpoint."""
+
+    def __init__(self, status_code: Optional[int], message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code}: {message}" if status_code else message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CallMetrics(NamedTuple):
+    tag: Optional[str]
+    model: Optional[str]
+    ok: bool
+    attempts: int
+    queued: float  # seconds spent waiting for the limits
+    latency: float  # seconds of the last attempt
+    total: float  # seconds from submitting the call to its result
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: Optional[str] = None
+    cached: bool = False
+
+
+def _header_seconds(headers, name: str, scale: float = 1.0) -> Optional[float]:
+    try:
+        value = headers.get(name) if headers is not None else None
+        return float(value) * scale if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of a failed call (ModelCallError, openai.APIStatusError), or None."""
+    status = getattr(error, 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the endpoint asked to wait (Retry-After / retry-after-ms), or None."""
+    if getattr(error, 'retry_after', None) is not None:
+        return error.retry_after
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    milliseconds = _header_seconds(headers, 'retry-after-ms', 0.001)
+    return milliseconds if milliseconds is not None else _header_seconds(headers, 'retry-after')
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for rate limits, server errors, timeouts and connection errors."""
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return (isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError))
+            or type(error).__name__ in ('APIConnectionError', 'APITimeoutError'))
+
+
+def estimate_tokens(request: Dict, completion_tokens: int = 1000) -> int:
+    """
+    Tokens to reserve for a request: its message text plus the completion budget.
+
+    Parameters:
+    request (dict): Chat completion request
+    completion_tokens (int): Budget for requests without max_tokens / max_completion_tokens
+
+    Returns:
+    int: Estimated prompt + completion tokens
+    """
+    chars = sum(len(str(message.get('content') or '')) for message in request.get('messages', []))
+    budget = request.get('max_completion_tokens') or request.get('max_tokens') or completion_tokens
+    return chars // CHARS_PER_TOKEN + 1 + budget
+
+
+def response_usage(response) -> Dict[str, int]:
+    """prompt_tokens and completion_tokens of a response (SDK object or parsed JSON)."""
+    usage = response.get('usage') if isinstance(response, dict) else getattr(response, 'usage', None)
+    if usage is None:
+        return {}
+    get = usage.get if isinstance(usage, dict) else (lambda name: getattr(usage, name, None))
+    return {name: get(name) or 0 for name in ('prompt_tokens', 'completion_tokens')}
+
+
+def response_text(response) -> str:
+    """Message content of the first choice (SDK object or parsed JSON)."""
+    if isinstance(response, dict):
+        return response['choices'][0]['message']['content']
+    return response.choices[0].message.content
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute.
+
+    The default capacity is ten seconds' worth of tokens: Azure OpenAI checks
+    its per-minute quota over short windows, so a full minute's burst would
+    already be answered with 429. Waiters are served in arrival order.
+    Amounts above the capacity take the full bucket, so a single large
+    request cannot wait forever.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or max(per_minute / 6, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        Wait until `amount` tokens are available and take them.
+
+        Returns:
+        float: Tokens taken, at most the capacity; refunds (adjust) must not exceed it
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+        return amount
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or take (negative, possibly into debt) tokens after the fact."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: attempt n waits uniform(0, min(max_delay, base_delay * 2**n)).
+
+    When the endpoint sends Retry-After, at least that long is waited (plus up
+    to base_delay of jitter, so the waiting calls do not retry in lockstep).
+    """
+
+    def __init__(self, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 rng: Optional[random.Random] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt: int, retry_after_seconds: Optional[float] = None) -> float:
+        backoff = self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after_seconds is not None:
+            return max(backoff, retry_after_seconds + self.rng.uniform(0, self.base_delay))
+        return backoff
+
+
+class ModelCallScheduler:
+    """
+    Runs chat completion requests under request/token rate limits with bounded
+    concurrency and retries.
+
+    Parameters:
+    send (Sender): Coroutine function sending one request (openai_chat_sender, http_chat_sender)
+    requests_per_minute (float): Request limit of the deployment; None for no limit
+    tokens_per_minute (float): Token limit of the deployment; None for no limit
+    max_concurrency (int): Calls in flight at most
+    retry (RetryPolicy): Backoff of failed attempts
+    completion_tokens (int): Completion budget reserved for requests without max_tokens
+    log (RunLog): Where retries are logged and call times and tokens are counted
+    cache (ResponseCache): Answer repeated requests from this cache (response_cache.py)
+    metrics_capacity (int): Number of CallMetrics kept; older ones are dropped as in the run log
+    """
+
+    def __init__(self, send: Sender, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_concurrency: int = 4,
+                 retry: Optional[RetryPolicy] = None, completion_tokens: int = 1000, log: RunLog = run_log,
+                 cache=None, metrics_capacity: int = DEFAULT_CAPACITY):
+        self.send = send
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.retry = retry or RetryPolicy()
+        self.completion_tokens = completion_tokens
+        self.log = log
+        self.cache = cache
+        self.metrics: deque = deque(maxlen=metrics_capacity)
+        self.dropped_metrics = 0
+        self.paused_until = 0.0  # monotonic time until which a 429 stops all calls
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore, self._semaphore_loop = asyncio.Semaphore(self.max_concurrency), loop
+        return self._semaphore
+
+    async def _wait_for_limits(self, estimate: int) -> float:
+        """Wait for a pause and the buckets; returns the tokens taken from the token bucket."""
+        while time.monotonic() < self.paused_until:
+            await asyncio.sleep(self.paused_until - time.monotonic())
+        if self.requests:
+            await self.requests.acquire(1)
+        if self.tokens:
+            return await self.tokens.acquire(estimate)
+        return 0.0
+
+    async def call(self, request: Dict, tag: Optional[str] = None):
+        """
+        Send one request, waiting for the limits and retrying retryable errors.
+
+        Parameters:
+        request (dict): Keyword arguments of chat.completions.create (model, messages, ...)
+        tag (str): Name of the call in the metrics, e.g. the file or group converted
+
+        Returns:
+        The response of the sender; the last error is raised when all attempts fail
+        """
+        submitted = time.perf_counter()
+        if self.cache is not None:
+            response = self.cache.get(request)
+            if response is not None:
+                self._record(tag, request.get('model'), True, 0, 0.0, 0.0, submitted, cached=True)
+                self.log.count('model_cache_hits')
+                return response
+        estimate = estimate_tokens(request, self.completion_tokens)
+        model = request.get('model')
+        queued = 0.0
+        attempt = 0
+        while True:
+            async with self._slots():
+                wait_start = time.perf_counter()
+                reserved = await self._wait_for_limits(estimate)
+                queued += time.perf_counter() - wait_start
+
+                start = time.perf_counter()
+                try:
+                    response = await self.send(request)
+                except Exception as e:
+                    latency = time.perf_counter() - start
+                    self.log.add_time(MODEL_CALL, latency)
+                    # A failed attempt used no tokens; the next one reserves its own
+                    if self.tokens:
+                        self.tokens.adjust(reserved)
+                    if not is_retryable(e) or attempt >= self.retry.max_retries:
+                        self._record(tag, model, False, attempt + 1, queued, latency, submitted, error=repr(e))
+                        self.log.count('model_call_errors')
+                        raise
+                    wait_seconds = retry_after(e)
+                    delay = self.retry.delay(attempt, wait_seconds)
+                    if error_status(e) == 429:
+                        self.paused_until = max(self.paused_until, time.monotonic() + (wait_seconds or delay))
+                    self.log.count('model_call_retries')
+                    self.log.warning("Model call %s failed (%s: %s), retry %d of %d in %.1fs",
+                                     tag or model, type(e).__name__, e, attempt + 1, self.retry.max_retries, delay)
+                else:
+                    latency = time.perf_counter() - start
+                    self.log.add_time(MODEL_CALL, latency)
+                    usage = response_usage(response)
+                    if self.tokens and usage:
+                        self.tokens.adjust(reserved - sum(usage.values()))
+                    self._record(tag, model, True, attempt + 1, queued, latency, submitted, **usage)
+                    self.log.count('model_calls')
+                    for name, amount in usage.items():
+                        self.log.count(name, amount)
+                    if self.cache is not None:
+                        self.cache.put(request, response)
+                    return response
+            # Back off without holding a slot
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _record(self, tag, model, ok, attempts, queued, latency, submitted, **fields) -> None:
+        if len(self.metrics) == self.metrics.maxlen:
+            self.dropped_metrics += 1
+        self.metrics.append(CallMetrics(tag, model, ok, attempts, queued, latency,
+                                        time.perf_counter() - submitted, **fields))
+
+    async def map(self, requests: Iterable[Dict], tags: Optional[Iterable[str]] = None,
+                  return_exceptions: bool = False) -> List:
+        """Run many requests concurrently (within the limits); results in request order."""
+        requests = list(requests)
+        tags = list(tags) if tags is not None else [None] * len(requests)
+        return await asyncio.gather(*(self.call(request, tag) for request, tag in zip(requests, tags)),
+                                    return_exceptions=return_exceptions)
+
+    # Blocking use from notebooks and worker threads
+
+    def start(self) -> 'ModelCallScheduler':
+        """Run the scheduler's event loop in a background thread (done by call_sync when needed)."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='model-call-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def call_sync(self, request: Dict, tag: Optional[str] = None, timeout: Optional[float] = None):
+        """Blocking call(): safe from any thread, all callers share the limits."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.call(request, tag), self._loop).result(timeout)
+
+    def close(self) -> None:
+        """Stop the background event loop, if started."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop, self._thread = None, None
+
+    # Metrics
+
+    def summary(self) -> Dict:
+        """
+        Calls (and cache hits), errors, retries, latency percentiles, queue wait
+        and tokens of the calls kept in `metrics`; 'dropped' older calls are not included.
+        """
+        metrics = list(self.metrics)
+        sent = [m for m in metrics if not m.cached]
+        latencies = sorted(m.latency for m in sent if m.ok)
+
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            'calls': len(metrics),
+            'cached': len(metrics) - len(sent),
+            'errors': sum(not m.ok for m in sent),
+            'retries': sum(m.attempts - 1 for m in sent),
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95),
+            'latency_max': latencies[-1] if latencies else 0.0,
+            'queued_mean': sum(m.queued for m in sent) / len(sent) if sent else 0.0,
+            'prompt_tokens': sum(m.prompt_tokens for m in sent),
+            'completion_tokens': sum(m.completion_tokens for m in sent),
+            'dropped': self.dropped_metrics,
+        }
+
+    def print_summary(self) -> None:
+        s = self.summary()
+        print(f"Model calls: {s['calls']} ({s['cached']} from cache, {s['errors']} failed, {s['retries']} retries); "
+              f"latency p50 {s['latency_p50']:.2f}s, p95 {s['latency_p95']:.2f}s, max {s['latency_max']:.2f}s; "
+              f"mean wait for limits {s['queued_mean']:.2f}s; "
+              f"tokens {s['prompt_tokens']} prompt + {s['completion_tokens']} completion")
+        if s['dropped']:
+            print(f"Model call metrics: {s['dropped']} older calls dropped (capacity {self.metrics.maxlen})")
+
+
+def _in_threads(func: Callable[[Dict], object], max_workers: int) -> Sender:
+    """Sender running a blocking function in its own thread pool (the loop's default pool may be smaller)."""
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-call')
+
+    async def send(request: Dict):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, request)
+    return send
+
+
+def openai_chat_sender(client, max_workers: int = 32) -> Sender:
+    """
+    Sender for an OpenAI/AzureOpenAI client (sync or async).
+
+    Create the client with max_retries=0 (or pass client.with_options(max_retries=0)),
+    so that retries are left to the scheduler. Calls of a blocking client run in
+    a pool of max_workers threads; keep it at least the scheduler's max_concurrency.
+    """
+    create = client.chat.completions.create
+    if asyncio.iscoroutinefunction(create):
+        async def send(request: Dict):
+            return await create(**request)
+        return send
+    return _in_threads(lambda request: create(**request), max_workers)
+
+
+def http_chat_sender(base_url: str, api_key: str = '', api_version: Optional[str] = None,
+                     timeout: float = 600.0, max_workers: int = 32) -> Sender:
+    """
+    Sender posting to an OpenAI-compatible endpoint with the standard library.
+
+    Parameters:
+    base_url (str): e.g. http://127.0.0.1:8000/v1, or the Azure endpoint when api_version is set
+    api_key (str): Sent as 'Authorization: Bearer' (OpenAI) or 'api-key' (Azure)
+    api_version (str): Azure API version; requests then go to /openai/deployments/<model>/chat/completions
+    max_workers (int): Threads for the blocking HTTP requests
+
+    Returns:
+    Sender returning the parsed JSON response
+    """
+    base_url = base_url.rstrip('/')
+
+    def post(request: Dict) -> Dict:
+        if api_version:
+            url = f"{base_url}/openai/deployments/{request.get('model')}/chat/completions?api-version={api_version}"
+            headers = {'api-key': api_key}
+        else:
+            url = f"{base_url}/chat/completions"
+            headers = {'Authorization': f"Bearer {api_key}"}
+        headers['Content-Type'] = 'application/json'
+        http_request = urllib.request.Request(url, data=json.dumps(request).encode('utf-8'), headers=headers)
+        try:
+            with urllib.request.urlopen(http_request, timeout=timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            wait = _header_seconds(e.headers, 'retry-after-ms', 0.001)
+            if wait is None:
+                wait = _header_seconds(e.headers, 'retry-after')
+            raise ModelCallError(e.code, e.read().decode('utf-8', 'replace')[:500], wait) from None
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, TimeoutError):
+                raise e.reason from None
+            raise ConnectionError(str(e.reason)) from None
+
+    return _in_threads(post, max_workers)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run chat completion calls through the scheduler and print the metrics")
+    parser.add_argument('--base-url', help='OpenAI-compatible endpoint, e.g. http://127.0.0.1:8000/v1')
+    parser.add_argument('--fake', action='store_true', help='Start a local fake server (fake_openai_server.py)')
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--model', default='o1')
+    parser.add_argument('--requests-per-minute', type=float, default=600)
+    parser.add_argument('--tokens-per-minute', type=float, default=None)
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help='Latency of the fake server')
+    parser.add_argument('--error-rate', type=float, default=0.1, help='Share of 429/500 answers of the fake server')
+    parser.add_argument('--cache-dir', help='Cache responses here (response_cache.py); run twice to see the hits')
+    args = parser.parse_args()
+
+    server = None
+    if args.fake:
+        from fake_openai_server import FakeChatServer
+        server = FakeChatServer(latency=args.latency, error_rate=args.error_rate, retry_after=0.5)
+        args.base_url = server.start()
+    if not args.base_url:
+        parser.error('--base-url or --fake is required')
+
+    cache = None
+    if args.cache_dir:
+        from response_cache import ResponseCache
+        cache = ResponseCache(args.cache_dir)
+    scheduler = ModelCallScheduler(http_chat_sender(args.base_url), args.requests_per_minute,
+                                   args.tokens_per_minute, args.max_concurrency,
+                                   RetryPolicy(base_delay=0.2, max_delay=5.0), cache=cache)
+    requests = [{'model': args.model, 'messages': [{'role': 'user', 'content': f"Convert view {i}"}]}
+                for i in range(args.calls)]
+    start = time.perf_counter()
+    results = asyncio.run(scheduler.map(requests, tags=[f"view_{i}" for i in range(args.calls)],
+                                        return_exceptions=True))
+    print(f"{args.calls} calls in {time.perf_counter() - start:.2f}s")
+    scheduler.print_summary()
+    if cache is not None:
+        cache.print_stats()
+    if server is not None:
+        print(f"Fake server: {server.stats}")
+        server.stop()
+    raise SystemExit(0 if not any(isinstance(result, Exception) for result in results) else 1)
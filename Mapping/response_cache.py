@@ -0,0 +1,209 @@
+"""
+Content-addressed cache of model (chat completion) responses on local disk.
+
+Re-running a dataflow resends the same prompts and pays for the same
+completions again, including the calls that already succeeded before a run
+failed halfway. ResponseCache keys a response by the deployment, the system
+message, a hash of the prompt and the remaining request parameters, and keeps
+it in a SQLite file. ModelCallScheduler(cache=...) looks every request up
+before it waits for the rate limits and stores every successful response, so
+a re-run only pays for the calls that did not succeed before.
+
+The cache is bounded: when the stored responses exceed max_bytes, the least
+recently used ones are evicted. Hits, misses and evictions are counted per
+process (stats()) and hits per entry in the database.
+
+Usage:
+    cache = ResponseCache('.model_cache', max_bytes=512 * 2 ** 20)
+    scheduler = ModelCallScheduler(send, ..., cache=cache)
+    ...
+    cache.print_stats()
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Bump when the key or the stored response format changes
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 512 * 2 ** 20
+
+# Finish reasons of responses worth keeping (truncated or filtered answers are not cached)
+CACHEABLE_FINISH_REASONS = {None, 'stop'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    prompt_sha256 TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def request_key(request: Dict) -> Dict:
+    """
+    The parts of a chat completion request that identify its response.
+
+    Returns:
+    dict: key (hex digest), model and prompt_sha256 (hash of the non-system messages)
+    """
+    messages = request.get('messages', [])
+    system = [message.get('content') for message in messages if message.get('role') == 'system']
+    prompt = [[message.get('role'), message.get('content')] for message in messages
+              if message.get('role') != 'system']
+    prompt_sha256 = _sha256(json.dumps(prompt, ensure_ascii=False))
+    params = {name: value for name, value in request.items() if name not in ('model', 'messages')}
+    key = _sha256(json.dumps([CACHE_VERSION, request.get('model'), system, prompt_sha256, params],
+                             sort_keys=True, ensure_ascii=False, default=str))
+    return {'key': key, 'model': request.get('model'), 'prompt_sha256': prompt_sha256}
+
+
+def response_to_json(response) -> Dict:
+    """A response (SDK object or parsed JSON) as plain JSON data."""
+    if isinstance(response, dict):
+        return response
+    if hasattr(response, 'model_dump'):
+        return response.model_dump()
+    return json.loads(response.to_json())
+
+
+class CachedResponse(dict):
+    """Parsed response JSON that also allows `response.choices[0].message.content`, like the SDK objects."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    @classmethod
+    def wrap(cls, value):
+        if isinstance(value, dict):
+            return cls((key, cls.wrap(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [cls.wrap(item) for item in value]
+        return value
+
+
+def is_cacheable(data: Dict) -> bool:
+    """True for complete answers with text content."""
+    choices = data.get('choices') or []
+    if not choices:
+        return False
+    choice = choices[0]
+    content = (choice.get('message') or {}).get('content')
+    return bool(content) and choice.get('finish_reason') in CACHEABLE_FINISH_REASONS
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with least-recently-used eviction.
+
+    Parameters:
+    directory (str): Directory of the cache database (on local disk; SQLite
+        locking does not work on DBFS/FUSE mounts)
+    max_bytes (int): Size of the stored responses above which old entries are evicted
+    """
+
+    def __init__(self, directory: str = '.model_cache', max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'responses.sqlite')
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'saved_tokens': 0}
+
+    def get(self, request: Dict) -> Optional[CachedResponse]:
+        """Return the cached response for a request, or None."""
+        key = request_key(request)['key']
+        with self._lock:
+            row = self._db.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            self._db.execute('UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+            data = json.loads(row[0])
+            self._stats['hits'] += 1
+            usage = data.get('usage') or {}
+            self._stats['saved_tokens'] += (usage.get('prompt_tokens') or 0) + (usage.get('completion_tokens') or 0)
+        return CachedResponse.wrap(data)
+
+    def put(self, request: Dict, response) -> bool:
+        """
+        Store the response of a request.
+
+        Returns:
+        bool: False if the response is not cacheable (truncated, filtered or empty)
+        """
+        data = response_to_json(response)
+        if not is_cacheable(data):
+            return False
+        key = request_key(request)
+        text = json.dumps(data, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses (key, model, prompt_sha256, response, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key['key'], key['model'], key['prompt_sha256'], text, len(text.encode('utf-8')), now, now))
+            self._stats['stores'] += 1
+            self._evict()
+        return True
+
+    def _evict(self) -> None:
+        """Delete least recently used responses until the cache fits in max_bytes (lock held)."""
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% so a full cache does not evict on every store
+        target = self.max_bytes * 0.9
+        evicted = []
+        for key, size in self._db.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        self._stats['evictions'] += len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+
+    def stats(self) -> Dict:
+        """Hits, misses, hit rate, stores and evictions of this process; entries and bytes on disk."""
+        with self._lock:
+            entries, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats.update(entries=entries, bytes=size)
+        return stats
+
+    def print_stats(self) -> None:
+        s = self.stats()
+        print(f"Model response cache: {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.0%} hit rate), "
+              f"{s['saved_tokens']} tokens saved; {s['entries']} responses, {s['bytes'] / 2 ** 20:.1f} MiB "
+              f"({s['evictions']} evicted)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,319 @@
+"""
+Annotation of DDL column definitions with SAP field descriptions.
+
+`process_sql_string` adds `COMMENT('<SAP field description>')` to every line
+that looks like a column definition and whose field name is found in the
+field lookup (see field_lookup.py). Used by the end-to-end comment converter
+notebook and the batch converter.
+
+With structural=True (or DdlAnnotator directly) the SQL is tokenized once
+and only the column lists of CREATE TABLE statements are annotated: any
+number of statements, constraints skipped, columns that already have a
+COMMENT left alone, string literals and comments never touched. The result
+is collected in an AnnotationReport instead of being printed.
+"""
+
+import re
+import warnings
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from field_lookup import FieldLookup, find_field_description
+
+# Quoted text and comments, which are never annotated or searched
+_QUOTED = r"""'(?:[^'\\]|\\.)*(?:'|\Z)|"(?:[^"]|"")*(?:"|\Z)|`(?:[^`]|``)*(?:`|\Z)"""
+_COMMENTS = r"--[^\n]*|/\*.*?(?:\*/|\Z)"
+_NAME = r'\w+|"(?:[^"]|"")*"|`(?:[^`]|``)*`'
+
+# Outside the column lists: quoted text and comments are skipped, so only a
+# `CREATE [modifiers] TABLE [IF NOT EXISTS] name (` in code matches with a name
+_CREATE_TABLE_RE = re.compile(
+    rf"""{_COMMENTS}|{_QUOTED}
+      | \bCREATE\s+(?:(?:OR|REPLACE|GLOBAL|LOCAL|TEMPORARY|TEMP|EXTERNAL|COLUMN|ROW|VIRTUAL|TRANSIENT)\s+)*
+        TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?
+        (?P<name>(?:{_NAME})(?:\s*\.\s*(?:{_NAME}))*)\s*\(""",
+    re.IGNORECASE | re.DOTALL | re.VERBOSE)
+# Inside a column list: simple (...) groups such as DECIMAL(5, 0) in one match,
+# otherwise nesting (parentheses and the <...> of ARRAY, MAP and STRUCT types),
+# element separators, quoted text and comments
+_COLUMN_LIST_RE = re.compile(
+    rf"""(?P<group>\([^()'"`/-]*\))|(?P<angle>\b(?:ARRAY|MAP|STRUCT)\s*<)|[(),>]
+      | (?P<quoted>{_QUOTED})|(?P<comment>{_COMMENTS})""", re.IGNORECASE | re.DOTALL | re.VERBOSE)
+# One table element: leading comments, then the column name
+_COLUMN_NAME_RE = re.compile(rf"""\s*(?:(?:{_COMMENTS})\s*)*(?P<name>{_NAME})""", re.DOTALL)
+_NAME_PART_RE = re.compile(_NAME)
+_STRING_RE = re.compile(_QUOTED, re.DOTALL)
+_COMMENT_CLAUSE_RE = re.compile(r'\bCOMMENT\b', re.IGNORECASE)
+
+# Table elements starting with these are constraints, not columns
+_CONSTRAINT_KEYWORDS = frozenset(['CONSTRAINT', 'PRIMARY', 'FOREIGN', 'UNIQUE', 'CHECK', 'KEY', 'INDEX',
+                                  'PERIOD', 'LIKE'])
+
+# Column annotation statuses
+ADDED = 'added'
+MISSING = 'missing'
+EXISTING = 'existing'
+
+
+class ColumnAnnotation(NamedTuple):
+    table: str
+    column: str
+    data_type: str
+    status: str  # ADDED, MISSING or EXISTING
+    description: Optional[str] = None
+
+
+class AnnotationReport:
+    """
+    Result of annotating SQL: the tables found and one entry per column definition.
+
+    Usage:
+        sql, report = DdlAnnotator(field_lookup).annotate(sql)
+        print(report.comments_added, report.missing_fields)
+    """
+
+    def __init__(self):
+        self.tables: List[str] = []
+        self.columns: List[ColumnAnnotation] = []
+
+    def _count(self, status: str) -> int:
+        return sum(1 for column in self.columns if column.status == status)
+
+    @property
+    def comments_added(self) -> int:
+        return self._count(ADDED)
+
+    @property
+    def existing_comments(self) -> int:
+        return self._count(EXISTING)
+
+    @property
+    def fields_processed(self) -> int:
+        return len(self.columns)
+
+    @property
+    def missing_fields(self) -> List[str]:
+        """Column names without a description, in order of appearance."""
+        return [column.column for column in self.columns if column.status == MISSING]
+
+    def extend(self, other: 'AnnotationReport') -> None:
+        """Append the tables and columns of another report."""
+        self.tables.extend(other.tables)
+        self.columns.extend(other.columns)
+
+    def summary(self) -> Dict:
+        """Counts of the report as a JSON-friendly dict."""
+        return {
+            'tables': len(self.tables),
+            'fields_processed': self.fields_processed,
+            'comments_added': self.comments_added,
+            'existing_comments': self.existing_comments,
+            'missing_fields': len(self.missing_fields)
+        }
+
+
+def _unquote(name: str) -> str:
+    """Return the name inside a "quoted" or `quoted` identifier."""
+    if len(name) >= 2 and name[0] in '"`' and name[-1] == name[0]:
+        return name[1:-1].replace(name[0] * 2, name[0])
+    return name
+
+
+def _sql_string(text: str) -> str:
+    """Quote text as a SQL string literal (backslash escapes, as in Databricks SQL)."""
+    return "'" + text.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+class DdlAnnotator:
+    """
+    Adds COMMENT('<SAP field description>') to the columns of CREATE TABLE statements.
+
+    Only the comment is inserted after each column definition; the rest of
+    the SQL, including its layout, is returned unchanged. The text is
+    scanned once with precompiled patterns.
+    """
+
+    def __init__(self, field_lookup: Dict[str, str]):
+        # Indexed lookups (see FieldLookup) instead of a scan per unknown field
+        self.field_lookup = field_lookup if isinstance(field_lookup, FieldLookup) else FieldLookup(field_lookup or {})
+
+    def annotate(self, sql_content: str) -> Tuple[str, AnnotationReport]:
+        """
+        Annotate every CREATE TABLE column list in `sql_content`.
+
+        Returns:
+        tuple: (annotated SQL, AnnotationReport)
+        """
+        report = AnnotationReport()
+        insertions: List[Tuple[int, str]] = []  # (position, comment clause), ascending
+
+        pos = 0
+        while True:
+            match = _CREATE_TABLE_RE.search(sql_content, pos)
+            if not match:
+                break
+            pos = match.end()
+            if match.group('name'):
+                table = '.'.join(_unquote(part) for part in _NAME_PART_RE.findall(match.group('name')))
+                report.tables.append(table)
+                pos = self._annotate_columns(sql_content, pos, table, insertions, report)
+
+        if not insertions:
+            return sql_content, report
+        pieces = []
+        last = 0
+        for position, clause in insertions:
+            pieces.append(sql_content[last:position])
+            pieces.append(clause)
+            last = position
+        pieces.append(sql_content[last:])
+        return ''.join(pieces), report
+
+    def _annotate_columns(self, sql: str, pos: int, table: str, insertions: List[Tuple[int, str]],
+                          report: AnnotationReport) -> int:
+        """Annotate the column list starting at `pos` (after its '('); return the position after its ')'."""
+        depth = 1
+        angle_depth = 0  # open ARRAY<, MAP< and STRUCT< brackets; '>' outside them is an operator
+        element_start = pos
+        code_end = pos  # end of the element's last character that is not whitespace or a comment
+        for match in _COLUMN_LIST_RE.finditer(sql, pos):
+            code = sql[pos:match.start()].rstrip()
+            if code:
+                code_end = pos + len(code)
+            pos = match.end()
+            if match.lastgroup == 'comment':
+                continue
+            if match.lastgroup in ('quoted', 'group'):
+                code_end = match.end()
+                continue
+
+            if match.lastgroup == 'angle':
+                angle_depth += 1
+                code_end = match.end()
+                continue
+
+            char = match.group()
+            if char == '>':
+                angle_depth = max(angle_depth - 1, 0)
+            elif char == '(':
+                depth += 1
+            elif char == ',' and depth == 1 and angle_depth == 0 or char == ')' and depth == 1:
+                self._annotate_column(sql, element_start, code_end, table, insertions, report)
+                if char == ')':
+                    return pos
+                element_start = code_end = pos
+                continue
+            elif char == ')':
+                depth -= 1
+            code_end = match.end()
+
+        # Unterminated column list
+        code = sql[pos:].rstrip()
+        if code:
+            code_end = pos + len(code)
+        self._annotate_column(sql, element_start, code_end, table, insertions, report)
+        return len(sql)
+
+    def _annotate_column(self, sql: str, start: int, end: int, table: str, insertions: List[Tuple[int, str]],
+                         report: AnnotationReport) -> None:
+        """Annotate the table element sql[start:end] if it is a column definition."""
+        match = _COLUMN_NAME_RE.match(sql, start, end)
+        if not match:
+            return
+        name = match.group('name')
+        data_type = sql[match.end():end].strip()
+        if not data_type or name.upper() in _CONSTRAINT_KEYWORDS:
+            return  # a bare name without a data type, or a constraint
+
+        column = _unquote(name)
+        if 'COMMENT' in data_type.upper() and _COMMENT_CLAUSE_RE.search(_STRING_RE.sub("''", data_type)):
+            report.columns.append(ColumnAnnotation(table, column, data_type, EXISTING))
+            return
+
+        description = find_field_description(column, self.field_lookup)
+        if description:
+            insertions.append((end, f" COMMENT({_sql_string(description)})"))
+            report.columns.append(ColumnAnnotation(table, column, data_type, ADDED, description))
+        else:
+            report.columns.append(ColumnAnnotation(table, column, data_type, MISSING))
+
+
+def annotate_ddl(sql_content: str, field_lookup: Dict[str, str]) -> Tuple[str, AnnotationReport]:
+    """
+    Structural annotation of the CREATE TABLE statements in `sql_content` (see DdlAnnotator).
+
+    Returns:
+    tuple: (annotated SQL, AnnotationReport)
+    """
+    return DdlAnnotator(field_lookup).annotate(sql_content)
+
+
+def process_sql_string(sql_content: str, field_lookup: Dict[str, str],
+                       verbose: bool = True, structural: bool = False) -> Tuple[str, int, int]:
+    """
+    Process the SQL string and add comments with SAP field descriptions.
+
+    Args:
+        sql_content: The SQL content as a string
+        field_lookup: Dictionary mapping field names to descriptions
+        verbose: Print a line per field definition (line mode) or the report summary (structural mode)
+        structural: Only annotate CREATE TABLE column lists (see annotate_ddl)
+
+    Returns:
+        Tuple of (processed SQL string, comments added count, fields processed count)
+    """
+    if not sql_content.strip():
+        warnings.warn("Empty SQL content provided")
+        return sql_content, 0, 0
+
+    if structural:
+        sql_content, report = annotate_ddl(sql_content, field_lookup)
+        if verbose:
+            print(f"✓ Annotated {len(report.tables)} tables: {report.summary()}")
+        return sql_content, report.comments_added, report.fields_processed
+
+    lines = sql_content.split('\n')
+    output_lines = []
+    comments_added = 0
+    fields_processed = 0
+
+    for line in lines:
+        original_line = line.rstrip()
+
+        # Check if this line contains a field definition
+        # Pattern: field_name followed by data type, optionally ending with comma
+        field_match = re.match(r'\s*(\w+)\s+(.+?)(?:,\s*)?$', line.strip())
+
+        if field_match:
+            field_name = field_match.group(1)
+            data_type = field_match.group(2).rstrip(',').strip()
+            fields_processed += 1
+
+            description = find_field_description(field_name, field_lookup)
+
+            if description:
+                # Add COMMENT() syntax with SAP field description
+                # Get the original indentation
+                indent = len(original_line) - len(original_line.lstrip())
+                indent_str = ' ' * indent
+
+                if original_line.endswith(','):
+                    # Format: field_name DATA_TYPE COMMENT(description),
+                    commented_line = f"{indent_str}{field_name:<18} {data_type} COMMENT('{description}'),"
+                else:
+                    # Format: field_name DATA_TYPE COMMENT(description)
+                    commented_line = f"{indent_str}{field_name:<18} {data_type} COMMENT('{description}')"
+
+                output_lines.append(commented_line)
+                comments_added += 1
+                if verbose:
+                    print(f"✓ Added comment for {field_name}: {description}")
+            else:
+                # No description found, keep original line
+                output_lines.append(original_line)
+                if verbose:
+                    print(f"⚠ No description found for field: {field_name}")
+        else:
+            # Not a field definition line, keep as is
+            output_lines.append(original_line)
+
+    return '\n'.join(output_lines), comments_added, fields_processed
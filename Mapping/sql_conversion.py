@@ -0,0 +1,275 @@
+"""
+Conversion of SAP-converted SQL text into Databricks notebook source.
+
+The text steps of `process_sql_file` and `create_databricks_notebook`
+(mapping_script.py) as functions on strings, so the notebook and the batch
+converter (convert_sql_files.py) produce byte-identical output:
+
+    content = rewrite_sql(content, field_mappings, table_mappings, rewriter)
+    processed_content, num_statements = format_spark_sql(content)
+    notebook_content, num_cells = build_notebook(processed_content)
+
+For very large files iter_sql_statements reads the SQL in chunks and splits
+it into statements on ';' outside string literals, quoted identifiers and
+comments, and the notebook_cell/write_notebook_* helpers write cells as they
+go, so peak memory is bounded by the largest statement instead of several
+copies of the file. sql_pipeline.py chains these steps.
+"""
+
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from excel_ingest import extract_sql_mappings
+from sql_rewriter import FieldRewriter, SqlRewriter
+
+# Statements in the converted SQL files are separated by ';' and a blank line
+STATEMENT_SEPARATOR_RE = re.compile(r';\s*\n\s*\n')
+
+SPARK_SQL_PREFIX = 'spark.sql("""'
+
+NOTEBOOK_HEADER = [
+    "# Databricks notebook source",
+    "# MAGIC %md",
+    "# MAGIC # Converted SQL Statements for Databricks",
+    "# MAGIC This notebook contains SQL statements converted from SAP field names to DBX field names",
+    ""
+]
+
+NOTEBOOK_CELL_SEPARATOR = "# COMMAND ----------"
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# Outside quotes and comments: statement end, quote or comment start
+_STATEMENT_SPECIAL_RE = re.compile(r"""[;'"`]|--|/\*""")
+# Inside a '...' literal: backslash escape or closing quote (as in sql_lexer)
+_STRING_SPECIAL_RE = re.compile(r"[\\']")
+# Terminator of the other quoted/comment states
+_STATE_CLOSERS = {'"': '"', '`': '`', '--': '\n', '/*': '*/'}
+
+
+def compile_mappings(field_mapping: Dict) -> Dict:
+    """
+    Compile a field mapping into everything the SQL steps need.
+
+    Parameters:
+    field_mapping (dict): Field mapping as built by read_field_mapping
+
+    Returns:
+    dict: field_mapping, field_mappings, table_mappings and rewriter, or {} for an empty mapping
+    """
+    if not field_mapping:
+        return {}
+
+    field_mappings, table_mappings = extract_sql_mappings(field_mapping)
+    return {
+        'field_mapping': field_mapping,
+        'field_mappings': field_mappings,
+        'table_mappings': table_mappings,
+        'rewriter': SqlRewriter(field_mappings, table_mappings)
+    }
+
+
+def make_sql_rewriter(field_mappings: Dict[str, str], table_mappings: Dict[str, str],
+                      rewriter: Optional[SqlRewriter] = None, token_aware: bool = True) -> Callable[[str], str]:
+    """
+    Return a function that replaces SAP field and table names with their DBX names.
+
+    Parameters:
+    rewriter (SqlRewriter): Precompiled rewriter for the mappings (token-aware mode only)
+    token_aware (bool): Skip string literals, comments and qualified names; otherwise
+        replace field names case-insensitively and table names as plain text
+    """
+    if token_aware:
+        # Replace field and table names in one pass over the SQL tokens
+        return (rewriter or SqlRewriter(field_mappings, table_mappings)).rewrite
+
+    field_rewriter = FieldRewriter(field_mappings)
+
+    def rewrite(content: str) -> str:
+        # Replace field names (case-insensitive, single pass over the text)
+        content = field_rewriter.rewrite(content)
+
+        # Replace table names
+        for sap_table, dbx_table in table_mappings.items():
+            content = content.replace(sap_table, dbx_table)
+        return content
+
+    return rewrite
+
+
+def rewrite_sql(content: str, field_mappings: Dict[str, str], table_mappings: Dict[str, str],
+                rewriter: Optional[SqlRewriter] = None, token_aware: bool = True) -> str:
+    """
+    Replace SAP field and table names with their DBX names (see make_sql_rewriter).
+
+    Returns:
+    str: The rewritten SQL
+    """
+    return make_sql_rewriter(field_mappings, table_mappings, rewriter, token_aware)(content)
+
+
+def split_sql_statements(content: str) -> List[str]:
+    """Split SQL text into statements, each stripped and terminated by ';'."""
+    statements = []
+    for statement in STATEMENT_SEPARATOR_RE.split(content.strip()):
+        statement = statement.strip()
+        if statement:
+            if not statement.endswith(';'):
+                statement += ';'
+            statements.append(statement)
+    return statements
+
+
+def wrap_spark_sql(statement: str) -> str:
+    """Wrap one SQL statement in a spark.sql() call."""
+    return f'{SPARK_SQL_PREFIX}\n{statement}\n""")'
+
+
+def format_spark_sql(content: str) -> Tuple[str, int]:
+    """
+    Format SQL text as spark.sql() calls, one per statement.
+
+    Returns:
+    tuple: (processed content, number of statements)
+    """
+    formatted_statements = [wrap_spark_sql(statement) for statement in split_sql_statements(content)]
+    return '\n\n'.join(formatted_statements), len(formatted_statements)
+
+
+def build_notebook(processed_content: str) -> Tuple[str, int]:
+    """
+    Turn spark.sql() formatted content into Databricks notebook source, one cell per call.
+
+    Returns:
+    tuple: (notebook content, number of spark.sql statements)
+    """
+    # Split content by spark.sql statements
+    statements = processed_content.split(SPARK_SQL_PREFIX)
+
+    notebook_content = list(NOTEBOOK_HEADER)
+    for i, statement in enumerate(statements):
+        if statement.strip() and i > 0:  # Skip first empty part
+            notebook_content.extend([
+                NOTEBOOK_CELL_SEPARATOR,
+                "",
+                SPARK_SQL_PREFIX + statement.strip(),
+                ""
+            ])
+
+    return '\n'.join(notebook_content), len(statements) - 1
+
+
+def read_chunks(f: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """Yield the contents of an open text file in chunks of chunk_size characters."""
+    return iter(lambda: f.read(chunk_size), '')
+
+
+def iter_sql_statements(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Split SQL text, given as chunks, into statements on ';' outside string
+    literals, quoted identifiers and comments.
+
+    Each statement is yielded unchanged, with the whitespace and comments
+    before it and its terminating ';'. Text after the last ';' is yielded as
+    a final statement unless it is blank. Only the current statement and
+    chunk are held in memory.
+    """
+    buffer = ''
+    start = 0  # start of the current statement in buffer
+    pos = 0  # scan position in buffer
+    state = None  # None or the quote/comment opener we are inside of
+
+    for chunk in chunks:
+        buffer = buffer[start:] + chunk
+        pos -= start
+        start = 0
+
+        while True:
+            if state is None:
+                match = _STATEMENT_SPECIAL_RE.search(buffer, pos)
+                if not match:
+                    # A trailing '-' or '/' may open a comment with the next chunk
+                    pos = len(buffer) - 1 if buffer.endswith(('-', '/')) else len(buffer)
+                    pos = max(pos, start)
+                    break
+                if match.group() == ';':
+                    yield buffer[start:match.end()]
+                    start = match.end()
+                else:
+                    state = match.group()
+                pos = match.end()
+            elif state == "'":
+                match = _STRING_SPECIAL_RE.search(buffer, pos)
+                if not match:
+                    pos = len(buffer)
+                    break
+                if match.group() == '\\':
+                    if match.end() == len(buffer):
+                        # The escaped character is in the next chunk
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                else:
+                    state = None
+                    pos = match.end()
+            else:
+                closer = _STATE_CLOSERS[state]
+                end = buffer.find(closer, pos)
+                if end < 0:
+                    pos = max(pos, len(buffer) - len(closer) + 1)
+                    break
+                state = None
+                pos = end + len(closer)
+
+    if buffer[start:].strip():
+        yield buffer[start:]
+
+
+def iter_marker_blocks(chunks: Iterable[str], marker: str = SPARK_SQL_PREFIX) -> Iterator[str]:
+    """
+    Split text, given as chunks, on `marker` like str.split, one block at a time.
+
+    Used to read spark.sql() formatted files back without loading them whole.
+    """
+    buffer = ''
+    for chunk in chunks:
+        # The marker may straddle the previous chunk boundary
+        search_from = max(len(buffer) - len(marker) + 1, 0)
+        buffer += chunk
+        end = buffer.find(marker, search_from)
+        while end >= 0:
+            yield buffer[:end]
+            buffer = buffer[end + len(marker):]
+            end = buffer.find(marker)
+    yield buffer
+
+
+def notebook_cell(statement: str) -> str:
+    """Notebook cell for one statement, as build_notebook renders it."""
+    return f'{SPARK_SQL_PREFIX}{statement}\n""")'
+
+
+def write_notebook_header(out: TextIO) -> None:
+    """Write the notebook header; cells follow through write_notebook_cell."""
+    out.write('\n'.join(NOTEBOOK_HEADER))
+
+
+def write_notebook_cell(out: TextIO, cell: str) -> None:
+    """Append one cell (see notebook_cell) to a notebook started by write_notebook_header."""
+    out.write('\n' + '\n'.join([NOTEBOOK_CELL_SEPARATOR, "", cell, ""]))
+
+
+def stream_notebook(chunks: Iterable[str], notebook_out: TextIO) -> int:
+    """
+    Streaming build_notebook: read spark.sql() formatted text in chunks and write the notebook.
+
+    Returns:
+    int: Number of spark.sql statements
+    """
+    write_notebook_header(notebook_out)
+    num_statements = -1
+    for i, block in enumerate(iter_marker_blocks(chunks)):
+        if block.strip() and i > 0:  # Skip first empty part
+            write_notebook_cell(notebook_out, SPARK_SQL_PREFIX + block.strip())
+        num_statements += 1
+    return num_statements
@@ -0,0 +1,437 @@
+"""
+Dependency-ordered parallel execution of SQL files.
+
+execute_sql_statements.ipynb split every file with sql_code.split(";"),
+which also splits on semicolons inside string literals and comments, and
+ran the statements one after another through spark.sql. Files of
+converted dataflows are mostly chains of CREATE OR REPLACE TEMPORARY VIEW
+statements (or SQLScript table variables, `IT_X = SELECT ... FROM :IT_Y`),
+of which many do not depend on each other.
+
+plan_sql splits the text on ';' outside literals and comments
+(sql_conversion.iter_sql_statements), finds the names every statement
+defines or writes and the names it reads (sql_lexer tokens), and orders
+the statements by those names:
+
+- a statement that reads a name runs after the last statement writing it
+- a statement that writes a name runs after the last statement writing it
+  and after every statement reading it since
+- a view (or table variable) reads its sources whenever it is used, so a
+  statement reading a view also counts as reading the names the view reads
+- statements the planner does not understand (USE, SET, ...) are barriers:
+  they run after everything before them and before everything after them
+
+execute_plan runs the plan on a JobScheduler (job_scheduler.py): every
+statement starts as soon as the statements it depends on are done, the
+ones with the longest chain of statements after them first, and a failed
+statement skips only the statements that depend on it. The report gives
+the time of every statement, the wall time against the serial time and the
+critical path, the chain of dependent statements that bounds the wall time.
+
+Executors are pluggable: SparkExecutor runs statements through spark.sql,
+SqliteExecutor runs them on a local SQLite database (temporary views
+become views, SQLScript assignments become views) for tests and local runs.
+
+Usage:
+    plan = plan_sql(sql_code)
+    report = execute_plan(plan, SparkExecutor(spark), max_workers=8)
+    report.print_summary()
+
+    python sql_executor.py file.sql [--sqlite db.sqlite] [--workers 8] [--plan-only]
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from instrumentation import run_log
+from job_scheduler import DONE, FAILED, SKIPPED, JobScheduler
+from sql_conversion import iter_sql_statements
+from sql_lexer import COMMENT, NAME_KINDS, PUNCT, WHITESPACE, name_text, tokenize
+
+# Statement kinds
+CREATE = 'create'  # CREATE [OR REPLACE] [TEMPORARY] VIEW/TABLE name
+ASSIGN = 'assign'  # SQLScript table variable: name = SELECT ...
+WRITE = 'write'  # INSERT/MERGE/UPDATE/DELETE/DROP/ALTER on a name
+QUERY = 'query'  # SELECT / WITH: reads only
+BARRIER = 'barrier'  # anything else
+
+_CREATE_MODIFIERS = {'OR', 'REPLACE', 'GLOBAL', 'TEMPORARY', 'TEMP', 'MATERIALIZED', 'EXTERNAL', 'STREAMING', 'LIVE'}
+_CREATE_OBJECTS = {'VIEW', 'TABLE'}
+_IF_CLAUSE = {'IF', 'NOT', 'EXISTS'}
+_WRITE_INTRO = {
+    'INSERT': {'INTO', 'OVERWRITE', 'TABLE'},
+    'MERGE': {'INTO'},
+    'UPDATE': set(),
+    'DELETE': {'FROM'},
+    'DROP': {'VIEW', 'TABLE', 'IF', 'EXISTS', 'TEMPORARY'},
+    'ALTER': {'VIEW', 'TABLE'},
+    'TRUNCATE': {'TABLE'},
+}
+_QUERY_INTRO = {'SELECT', 'WITH'}
+
+
+class SqlStatement(NamedTuple):
+    index: int
+    text: str  # without the terminating ';'
+    kind: str
+    target: Optional[str]  # name defined or written (lower case), if any
+    reads: Tuple[str, ...]  # names referenced (lower case)
+    body_start: int  # offset of the defining query in text (after AS / '='); 0 if none
+
+
+class ExecutionPlan(NamedTuple):
+    statements: List[SqlStatement]
+    deps: List[Tuple[int, ...]]  # indexes of the statements each statement waits for
+
+    def waves(self) -> List[List[int]]:
+        """Statements grouped by the earliest wave they can run in."""
+        level = []
+        for index in range(len(self.statements)):
+            level.append(1 + max((level[dep] for dep in self.deps[index]), default=-1))
+        waves = [[] for _ in range(max(level, default=-1) + 1)]
+        for index, wave in enumerate(level):
+            waves[wave].append(index)
+        return waves
+
+    def critical_path(self, seconds: Optional[Sequence[float]] = None) -> Tuple[List[int], float]:
+        """
+        The chain of dependent statements with the largest total time.
+
+        Parameters:
+        seconds (list): Time per statement; default 1 per statement (longest chain)
+
+        Returns:
+        tuple: (statement indexes in execution order, total time)
+        """
+        weights = list(seconds) if seconds is not None else [1.0] * len(self.statements)
+        finish: List[float] = []
+        previous: List[Optional[int]] = []
+        for index in range(len(self.statements)):
+            before = max(self.deps[index], key=lambda dep: finish[dep], default=None)
+            finish.append(weights[index] + (finish[before] if before is not None else 0.0))
+            previous.append(before)
+        if not finish:
+            return [], 0.0
+        index = max(range(len(finish)), key=finish.__getitem__)
+        total = finish[index]
+        path = []
+        while index is not None:
+            path.append(index)
+            index = previous[index]
+        return path[::-1], total
+
+    def remaining(self) -> List[float]:
+        """Length (in statements) of the longest chain starting at each statement."""
+        dependents: List[List[int]] = [[] for _ in self.statements]
+        for index, deps in enumerate(self.deps):
+            for dep in deps:
+                dependents[dep].append(index)
+        length = [0.0] * len(self.statements)
+        for index in reversed(range(len(self.statements))):
+            length[index] = 1 + max((length[d] for d in dependents[index]), default=0)
+        return length
+
+
+class StatementResult(NamedTuple):
+    index: int
+    status: str  # job_scheduler status: done, failed or skipped
+    seconds: float
+    error: Optional[str] = None
+
+
+class ExecutionReport(NamedTuple):
+    plan: ExecutionPlan
+    results: List[StatementResult]
+    wall_seconds: float
+
+    @property
+    def failed(self) -> List[StatementResult]:
+        return [result for result in self.results if result.status != DONE]
+
+    @property
+    def serial_seconds(self) -> float:
+        return sum(result.seconds for result in self.results)
+
+    def critical_path(self) -> Tuple[List[int], float]:
+        return self.plan.critical_path([result.seconds for result in self.results])
+
+    def print_summary(self, top: int = 5) -> None:
+        statements = self.plan.statements
+        path, path_seconds = self.critical_path()
+        counts = {status: sum(1 for r in self.results if r.status == status) for status in (DONE, FAILED, SKIPPED)}
+        print(f"{len(statements)} statements in {len(self.plan.waves())} waves: {counts[DONE]} done, "
+              f"{counts[FAILED]} failed, {counts[SKIPPED]} skipped; wall time {self.wall_seconds:.2f}s, "
+              f"serial time {self.serial_seconds:.2f}s")
+        print(f"Critical path: {len(path)} statements, {path_seconds:.2f}s")
+        for index in sorted(path, key=lambda i: -self.results[i].seconds)[:top]:
+            print(f"  #{index + 1} {self.results[index].seconds:.2f}s {describe(statements[index])}")
+        for result in self.failed:
+            print(f"  #{result.index + 1} {result.status}: {result.error}")
+
+
+def describe(statement: SqlStatement) -> str:
+    """Kind and target of a statement, or its first line."""
+    if statement.target:
+        return f"{statement.kind} {statement.target}"
+    first_line = next((line.strip() for line in statement.text.splitlines() if line.strip()), '')
+    return first_line[:80]
+
+
+def _parse_tokens(text: str) -> List[Tuple[str, str, int, int]]:
+    """Significant tokens of a statement as (kind, text, start, end); dotted names are merged into one name token."""
+    tokens = []
+    offset = 0
+    for token in tokenize(text):
+        start, offset = offset, offset + len(token.text)
+        if token.kind in (WHITESPACE, COMMENT):
+            continue
+        if (token.kind in NAME_KINDS and len(tokens) >= 2 and tokens[-1][1] == '.'
+                and tokens[-2][0] == 'name' and tokens[-1][3] == start):
+            _, dotted, name_start, _ = tokens[-2]
+            tokens[-2:] = [('name', f"{dotted}.{name_text(token)}", name_start, offset)]
+        elif token.kind in NAME_KINDS:
+            tokens.append(('name', name_text(token), start, offset))
+        else:
+            tokens.append((token.kind, token.text, start, offset))
+    return tokens
+
+
+def parse_statement(index: int, text: str) -> SqlStatement:
+    """Classify one statement and find the name it defines or writes and the names it reads."""
+    tokens = _parse_tokens(text)
+    words = [(kind, value.upper() if kind == 'name' else value) for kind, value, _, _ in tokens]
+    position = 0
+    # A SQLScript block start before the first statement
+    while position < len(words) and words[position] == ('name', 'BEGIN'):
+        position += 1
+
+    kind, target, target_at, body_start = BARRIER, None, None, 0
+    first = words[position][1] if position < len(words) else ''
+    if first == 'CREATE':
+        cursor = position + 1
+        while cursor < len(words) and words[cursor][1] in _CREATE_MODIFIERS:
+            cursor += 1
+        if cursor < len(words) and words[cursor][1] in _CREATE_OBJECTS:
+            cursor += 1
+            while cursor < len(words) and words[cursor][1] in _IF_CLAUSE:
+                cursor += 1
+            if cursor < len(words) and words[cursor][0] == 'name':
+                kind, target_at = CREATE, cursor
+                as_at = next((i for i in range(cursor + 1, len(words)) if words[i][1] == 'AS'), None)
+                body_start = tokens[as_at][3] if as_at is not None else 0
+    elif first in _WRITE_INTRO:
+        cursor = position + 1
+        while cursor < len(words) and words[cursor][1] in _WRITE_INTRO[first]:
+            cursor += 1
+        if cursor < len(words) and words[cursor][0] == 'name':
+            kind, target_at = WRITE, cursor
+    elif first in _QUERY_INTRO:
+        kind = QUERY
+    elif (position + 1 < len(words) and words[position][0] == 'name'
+          and words[position + 1] == (PUNCT, '=')):
+        kind, target_at, body_start = ASSIGN, position, tokens[position + 1][3]
+
+    if target_at is not None:
+        target = tokens[target_at][1].lower()
+    reads = tuple(dict.fromkeys(value.lower() for i, (token_kind, value, _, _) in enumerate(tokens)
+                                if token_kind == 'name' and i != target_at and i >= position))
+    return SqlStatement(index, text, kind, target, reads, body_start)
+
+
+def split_sql(sql_code: str) -> List[str]:
+    """Statements of a SQL text, split on ';' outside literals and comments, without the ';'."""
+    statements = []
+    for statement in iter_sql_statements([sql_code]):
+        statement = statement.strip()
+        if statement.endswith(';'):
+            statement = statement[:-1].rstrip()
+        if any(token[0] not in (WHITESPACE, COMMENT) for token in tokenize(statement)):
+            statements.append(statement)
+    return statements
+
+
+def plan_sql(sql_code: str) -> ExecutionPlan:
+    """Parse a SQL text and order its statements by the names they read and write."""
+    return plan_statements([parse_statement(index, text) for index, text in enumerate(split_sql(sql_code))])
+
+
+def _defines_view(statement: SqlStatement) -> bool:
+    """True for statements that define a view or table variable, which read their sources when they are used."""
+    if statement.kind == ASSIGN:
+        return True
+    if statement.kind != CREATE:
+        return False
+    header = statement.text[:statement.body_start or len(statement.text)].upper()
+    return bool(re.search(r'\bVIEW\b', header)) and not re.search(r'\bMATERIALIZED\b', header)
+
+
+def plan_statements(statements: List[SqlStatement]) -> ExecutionPlan:
+    written = {statement.target for statement in statements if statement.target}
+    view_reads: Dict[str, Tuple[str, ...]] = {}  # view -> names it reads, through other views too
+    last_writer: Dict[str, int] = {}
+    readers: Dict[str, List[int]] = {}
+    last_barrier: Optional[int] = None
+    since_barrier: List[int] = []
+    deps: List[Tuple[int, ...]] = []
+
+    for statement in statements:
+        index = statement.index
+        # a statement reading a view reads the view's sources when it runs
+        reads = tuple(dict.fromkeys(expanded for name in statement.reads
+                                    for expanded in (name,) + view_reads.get(name, ())))
+        waits: Set[int] = set()
+        if statement.kind == BARRIER:
+            waits.update(since_barrier)
+        elif last_barrier is not None:
+            waits.add(last_barrier)
+        for name in reads:
+            if name in written and name in last_writer:
+                waits.add(last_writer[name])
+        if statement.target:
+            if statement.target in last_writer:
+                waits.add(last_writer[statement.target])
+            waits.update(readers.get(statement.target, []))
+        waits.discard(index)
+        deps.append(tuple(sorted(waits)))
+
+        for name in reads:
+            if name in written and name != statement.target:
+                readers.setdefault(name, []).append(index)
+        if statement.target:
+            if _defines_view(statement):
+                view_reads[statement.target] = tuple(name for name in reads if name != statement.target)
+            elif statement.kind == CREATE:
+                view_reads.pop(statement.target, None)
+            last_writer[statement.target] = index
+            readers[statement.target] = []
+        if statement.kind == BARRIER:
+            last_barrier, since_barrier = index, [index]
+        else:
+            since_barrier.append(index)
+    return ExecutionPlan(statements, deps)
+
+
+def _strip_variable_prefix(sql: str) -> str:
+    """Drop the ':' of SQLScript table variable references (`FROM :IT_X`), outside literals and comments."""
+    tokens = list(tokenize(sql))
+    return ''.join(token.text for token, following in zip(tokens, tokens[1:] + [None])
+                   if not (token.kind == PUNCT and token.text == ':' and following is not None
+                           and following.kind in NAME_KINDS))
+
+
+class SparkExecutor:
+    """Runs statements through spark.sql (temporary views are shared by the session's threads)."""
+
+    def __init__(self, spark):
+        self.spark = spark
+
+    def execute(self, statement: SqlStatement) -> None:
+        self.spark.sql(statement.text)
+
+
+class SqliteExecutor:
+    """
+    Runs statements on a SQLite database, one connection per thread.
+
+    Temporary views and tables become plain ones (SQLite's temporary objects
+    are private to a connection), CREATE OR REPLACE drops the old object
+    first and SQLScript assignments become views.
+
+    Parameters:
+    path (str): Database file; default a new temporary file
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.sqlite')
+            os.close(fd)
+        self.path = path
+        self._local = threading.local()
+        with sqlite3.connect(path) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        return connection
+
+    @staticmethod
+    def translate(statement: SqlStatement) -> str:
+        """The statement in SQLite's dialect."""
+        if statement.kind == ASSIGN:
+            body = _strip_variable_prefix(statement.text[statement.body_start:])
+            return f'DROP VIEW IF EXISTS "{statement.target}"; CREATE VIEW "{statement.target}" AS {body}'
+        if statement.kind == CREATE and statement.body_start:
+            header = statement.text[:statement.body_start].upper()
+            obj = 'VIEW' if re.search(r'\bVIEW\b', header) else 'TABLE'
+            body = _strip_variable_prefix(statement.text[statement.body_start:])
+            drop = f'DROP {obj} IF EXISTS "{statement.target}"; ' if re.search(r'\bREPLACE\b', header) else ''
+            return f'{drop}CREATE {obj} "{statement.target}" AS {body}'
+        return _strip_variable_prefix(statement.text)
+
+    def execute(self, statement: SqlStatement) -> None:
+        self._connection().executescript(self.translate(statement))
+
+
+def execute_plan(plan: ExecutionPlan, executor, max_workers: int = 8, log=run_log) -> ExecutionReport:
+    """
+    Run the statements of a plan in dependency order, independent statements concurrently.
+
+    Parameters:
+    plan (ExecutionPlan): From plan_sql
+    executor: Object with execute(SqlStatement), e.g. SparkExecutor or SqliteExecutor
+    max_workers (int): Statements run at the same time
+
+    Returns:
+    ExecutionReport
+    """
+    def run(task, statement: SqlStatement) -> None:
+        log.debug("Executing SQL statement #%d: %s", statement.index + 1, describe(statement))
+        executor.execute(statement)
+
+    def key(index: int) -> str:
+        return f"#{index + 1}"
+
+    scheduler = JobScheduler(max_workers=max_workers, log=log)
+    remaining = plan.remaining()
+    for statement in plan.statements:
+        scheduler.add(key(statement.index), run, statement,
+                      deps=[key(dep) for dep in plan.deps[statement.index]], priority=remaining[statement.index])
+    start = time.perf_counter()
+    task_results = scheduler.run()
+    wall_seconds = time.perf_counter() - start
+    results = []
+    for statement in plan.statements:
+        task = task_results[key(statement.index)]
+        results.append(StatementResult(statement.index, task.status, task.seconds, task.error))
+    return ExecutionReport(plan, results, wall_seconds)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plan and run SQL files in dependency order")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--sqlite', default=None, help="SQLite database to run on (default: a temporary file)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--plan-only', action='store_true', help="Only print the plan")
+    args = parser.parse_args()
+
+    for sql_file in args.files:
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            sql_plan = plan_sql(f.read())
+        waves = sql_plan.waves()
+        chain, length = sql_plan.critical_path()
+        print(f"{sql_file}: {len(sql_plan.statements)} statements, {len(waves)} waves "
+              f"(widest {max(map(len, waves), default=0)}), longest chain {int(length)} statements")
+        if args.plan_only:
+            for statement, deps in zip(sql_plan.statements, sql_plan.deps):
+                print(f"  #{statement.index + 1} {describe(statement)} <- {[dep + 1 for dep in deps]}")
+            continue
+        execute_plan(sql_plan, SqliteExecutor(args.sqlite), args.workers).print_summary()
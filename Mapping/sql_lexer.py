@@ -0,0 +1,94 @@
+"""
+Lightweight SQL lexer for the Mapping scripts.
+
+The lexer splits SQL text into identifier, quoted identifier, string literal,
+comment, number, whitespace and punctuation tokens in one linear scan. It is
+not a parser: it only knows enough about the SQL dialects we convert (HANA
+SQLScript and Databricks SQL) to tell code apart from literals and comments,
+so that rewrites never touch text inside quotes or comments.
+
+Concatenating the text of all tokens always gives back the original input.
+"""
+
+import re
+from typing import Iterator, NamedTuple, Optional
+
+# Token kinds
+IDENT = 'ident'
+QUOTED_IDENT = 'quoted_ident'
+STRING = 'string'
+COMMENT = 'comment'
+NUMBER = 'number'
+WHITESPACE = 'whitespace'
+PUNCT = 'punct'
+
+NAME_KINDS = (IDENT, QUOTED_IDENT)
+
+# Order matters: comments before punctuation ('-', '/'), numbers before
+# identifiers. Unterminated literals and comments run to the end of the text;
+# quoted identifiers never span lines, so a stray quote or backtick (e.g.
+# `'x\``) only swallows the rest of its line.
+_TOKEN_RE = re.compile(r"""
+    (?P<whitespace>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>'(?:[^'\\]|\\.)*(?:'|\Z))
+  | (?P<quoted_ident>"(?:[^"\n]|"")*(?:"|(?=\n)|\Z)|`(?:[^`\n]|``)*(?:`|(?=\n)|\Z))
+  | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?(?![\w]))
+  | (?P<ident>\w+)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+_CLOSED_RE = {
+    STRING: re.compile(r"'(?:[^'\\]|\\.)*'", re.DOTALL),
+    QUOTED_IDENT: re.compile(r'"(?:[^"]|"")*"|`(?:[^`]|``)*`'),
+}
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+
+
+def tokenize(sql: str) -> Iterator[Token]:
+    """
+    Yield the tokens of `sql` in order.
+
+    Parameters:
+    sql (str): SQL text
+
+    Returns:
+    iterator: Token(kind, text) tuples covering the whole input
+    """
+    for match in _TOKEN_RE.finditer(sql):
+        yield Token(match.lastgroup, match.group())
+
+
+def quote_problem(token: Token) -> Optional[str]:
+    """
+    Return why a string literal or quoted identifier looks broken, or None.
+
+    A literal that is never closed or that spans lines usually means a quote
+    is missing or doubled somewhere, and every quote after it pairs up wrong.
+    """
+    if token.kind not in _CLOSED_RE:
+        return None
+    if not _CLOSED_RE[token.kind].fullmatch(token.text):
+        return 'unterminated string literal' if token.kind == STRING else 'unterminated quoted identifier'
+    if token.kind == STRING and '\n' in token.text:
+        return 'string literal spans lines'
+    return None
+
+
+def unquote_identifier(text: str) -> str:
+    """Return the name inside a "quoted" or `quoted` identifier."""
+    if len(text) >= 2 and text[0] in '"`' and text[-1] == text[0]:
+        quote = text[0]
+        return text[1:-1].replace(quote * 2, quote)
+    return text
+
+
+def name_text(token: Token) -> str:
+    """Return the plain name of an identifier token (quoted or not)."""
+    if token.kind == QUOTED_IDENT:
+        return unquote_identifier(token.text)
+    return token.text
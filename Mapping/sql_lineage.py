@@ -0,0 +1,715 @@
+"""
+Column lineage of SQL files without a model call.
+
+data_lineage_collect.ipynb sent every validated SQL file to call_model_o1
+with a prompt asking for INSERT statements that describe the column
+lineage: one call of minutes per file, and a different answer on every run.
+extract_lineage reads the lineage from the SQL itself:
+
+- every CREATE VIEW/TABLE ... AS, INSERT INTO ... SELECT and SQLScript
+  table variable (`IT_X = SELECT ... FROM :IT_Y`) is a target table
+- every output column is traced through CTEs, subqueries, set operations,
+  table aliases and select list aliases down to the tables and views the
+  statement reads (views defined earlier in the file included), with the
+  expressions on the way as the transformation ('a -> b' from inner to
+  outer; '' for a column copied as is)
+- the columns of tables created and views defined earlier in the file are
+  known, so `*` and unqualified columns of joins resolve to the right table
+
+The rows have the shape of the `{data_flow}_lineage` table. A column
+computed from literals only gets one row with an empty source table and
+column. lineage_insert_sql writes the rows as the multi-row INSERT the
+model was asked for.
+
+Statements that cannot be parsed are skipped with a warning
+(counter `lineage_statements_skipped`); column references that match no
+table are counted in `lineage_unresolved_columns`.
+
+Usage:
+    rows = extract_lineage(sql_code)
+    insert_sql = lineage_insert_sql(rows, f"{catalog_schema}.{data_flow.lower()}_lineage")
+
+    python sql_lineage.py file.sql [--target name] [--insert table]
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from instrumentation import run_log
+from sql_executor import split_sql
+from sql_lexer import COMMENT, NAME_KINDS, NUMBER, PUNCT, STRING, WHITESPACE, name_text, tokenize
+
+LINEAGE_COLUMNS = ('TARGET_TABLE_NAME', 'TARGET_COLUMN_NAME', 'SOURCE_TABLE_NAME', 'SOURCE_COLUMN_NAME', 'TRANSFORMATION')
+
+# Token kinds added to the sql_lexer ones: dotted names and `alias.*`
+NAME = 'name'
+STAR = 'star'
+
+_CLAUSE_WORDS = {'FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'QUALIFY', 'WINDOW', 'INTO',
+                 'CLUSTER', 'DISTRIBUTE', 'SORT', 'UNION', 'INTERSECT', 'EXCEPT', 'MINUS'}
+_SET_OPERATORS = {'UNION', 'INTERSECT', 'EXCEPT', 'MINUS'}
+_JOIN_WORDS = {'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'OUTER', 'CROSS', 'NATURAL', 'SEMI', 'ANTI'}
+_KEYWORDS = _CLAUSE_WORDS | _JOIN_WORDS | {
+    'SELECT', 'DISTINCT', 'ALL', 'AS', 'ON', 'USING', 'LATERAL', 'VIEW', 'WITH', 'CASE', 'WHEN', 'THEN', 'ELSE',
+    'END', 'AND', 'OR', 'NOT', 'NULL', 'IS', 'IN', 'LIKE', 'ILIKE', 'RLIKE', 'REGEXP', 'BETWEEN', 'EXISTS', 'TRUE',
+    'FALSE', 'INTERVAL', 'OVER', 'PARTITION', 'BY', 'ROWS', 'RANGE', 'UNBOUNDED', 'PRECEDING', 'FOLLOWING',
+    'CURRENT', 'ROW', 'NULLS', 'FIRST', 'LAST', 'ASC', 'DESC', 'TOP', 'ESCAPE', 'FILTER', 'WITHIN', 'DIV',
+    'CURRENT_DATE', 'CURRENT_TIMESTAMP', 'CURRENT_TIME', 'CURRENT_USER', 'SYSDATE', 'SYSTIMESTAMP', 'VALUES',
+}
+_TYPED_LITERALS = {'DATE', 'TIMESTAMP', 'TIME', 'INTERVAL'}
+_CREATE_MODIFIERS = {'OR', 'REPLACE', 'GLOBAL', 'TEMPORARY', 'TEMP', 'MATERIALIZED', 'EXTERNAL', 'STREAMING', 'LIVE'}
+_QUERY_START = {'SELECT', 'WITH'}
+
+# Source of a column computed from literals only
+NO_SOURCE = ('', '')
+
+
+class LineageRow(NamedTuple):
+    target_table: str
+    target_column: str
+    source_table: str
+    source_column: str
+    transformation: str
+
+
+class _Tok(NamedTuple):
+    kind: str
+    upper: str  # upper case text; parts joined by '.' for names
+    parts: Tuple[str, ...]  # name parts (unquoted) for names, qualifier for `alias.*`
+    text: str  # original text
+    start: int
+    end: int
+
+
+_END = _Tok('end', '', (), '', -1, -1)
+
+
+class _ParseError(Exception):
+    pass
+
+
+def _tokens(sql: str) -> List[_Tok]:
+    """Significant tokens of a statement; `a.b.c`, `:IT_X` (SQLScript) and `a.*` become single tokens."""
+    tokens: List[_Tok] = []
+    offset = 0
+    for token in tokenize(sql):
+        start, offset = offset, offset + len(token.text)
+        if token.kind in (WHITESPACE, COMMENT):
+            continue
+        previous = tokens[-1] if tokens else _END
+        dotted = (previous.text == '.' and previous.end == start and len(tokens) >= 2
+                  and tokens[-2].kind == NAME and tokens[-2].end == previous.start)
+        if token.kind in NAME_KINDS:
+            name = name_text(token)
+            if dotted:
+                head = tokens[-2]
+                tokens[-2:] = [_Tok(NAME, f"{head.upper}.{name.upper()}", head.parts + (name,),
+                                    sql[head.start:offset], head.start, offset)]
+            elif (previous.text == ':' and previous.end == start
+                  and not (len(tokens) >= 2 and tokens[-2].text == ':')):
+                tokens[-1] = _Tok(NAME, name.upper(), (name,), token.text, start, offset)
+            else:
+                tokens.append(_Tok(NAME, name.upper(), (name,), token.text, start, offset))
+        elif token.text == '*' and dotted:
+            head = tokens[-2]
+            tokens[-2:] = [_Tok(STAR, '*', head.parts, sql[head.start:offset], head.start, offset)]
+        elif token.text == '*' and (not tokens or previous.text in (',', '(') or previous.upper in ('SELECT', 'DISTINCT', 'ALL')):
+            tokens.append(_Tok(STAR, '*', (), token.text, start, offset))
+        else:
+            tokens.append(_Tok(token.kind, token.text.upper(), (), token.text, start, offset))
+    return tokens
+
+
+def _is_keyword(token: _Tok) -> bool:
+    return token.kind == NAME and len(token.parts) == 1 and token.upper in _KEYWORDS
+
+
+def _chain(inner: str, outer: str) -> str:
+    return f"{inner} -> {outer}" if inner and outer else inner or outer
+
+
+def _merge(target: Dict, sources: Dict, expression: str = '') -> None:
+    """Add sources {(table, column): transformation} to target, with `expression` applied on top."""
+    for key, transformation in sources.items():
+        transformation = _chain(transformation, expression)
+        known = target.get(key)
+        if known is None:
+            target[key] = transformation
+        elif transformation and transformation not in known.split(' | '):
+            target[key] = f"{known} | {transformation}" if known else transformation
+
+
+class _Relation:
+    """A table or the result of a query: ordered (column, {(table, column): transformation}) pairs."""
+
+    __slots__ = ('name', 'columns', 'index')
+
+    def __init__(self, name: Optional[str], columns: Optional[List[Tuple[str, Dict]]] = None):
+        self.name = name  # table name; None for derived tables
+        self.columns = columns  # None: a table whose columns are not known
+        self.index: Dict[str, Dict] = {}
+        for column, sources in columns or ():
+            self.index.setdefault(column.lower(), sources)
+
+    def get(self, column: str) -> Optional[Dict]:
+        if self.columns is None:
+            return {(self.name, column): ''}
+        sources = self.index.get(column.lower())
+        if sources is None and self.name is not None:
+            # a column the catalog does not know yet (table created outside the file)
+            return {(self.name, column): ''}
+        return sources
+
+
+class _Scope:
+    """The tables of one FROM clause, with the scope of the enclosing query for correlated subqueries."""
+
+    __slots__ = ('outer', 'relations')
+
+    def __init__(self, outer: Optional['_Scope']):
+        self.outer = outer
+        self.relations: List[Tuple[str, str, _Relation]] = []  # (alias, table name), lower case
+
+
+class _Parser:
+    def __init__(self, tokens: List[_Tok], catalog: Dict[str, Tuple[str, Optional[List[str]]]]):
+        self.tokens = tokens
+        self.catalog = catalog
+        self.pos = 0
+
+    # Token helpers
+
+    def peek(self, offset: int = 0) -> _Tok:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else _END
+
+    def advance(self) -> _Tok:
+        token = self.peek()
+        if token is _END:
+            raise _ParseError("unexpected end of statement")
+        self.pos += 1
+        return token
+
+    def at(self, *words: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind == NAME and len(token.parts) == 1 and token.upper in words
+
+    def at_punct(self, text: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind == PUNCT and token.text == text
+
+    def accept(self, *words: str) -> bool:
+        if self.at(*words):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, word: str) -> None:
+        if not self.accept(word):
+            raise _ParseError(f"expected {word} at {self.peek().text!r}")
+
+    def expect_punct(self, text: str) -> None:
+        if not self.at_punct(text):
+            raise _ParseError(f"expected {text!r} at {self.peek().text!r}")
+        self.pos += 1
+
+    def at_query(self, offset: int = 0) -> bool:
+        """A query starts here: SELECT, WITH or a parenthesized query."""
+        while self.at_punct('(', offset):
+            offset += 1
+        return self.at(*_QUERY_START, offset=offset)
+
+    def skip_parens(self) -> None:
+        """Skip a parenthesized group starting at the current token."""
+        depth = 0
+        while True:
+            token = self.advance()
+            if token.kind == PUNCT and token.text == '(':
+                depth += 1
+            elif token.kind == PUNCT and token.text == ')':
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def skip_until(self, words=frozenset(), comma: bool = False, join: bool = False) -> None:
+        """Skip tokens up to ')' or the end, or at depth 0 a word in `words`, a ',' or a join keyword."""
+        while True:
+            token = self.peek()
+            if token is _END or (token.kind == PUNCT and token.text == ')'):
+                return
+            if token.kind == PUNCT and token.text == '(':
+                self.skip_parens()
+                continue
+            if comma and token.kind == PUNCT and token.text == ',':
+                return
+            if self.at(*words) or (join and (self.at(*_JOIN_WORDS) or self.at('LATERAL')) and not self.at_punct('(', 1)):
+                return
+            self.pos += 1
+
+    def text(self, start: int, end: int) -> str:
+        """Text of tokens[start:end] with comments dropped and whitespace runs as one space."""
+        parts = []
+        previous_end = None
+        for token in self.tokens[start:end]:
+            if previous_end is not None and token.start > previous_end:
+                parts.append(' ')
+            parts.append(token.text)
+            previous_end = token.end
+        return ''.join(parts)
+
+    # Statements
+
+    def statement(self, default_target: Optional[str]) -> Optional[Tuple[str, Optional[List[str]], _Relation]]:
+        """(target table, target columns or None, query result) of a statement that writes a query result."""
+        # SQLScript control flow in front of the statement
+        while True:
+            if self.accept('BEGIN', 'ELSE'):
+                continue
+            if self.accept('IF', 'ELSEIF'):
+                self.skip_until({'THEN'})
+                self.expect('THEN')
+                continue
+            break
+
+        columns = None
+        if self.accept('CREATE'):
+            while self.accept(*_CREATE_MODIFIERS):
+                pass
+            if not self.accept('VIEW', 'TABLE'):
+                return None
+            while self.accept('IF', 'NOT', 'EXISTS'):
+                pass
+            target = '.'.join(self.advance().parts)
+            if self.at_punct('(') and not self.at_query():
+                columns = self.column_list()
+            while not (self.at('AS') and self.at_query(1)):
+                if self.peek() is _END:
+                    # CREATE TABLE with column definitions only
+                    if columns:
+                        self.catalog[target.lower()] = (target, columns)
+                    return None
+                if self.at_punct('('):
+                    self.skip_parens()
+                else:
+                    self.pos += 1
+            self.pos += 1
+        elif self.accept('INSERT'):
+            self.accept('INTO', 'OVERWRITE')
+            self.accept('TABLE')
+            target = '.'.join(self.advance().parts)
+            if self.accept('PARTITION'):
+                self.skip_parens()
+            if self.at_punct('(') and not self.at_query():
+                columns = self.column_list()
+            if not self.at_query():
+                return None
+            known = self.catalog.get(target.lower())
+            if known:
+                target, columns = known[0], columns or known[1]
+        elif self.peek().kind == NAME and self.at_punct('=', 1) and self.at_query(2):
+            target = '.'.join(self.advance().parts)
+            self.pos += 1
+        elif self.accept('RETURN') or self.at_query():
+            if default_target is None or not self.at_query():
+                return None
+            target = default_target
+        else:
+            return None
+
+        relation = self.query(None, {})
+        if self.peek() is not _END:
+            raise _ParseError(f"unexpected {self.peek().text!r} after the query")
+        return target, columns, relation
+
+    def column_list(self) -> List[str]:
+        """First name of every element of a parenthesized list: column names or column definitions."""
+        self.expect_punct('(')
+        names = []
+        while True:
+            names.append(self.advance().parts[-1])
+            self.skip_until(comma=True)
+            if not self.at_punct(','):
+                break
+            self.pos += 1
+        self.expect_punct(')')
+        return names
+
+    # Queries
+
+    def query(self, outer: Optional[_Scope], ctes: Dict[str, _Relation]) -> _Relation:
+        if self.accept('WITH'):
+            self.accept('RECURSIVE')
+            ctes = dict(ctes)
+            while True:
+                name = self.advance().parts[-1]
+                names = self.column_list() if self.at_punct('(') else None
+                self.expect('AS')
+                self.expect_punct('(')
+                relation = self.query(None, ctes)
+                self.expect_punct(')')
+                ctes[name.lower()] = self.rename(relation, names)
+                if not self.at_punct(','):
+                    break
+                self.pos += 1
+        relation = self.query_term(outer, ctes)
+        while self.at(*_SET_OPERATORS):
+            self.pos += 1
+            self.accept('ALL', 'DISTINCT')
+            relation = self.combine(relation, self.query_term(outer, ctes))
+        # ORDER BY, LIMIT, ...
+        self.skip_until()
+        return relation
+
+    def query_term(self, outer: Optional[_Scope], ctes: Dict[str, _Relation]) -> _Relation:
+        if self.at_punct('('):
+            self.pos += 1
+            relation = self.query(outer, ctes)
+            self.expect_punct(')')
+            return relation
+        if self.at('WITH'):
+            return self.query(outer, ctes)
+        if self.at('SELECT'):
+            return self.select(outer, ctes)
+        if self.accept('VALUES'):
+            self.skip_until(_SET_OPERATORS | {'ORDER', 'LIMIT'})
+            return _Relation(None, [])
+        raise _ParseError(f"expected a query at {self.peek().text!r}")
+
+    @staticmethod
+    def combine(first: _Relation, second: _Relation) -> _Relation:
+        """Columns of a set operation: sources of both sides, by position."""
+        if first.columns is None or second.columns is None:
+            return first if second.columns is None else second
+        columns = []
+        for position, (column, sources) in enumerate(first.columns):
+            merged = dict(sources)
+            if position < len(second.columns):
+                _merge(merged, second.columns[position][1])
+            if len(merged) > 1:
+                merged.pop(NO_SOURCE, None)
+            columns.append((column, merged))
+        return _Relation(None, columns)
+
+    @staticmethod
+    def rename(relation: _Relation, names: Optional[List[str]]) -> _Relation:
+        if not names or relation.columns is None:
+            return relation
+        return _Relation(relation.name, [(names[position] if position < len(names) else column, sources)
+                                         for position, (column, sources) in enumerate(relation.columns)])
+
+    def select(self, outer: Optional[_Scope], ctes: Dict[str, _Relation]) -> _Relation:
+        self.expect('SELECT')
+        self.accept('DISTINCT', 'ALL')
+        if self.accept('TOP'):
+            self.pos += 1
+        items = []
+        while True:
+            start = self.pos
+            self.skip_until(_CLAUSE_WORDS, comma=True)
+            items.append((start, self.pos))
+            if not self.at_punct(','):
+                break
+            self.pos += 1
+
+        scope = _Scope(outer)
+        if self.accept('FROM'):
+            self.from_clause(scope, ctes)
+        # WHERE, GROUP BY, HAVING, ...
+        self.skip_until(_SET_OPERATORS | {'ORDER', 'LIMIT'})
+
+        columns: List[Tuple[str, Dict]] = []
+        lateral: Dict[str, Dict] = {}  # select list aliases (lateral column aliases)
+        for start, end in items:
+            if end - start == 1 and self.tokens[start].kind == STAR:
+                columns.extend(self.expand_star(scope, self.tokens[start].parts))
+                continue
+            name, end = self.item_alias(start, end)
+            sources = self.expression_sources(scope, start, end, lateral, ctes)
+            if name is None:
+                single = end - start == 1 and self.tokens[start].kind == NAME
+                name = self.tokens[start].parts[-1] if single else self.text(start, end)
+            columns.append((name, sources))
+            lateral.setdefault(name.lower(), sources)
+        return _Relation(None, columns)
+
+    def item_alias(self, start: int, end: int) -> Tuple[Optional[str], int]:
+        """Alias of a select list item and the end of its expression."""
+        last = self.tokens[end - 1]
+        if end - start < 2 or last.kind != NAME or len(last.parts) != 1:
+            return None, end
+        before = self.tokens[end - 2]
+        if before.kind == NAME and before.upper == 'AS' and end - start >= 3:
+            return last.parts[0], end - 2
+        if _is_keyword(last):
+            return None, end
+        if (before.kind in (NUMBER, STRING) or (before.kind == PUNCT and before.text == ')')
+                or (before.kind == NAME and (not _is_keyword(before) or before.upper in ('END', 'NULL', 'TRUE', 'FALSE')))):
+            return last.parts[0], end - 1
+        return None, end
+
+    def expand_star(self, scope: _Scope, qualifier: Tuple[str, ...]) -> List[Tuple[str, Dict]]:
+        wanted = '.'.join(qualifier).lower()
+        columns = []
+        for alias, table, relation in scope.relations:
+            if wanted and wanted not in (alias, table):
+                continue
+            if relation.columns is None:
+                columns.append(('*', {(relation.name, '*'): ''}))
+            else:
+                columns.extend(relation.columns)
+        return columns
+
+    def is_column(self, index: int, end: int) -> bool:
+        """True if the name token at `index` of the expression ending at `end` is a column reference."""
+        token = self.tokens[index]
+        following = self.tokens[index + 1] if index + 1 < len(self.tokens) else _END
+        if following.kind == PUNCT and following.text == '(':
+            return False  # function
+        if len(token.parts) == 1:
+            if token.upper in _KEYWORDS:
+                return False
+            if token.upper in _TYPED_LITERALS and following.kind == STRING:
+                return False  # DATE '2024-01-01'
+            if following.kind == NAME and following.upper == 'FROM' and index + 1 < end:
+                return False  # EXTRACT(YEAR FROM ...), TRIM(BOTH FROM ...)
+        if index > 0:
+            previous = self.tokens[index - 1]
+            if previous.upper == 'AS' or (previous.kind == PUNCT and previous.text == ':'):
+                return False  # CAST(... AS type), x::type
+            if previous.kind in (NUMBER, STRING) and index > 1 and self.tokens[index - 2].upper == 'INTERVAL':
+                return False  # INTERVAL 1 DAY
+        return True
+
+    def expression_sources(self, scope: _Scope, start: int, end: int, lateral: Dict[str, Dict],
+                           ctes: Dict[str, _Relation]) -> Dict:
+        """Sources of the expression tokens[start:end]; literals only give NO_SOURCE."""
+        single = end - start == 1 and self.tokens[start].kind == NAME
+        expression = '' if single else self.text(start, end)
+        sources: Dict = {}
+        index = start
+        while index < end:
+            token = self.tokens[index]
+            if token.kind == PUNCT and token.text == '(' and self.at(*_QUERY_START, offset=index + 1 - self.pos):
+                # scalar, EXISTS or IN subquery
+                saved, self.pos = self.pos, index + 1
+                relation = self.query(scope, ctes)
+                index = self.pos + 1
+                self.pos = saved
+                for _, column_sources in relation.columns or ():
+                    _merge(sources, column_sources, expression)
+                continue
+            if token.kind == NAME and self.is_column(index, end):
+                found = self.resolve(scope, token.parts, lateral)
+                if found is None:
+                    run_log.count('lineage_unresolved_columns')
+                else:
+                    _merge(sources, found, expression)
+            index += 1
+        if len(sources) > 1:
+            sources.pop(NO_SOURCE, None)
+        if not sources:
+            sources[NO_SOURCE] = self.text(start, end)
+        return sources
+
+    def resolve(self, scope: _Scope, parts: Tuple[str, ...], lateral: Dict[str, Dict]) -> Optional[Dict]:
+        """Sources of a column reference, searched in the scope and then in the enclosing ones."""
+        column = parts[-1]
+        if len(parts) == 1:
+            current: Optional[_Scope] = scope
+            while current is not None:
+                unknown = []
+                for _, _, relation in current.relations:
+                    if relation.columns is None:
+                        unknown.append(relation)
+                    elif column.lower() in relation.index:
+                        return relation.index[column.lower()]
+                if current is scope and column.lower() in lateral:
+                    return lateral[column.lower()]
+                if unknown:
+                    # one of the tables whose columns are not known
+                    found: Dict = {}
+                    for relation in unknown:
+                        found.update(relation.get(column))
+                    return found
+                if len(current.relations) == 1:
+                    # the only table of the query, created outside the file with more columns
+                    found = current.relations[0][2].get(column)
+                    if found is not None:
+                        return found
+                current = current.outer
+            return None
+        qualifier = '.'.join(parts[:-1]).lower()
+        current = scope
+        while current is not None:
+            for alias, table, relation in current.relations:
+                if qualifier in (alias, table) or parts[-2].lower() == alias:
+                    return relation.get(column)
+            current = current.outer
+        return None
+
+    def from_clause(self, scope: _Scope, ctes: Dict[str, _Relation]) -> None:
+        self.table_factor(scope, ctes)
+        while True:
+            if self.at_punct(','):
+                self.pos += 1
+                self.table_factor(scope, ctes)
+            elif self.at('LATERAL') and self.at('VIEW', offset=1):
+                self.lateral_view(scope)
+            elif (self.at(*_JOIN_WORDS) or self.at('LATERAL')) and not self.at_punct('(', 1):
+                while self.accept(*(_JOIN_WORDS - {'JOIN'})):
+                    pass
+                self.accept('JOIN')
+                self.accept('LATERAL')
+                self.table_factor(scope, ctes)
+                if self.accept('ON'):
+                    self.skip_until(_CLAUSE_WORDS, comma=True, join=True)
+                elif self.accept('USING'):
+                    self.skip_parens()
+            else:
+                return
+
+    def table_factor(self, scope: _Scope, ctes: Dict[str, _Relation]) -> None:
+        if self.at_punct('('):
+            if self.at_query():
+                self.pos += 1
+                relation = self.query(None, ctes)
+                self.expect_punct(')')
+                alias = self.table_alias()
+                if self.at_punct('('):
+                    relation = self.rename(relation, self.column_list())
+                scope.relations.append((alias.lower() if alias else '', '', relation))
+            else:
+                # parenthesized joins
+                self.pos += 1
+                self.from_clause(scope, ctes)
+                self.expect_punct(')')
+                self.table_alias()
+            return
+        token = self.advance()
+        if token.kind != NAME:
+            raise _ParseError(f"expected a table at {token.text!r}")
+        if self.at_punct('('):
+            self.skip_parens()  # table function or HANA parameters
+        table = '.'.join(token.parts).lower()
+        if len(token.parts) == 1 and table in ctes:
+            relation = ctes[table]
+        else:
+            known = self.catalog.get(table)
+            if known and known[1]:
+                relation = _Relation(known[0], [(column, {(known[0], column): ''}) for column in known[1]])
+            else:
+                relation = _Relation(known[0] if known else '.'.join(token.parts))
+        alias = self.table_alias() or token.parts[-1]
+        scope.relations.append((alias.lower(), table, relation))
+
+    def table_alias(self) -> Optional[str]:
+        if self.accept('AS'):
+            return self.advance().parts[-1]
+        token = self.peek()
+        if token.kind == NAME and len(token.parts) == 1 and not _is_keyword(token):
+            self.pos += 1
+            return token.parts[0]
+        return None
+
+    def lateral_view(self, scope: _Scope) -> None:
+        """LATERAL VIEW [OUTER] explode(expr) alias [AS] c1, c2"""
+        self.pos += 2
+        self.accept('OUTER')
+        start = self.pos
+        self.advance()
+        self.skip_parens()
+        sources = self.expression_sources(scope, start, self.pos, {}, {})
+        alias = self.table_alias() or ''
+        names = []
+        self.accept('AS')
+        while self.peek().kind == NAME and not _is_keyword(self.peek()):
+            names.append(self.advance().parts[-1])
+            if not self.at_punct(','):
+                break
+            self.pos += 1
+        scope.relations.append((alias.lower(), '', _Relation(None, [(name, dict(sources)) for name in names])))
+
+
+def extract_lineage(sql_code: str, default_target: Optional[str] = None,
+                    catalog: Optional[Dict[str, Tuple[str, Optional[List[str]]]]] = None) -> List[LineageRow]:
+    """
+    Column lineage of the statements of a SQL text.
+
+    Parameters:
+    sql_code (str): SQL text, Databricks SQL or HANA SQLScript
+    default_target (str): Target of a query that is not stored (RETURN SELECT ... of a table function); default skipped
+    catalog (dict): Known table columns {table (lower case): (table, [columns])}; updated with the targets of the file
+
+    Returns:
+    list: LineageRow per target column and source column
+    """
+    catalog = {} if catalog is None else catalog
+    rows = []
+    for text in split_sql(sql_code):
+        parser = _Parser(_tokens(text), catalog)
+        try:
+            result = parser.statement(default_target)
+        except _ParseError as e:
+            first_line = next((line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('--')), '')
+            run_log.warning("Lineage: skipped statement %s: %s", first_line[:80], e)
+            run_log.count('lineage_statements_skipped')
+            continue
+        if result is None:
+            continue
+        target, names, relation = result
+        relation = parser.rename(relation, names)
+        for column, sources in relation.columns or ():
+            for (source_table, source_column), transformation in sources.items():
+                rows.append(LineageRow(target, column, source_table, source_column, transformation))
+        columns = [column for column, _ in relation.columns or ()]
+        catalog[target.lower()] = (target, None if '*' in columns else columns)
+    run_log.count('lineage_rows', len(rows))
+    return rows
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def lineage_insert_sql(rows: List[LineageRow], table_name: str, batch_size: int = 1000) -> str:
+    """
+    Multi-row INSERT statements of lineage rows, `batch_size` rows per statement.
+
+    Parameters:
+    rows (list): LineageRow tuples from extract_lineage
+    table_name (str): Lineage table, e.g. hive_metastore.codeconverter_config.{data_flow}_lineage
+
+    Returns:
+    str: Statements separated by ';'
+    """
+    statements = []
+    for begin in range(0, len(rows), batch_size):
+        values = ',\n'.join('(' + ', '.join(_sql_literal(value) for value in row) + ')'
+                            for row in rows[begin:begin + batch_size])
+        statements.append(f"INSERT INTO {table_name} ({', '.join(LINEAGE_COLUMNS)}) VALUES\n{values};\n")
+    return ''.join(statements)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Column lineage of SQL files")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--target', default=None, help="Target of a query that is not stored (RETURN SELECT)")
+    parser.add_argument('--insert', default=None, metavar='TABLE', help="Print INSERT statements into TABLE")
+    args = parser.parse_args()
+
+    for sql_file in args.files:
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            sql_text = f.read()
+        started = time.perf_counter()
+        lineage = extract_lineage(sql_text, args.target)
+        elapsed = time.perf_counter() - started
+        if args.insert:
+            print(lineage_insert_sql(lineage, args.insert))
+            continue
+        for row in lineage:
+            print('\t'.join(row))
+        targets = len({row.target_table for row in lineage})
+        print(f"{sql_file}: {len(lineage)} lineage rows for {targets} targets in {elapsed:.3f}s")
+    run_log.print_summary()
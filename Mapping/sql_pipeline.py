@@ -0,0 +1,315 @@
+"""
+Composable SQL -> Databricks notebook pipeline.
+
+`process_sql_file` used to write the spark.sql() file, `create_databricks_notebook`
+read it back and split it again, and `replace_original_file` copied the
+result once more. Here the conversion is one pass of stages over an
+iterator of SQL texts, feeding any number of writers:
+
+    source  ->  split  ->  rewrite  ->  annotate  ->  terminate  ->  writers
+    (chunks)    (';')                  (optional)                  (notebook, spark.sql file)
+
+Every stage is a callable taking and returning an iterator of strings, so
+stages can be added, dropped or reordered. The spark.sql() file is just
+another writer and only written when asked for.
+
+build_pipeline assembles the two standard orders:
+- batch (default): the whole file is rewritten and annotated as one text,
+  then split on ';' + blank line. Output is byte-identical to
+  process_sql_file + create_databricks_notebook.
+- streaming: the file is read in chunks and split on ';' outside literals
+  and comments first, then every statement is rewritten and annotated on
+  its own, so memory is bounded by the largest statement.
+
+With a ConversionManifest (incremental.py) the rewrite and annotate stages
+run inside an IncrementalStage, one statement at a time, and statements whose
+SQL and mapping entries did not change are taken from the manifest instead;
+an input file that did not change at all is copied from the manifest without
+running the pipeline.
+
+Usage:
+    pipeline = build_pipeline(rewrite, field_lookup=lookup, streaming=True)
+    with open(sql_file) as src, open(notebook_file, 'w') as out:
+        pipeline.run(read_sql_source(src, streaming=True), [NotebookWriter(out)])
+"""
+
+import json
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from incremental import ConversionManifest, FileOutputWriter, IncrementalStage, MappingReferences, text_sha256
+from instrumentation import ANNOTATE, NOTEBOOK_WRITE, REWRITE, SQL_WRITE, run_log
+from mapping_cache import file_sha256
+from sql_annotator import AnnotationReport, DdlAnnotator, process_sql_string
+from sql_conversion import (iter_sql_statements, notebook_cell, read_chunks, split_sql_statements,
+                            wrap_spark_sql, write_notebook_cell, write_notebook_header)
+
+Stage = Callable[[Iterable[str]], Iterator[str]]
+
+
+def read_sql_source(f: TextIO, streaming: bool = False) -> Iterator[str]:
+    """Pipeline source: the whole file as one text (batch) or its chunks (streaming)."""
+    if streaming:
+        return read_chunks(f)
+    return iter([f.read()])
+
+
+class RewriteStage:
+    """Replace SAP field and table names in every text (see make_sql_rewriter)."""
+
+    def __init__(self, rewrite: Callable[[str], str]):
+        self.rewrite = rewrite
+
+    def __call__(self, texts: Iterable[str]) -> Iterator[str]:
+        for text in texts:
+            with run_log.timer(REWRITE):
+                text = self.rewrite(text)
+            yield text
+
+
+class AnnotateStage:
+    """
+    Add COMMENT() with the SAP field description to column definitions (see process_sql_string).
+
+    With structural=True only CREATE TABLE column lists are annotated (see
+    DdlAnnotator) and `report` collects the result per column.
+    """
+
+    def __init__(self, field_lookup: Dict[str, str], structural: bool = False):
+        self.field_lookup = field_lookup
+        self.structural = structural
+        self.annotator = DdlAnnotator(field_lookup) if structural else None
+        self.report = AnnotationReport()
+        self.comments_added = 0
+        self.fields_processed = 0
+
+    def __call__(self, texts: Iterable[str]) -> Iterator[str]:
+        for text in texts:
+            with run_log.timer(ANNOTATE):
+                if self.annotator:
+                    text, report = self.annotator.annotate(text)
+                    self.report.extend(report)
+                    comments_added, fields_processed = report.comments_added, report.fields_processed
+                else:
+                    text, comments_added, fields_processed = process_sql_string(text, self.field_lookup,
+                                                                                verbose=False)
+            self.comments_added += comments_added
+            self.fields_processed += fields_processed
+            yield text
+
+
+def split_statements(texts: Iterable[str]) -> Iterator[str]:
+    """Split stage of the batch order: each text on ';' + blank line, statements terminated by ';'."""
+    for text in texts:
+        yield from split_sql_statements(text)
+
+
+def terminate_statements(statements: Iterable[str]) -> Iterator[str]:
+    """Strip statements, drop empty ones and make sure each ends with ';'."""
+    for statement in statements:
+        statement = statement.strip()
+        if not statement.rstrip(';').strip():
+            continue
+        if not statement.endswith(';'):
+            statement += ';'
+        yield statement
+
+
+def line_statements(statements: Iterable[str]) -> Iterator[str]:
+    """
+    Merge statements so that every one ends at a line end.
+
+    process_sql_string works line by line; a ';' in the middle of a line
+    keeps the rest of the line with the statement before it, so converting
+    the pieces one by one gives the same text as converting the whole file.
+    """
+    pending = ''
+    for statement in statements:
+        first_line, newline, _ = statement.partition('\n')
+        if pending and (first_line.strip() or not newline):
+            pending += statement
+            continue
+        if pending:
+            yield pending
+        pending = statement
+    if pending:
+        yield pending
+
+
+def join_texts(texts: Iterable[str]) -> Iterator[str]:
+    """Concatenate all texts into one (the batch split needs the whole file)."""
+    yield ''.join(texts)
+
+
+class NotebookWriter:
+    """Writes statements as Databricks notebook cells, as build_notebook would."""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.count = 0
+        write_notebook_header(out)
+
+    def write(self, statement: str) -> None:
+        with run_log.timer(NOTEBOOK_WRITE):
+            write_notebook_cell(self.out, notebook_cell(statement))
+        self.count += 1
+
+
+class SparkSqlWriter:
+    """Writes statements as spark.sql() calls, as format_spark_sql would."""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.count = 0
+
+    def write(self, statement: str) -> None:
+        with run_log.timer(SQL_WRITE):
+            self.out.write(('\n\n' if self.count else '') + wrap_spark_sql(statement))
+        self.count += 1
+
+
+class SqlPipeline:
+    """A chain of stages from SQL texts to terminated statements."""
+
+    def __init__(self, stages: Sequence[Stage]):
+        self.stages = list(stages)
+
+    def statements(self, source: Iterable[str]) -> Iterator[str]:
+        """Lazily apply all stages to the source."""
+        texts = iter(source)
+        for stage in self.stages:
+            texts = stage(texts)
+        return texts
+
+    def run(self, source: Iterable[str], writers: Sequence) -> int:
+        """
+        Feed every statement to every writer.
+
+        Returns:
+        int: Number of statements written
+        """
+        num_statements = 0
+        for statement in self.statements(source):
+            for writer in writers:
+                writer.write(statement)
+            num_statements += 1
+        run_log.count('statements', num_statements)
+        return num_statements
+
+    def stage(self, stage_type: type) -> Optional[Stage]:
+        """Return the first stage of the given type, e.g. to read AnnotateStage counters."""
+        stages = list(self.stages)
+        while stages:
+            stage = stages.pop(0)
+            if isinstance(stage, stage_type):
+                return stage
+            # Stages wrapped by another stage, e.g. IncrementalStage
+            stages.extend(getattr(stage, 'stages', []))
+        return None
+
+
+def build_pipeline(rewrite: Optional[Callable[[str], str]] = None, field_lookup: Optional[Dict[str, str]] = None,
+                   streaming: bool = False, manifest: Optional[ConversionManifest] = None,
+                   references: Optional[MappingReferences] = None, structural_comments: bool = False) -> SqlPipeline:
+    """
+    Assemble the standard pipeline.
+
+    Parameters:
+    rewrite (callable): Field/table rewriter, e.g. from make_sql_rewriter; None skips the rewrite
+    field_lookup (dict): DBX field -> SAP description; None skips the annotation
+    streaming (bool): Split before rewriting (bounded memory) instead of after
+    manifest (ConversionManifest): Reuse the output of unchanged statements
+    references (MappingReferences): Mapping entries of a statement; required with manifest and rewrite
+    structural_comments (bool): Only annotate CREATE TABLE column lists (see DdlAnnotator)
+
+    Returns:
+    SqlPipeline
+    """
+    transforms: List[Stage] = []
+    if rewrite:
+        transforms.append(RewriteStage(rewrite))
+    if field_lookup is not None:
+        transforms.append(AnnotateStage(field_lookup, structural_comments))
+
+    if manifest is not None:
+        if rewrite and references is None:
+            raise ValueError("references are required for an incremental rewrite")
+        settings = json.dumps({
+            'rewrite': bool(rewrite),
+            'field_lookup': sorted(field_lookup.items()) if field_lookup is not None else None,
+            'structural_comments': structural_comments
+        })
+        incremental = IncrementalStage(manifest, transforms, references if rewrite else None, text_sha256(settings))
+        if streaming:
+            return SqlPipeline([iter_sql_statements, incremental, terminate_statements])
+        # Converting per statement gives the same text as converting the whole file
+        return SqlPipeline([iter_sql_statements, line_statements, incremental, join_texts, split_statements])
+
+    if streaming:
+        return SqlPipeline([iter_sql_statements] + transforms + [terminate_statements])
+    return SqlPipeline(transforms + [split_statements])
+
+
+def convert_sql_file(input_file: str, notebook_file: Optional[str] = None, processed_file: Optional[str] = None,
+                     rewrite: Optional[Callable[[str], str]] = None, field_lookup: Optional[Dict[str, str]] = None,
+                     streaming: bool = False, manifest: Optional[ConversionManifest] = None,
+                     references: Optional[MappingReferences] = None,
+                     structural_comments: bool = False) -> Tuple[int, int]:
+    """
+    Convert one SQL file in a single pass, writing only the requested outputs.
+
+    Parameters:
+    input_file (str): SQL file to convert
+    notebook_file (str): Databricks notebook to write, if any
+    processed_file (str): spark.sql() formatted file to write, if any
+    rewrite, field_lookup, streaming, manifest, references, structural_comments: See build_pipeline
+
+    Returns:
+    tuple: (number of statements, number of comments added)
+    """
+    pipeline = build_pipeline(rewrite, field_lookup, streaming, manifest, references, structural_comments)
+    incremental = pipeline.stage(IncrementalStage)
+    record = file_key = None
+    if incremental:
+        sha256 = file_sha256(input_file)
+        file_key = incremental.file_key(sha256, 'streaming' if streaming else 'batch')
+        record = manifest.reusable_file(input_file, sha256, file_key)
+
+    outputs = []
+    file_output = None
+    try:
+        writers = []
+        if notebook_file:
+            outputs.append(open(notebook_file, 'w', encoding='utf-8'))
+            writers.append(NotebookWriter(outputs[-1]))
+        if processed_file:
+            outputs.append(open(processed_file, 'w', encoding='utf-8'))
+            writers.append(SparkSqlWriter(outputs[-1]))
+
+        if record:
+            # Unchanged file, mapping and settings: copy the stored statements
+            SqlPipeline([]).run(manifest.file_output(file_key), writers)
+            manifest.reuse_file(input_file, record)
+            return record['outputs'], record['comments_added']
+
+        if incremental:
+            file_output = FileOutputWriter(manifest, file_key)
+            writers.append(file_output)
+        with open(input_file, 'r', encoding='utf-8') as src:
+            num_statements = pipeline.run(read_sql_source(src, streaming), writers)
+    except BaseException:
+        if file_output:
+            file_output.abort()
+        raise
+    finally:
+        for out in outputs:
+            out.close()
+
+    annotate = pipeline.stage(AnnotateStage)
+    comments_added = annotate.comments_added if annotate else 0
+    if incremental:
+        file_output.commit()
+        manifest.count('files')
+        manifest.record_file(input_file, {'sha256': sha256, 'key': file_key, 'statements': incremental.keys,
+                                          'outputs': num_statements, 'comments_added': comments_added,
+                                          'chars': incremental.chars})
+    return num_statements, comments_added
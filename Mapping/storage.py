@@ -0,0 +1,349 @@
+"""
+File storage for the conversion notebooks: local filesystem and ABFS/DBFS (through dbutils.fs).
+
+`read_file_content` (init.ipynb) read every file with
+spark.read.text(path).rdd.map(...).collect(), a Spark job per small text
+file, and the notebooks listed, wrote and archived files with one
+dbutils.fs call after another. A Storage backend does the I/O directly and
+adds the bulk operations a conversion run needs:
+
+- ls with sizes and modification times, optionally recursive and filtered
+- prefetch: read many files in parallel in the background, so a file is
+  usually in memory by the time a task asks for it
+- buffered_writer: collect small writes (iteration logs) and write them in
+  parallel when flushed
+- move_many: move many files (archiving) in parallel, collecting errors
+  instead of stopping at the first one
+
+LocalStorage works on local paths (including /dbfs/... on a cluster), so a
+conversion run can also be run and benchmarked outside Databricks.
+DbutilsStorage handles every path dbutils.fs handles (abfss://, dbfs:/, ...);
+small files are read with dbutils.fs.head instead of a Spark job.
+
+Usage:
+    storage = DbutilsStorage(dbutils) if 'dbutils' in globals() else LocalStorage()
+    files = storage.ls(source_directory_path)
+    prefetched = storage.prefetch(files)
+    lines = prefetched.lines(files[0].path)
+    with storage.buffered_writer() as writer:
+        writer.write(log_path, text)
+    errors = [m for m in storage.move_many(pairs) if m.error]
+
+    python storage.py DIR [--pattern '*.xml'] [--workers 16] [--latency 0.05]
+"""
+
+import fnmatch
+import os
+import re
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+DEFAULT_WORKERS = 16
+
+# Buffered writes are flushed once this much text is waiting
+DEFAULT_BUFFER_BYTES = 8 * 2 ** 20
+
+# Line breaks recognized by spark.read.text
+_LINE_BREAK = re.compile(r'\r\n|\r|\n')
+
+
+class FileEntry(NamedTuple):
+    path: str
+    name: str  # directories end with '/', as in dbutils.fs.ls
+    size: int
+    modification_time: int = 0  # milliseconds since the epoch
+    is_dir: bool = False
+
+
+class MoveResult(NamedTuple):
+    source: str
+    target: str
+    error: Optional[str] = None
+
+
+def split_lines(text: str) -> List[str]:
+    """Split text into lines like spark.read.text (no line terminators, no empty line after a final break)."""
+    if not text:
+        return []
+    lines = _LINE_BREAK.split(text)
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+class Storage(ABC):
+    """
+    Base class of the storage backends.
+
+    Backends implement ls, read_text, write_text, move and mkdirs; the bulk
+    operations are built on them.
+    """
+
+    @abstractmethod
+    def ls(self, path: str, recursive: bool = False, pattern: Optional[str] = None) -> List[FileEntry]:
+        """Entries of a directory (and its subdirectories if recursive); with a pattern, only matching files."""
+
+    @abstractmethod
+    def read_text(self, path: str, size: Optional[int] = None) -> str:
+        """Read a UTF-8 text file; `size` (from ls) saves a lookup in backends that need it."""
+
+    @abstractmethod
+    def write_text(self, path: str, text: str, overwrite: bool = True) -> None:
+        """Write a UTF-8 text file; an existing file is only replaced if overwrite is True."""
+
+    @abstractmethod
+    def move(self, source: str, target: str) -> None:
+        """Move a file, creating the target directory if needed."""
+
+    @abstractmethod
+    def mkdirs(self, path: str) -> None:
+        """Create a directory and its parents."""
+
+    def read_lines(self, path: str, size: Optional[int] = None) -> List[str]:
+        """The lines of a text file, as spark.read.text(path) returns them."""
+        return split_lines(self.read_text(path, size))
+
+    @staticmethod
+    def _filter(entries: List[FileEntry], pattern: Optional[str]) -> List[FileEntry]:
+        if pattern is None:
+            return entries
+        return [entry for entry in entries if not entry.is_dir and fnmatch.fnmatch(entry.name, pattern)]
+
+    def prefetch(self, files: Iterable[Union[str, FileEntry]], max_workers: int = DEFAULT_WORKERS) -> 'Prefetch':
+        """Start reading files (paths or ls entries) in the background."""
+        return Prefetch(self, files, max_workers)
+
+    def read_many(self, files: Iterable[Union[str, FileEntry]], max_workers: int = DEFAULT_WORKERS) -> Dict[str, str]:
+        """Read files in parallel; returns path -> text (raises the first read error)."""
+        prefetched = self.prefetch(files, max_workers)
+        try:
+            return {path: prefetched.get(path) for path in prefetched.paths}
+        finally:
+            prefetched.close()
+
+    def move_many(self, pairs: Sequence[Tuple[str, str]], max_workers: int = DEFAULT_WORKERS) -> List[MoveResult]:
+        """Move (source, target) pairs in parallel; errors are returned per pair, not raised."""
+        def move(pair: Tuple[str, str]) -> MoveResult:
+            try:
+                self.move(*pair)
+                return MoveResult(pair[0], pair[1])
+            except Exception as e:
+                return MoveResult(pair[0], pair[1], f"{type(e).__name__}: {e}")
+
+        if not pairs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs)), thread_name_prefix='storage-move') as pool:
+            return list(pool.map(move, pairs))
+
+    def buffered_writer(self, max_bytes: int = DEFAULT_BUFFER_BYTES,
+                        max_workers: int = DEFAULT_WORKERS) -> 'BufferedWriter':
+        return BufferedWriter(self, max_bytes, max_workers)
+
+
+class Prefetch:
+    """
+    Files being read in the background by a thread pool.
+
+    get/lines wait for one file only; a read error is raised by get/lines for
+    that file, not when the prefetch starts.
+    """
+
+    def __init__(self, storage: Storage, files: Iterable[Union[str, FileEntry]], max_workers: int = DEFAULT_WORKERS):
+        self.storage = storage
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage-read')
+        self._futures: Dict[str, Future] = {}
+        for entry in files:
+            path, size = (entry.path, entry.size) if isinstance(entry, FileEntry) else (entry, None)
+            if path not in self._futures:
+                self._futures[path] = self._pool.submit(storage.read_text, path, size)
+
+    @property
+    def paths(self) -> List[str]:
+        return list(self._futures)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._futures
+
+    def get(self, path: str) -> str:
+        """The text of a file; files that were not prefetched are read now."""
+        future = self._futures.get(path)
+        return future.result() if future is not None else self.storage.read_text(path)
+
+    def lines(self, path: str) -> List[str]:
+        return split_lines(self.get(path))
+
+    def close(self) -> None:
+        """Cancel the reads that have not started."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class BufferedWriter:
+    """
+    Collects (path, text) writes and writes them in parallel on flush.
+
+    A later write to the same path replaces the buffered one. The buffer is
+    flushed when it holds more than max_bytes of text, on flush() and when
+    the `with` block ends.
+    """
+
+    def __init__(self, storage: Storage, max_bytes: int = DEFAULT_BUFFER_BYTES, max_workers: int = DEFAULT_WORKERS):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self._buffer: Dict[str, str] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def write(self, path: str, text: str) -> None:
+        with self._lock:
+            if path in self._buffer:
+                self._bytes -= len(self._buffer[path])
+            self._buffer[path] = text
+            self._bytes += len(text)
+            full = self._bytes > self.max_bytes
+        if full:
+            self.flush()
+
+    def flush(self) -> List[Tuple[str, Exception]]:
+        """Write the buffered texts; returns (path, exception) of the writes that failed."""
+        with self._lock:
+            writes, self._buffer, self._bytes = list(self._buffer.items()), {}, 0
+        if not writes:
+            return []
+
+        def write(item: Tuple[str, str]) -> Optional[Tuple[str, Exception]]:
+            try:
+                self.storage.write_text(*item, overwrite=True)
+                return None
+            except Exception as e:
+                return item[0], e
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(writes)), thread_name_prefix='storage-write') as pool:
+            return [error for error in pool.map(write, writes) if error is not None]
+
+    def __enter__(self) -> 'BufferedWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for path, error in self.flush():
+            print(f"Error writing {path}: {error}")
+
+
+class LocalStorage(Storage):
+    """Local filesystem; `file:` prefixes are accepted."""
+
+    @staticmethod
+    def _local(path: str) -> str:
+        return path[len('file:'):] if path.startswith('file:') else path
+
+    def ls(self, path: str, recursive: bool = False, pattern: Optional[str] = None) -> List[FileEntry]:
+        entries = []
+        with os.scandir(self._local(path)) as scan:
+            for item in sorted(scan, key=lambda item: item.name):
+                stat = item.stat()
+                is_dir = item.is_dir()
+                entries.append(FileEntry(os.path.join(path, item.name) + ('/' if is_dir else ''),
+                                         item.name + ('/' if is_dir else ''), 0 if is_dir else stat.st_size,
+                                         int(stat.st_mtime * 1000), is_dir))
+        if recursive:
+            entries = [found for entry in entries
+                       for found in ([entry] + (self.ls(entry.path, True) if entry.is_dir else []))]
+        return self._filter(entries, pattern)
+
+    def read_text(self, path: str, size: Optional[int] = None) -> str:
+        with open(self._local(path), 'r', encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def write_text(self, path: str, text: str, overwrite: bool = True) -> None:
+        local = self._local(path)
+        if not overwrite and os.path.exists(local):
+            raise FileExistsError(path)
+        os.makedirs(os.path.dirname(local) or '.', exist_ok=True)
+        with open(local, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+
+    def move(self, source: str, target: str) -> None:
+        local_target = self._local(target)
+        os.makedirs(os.path.dirname(local_target) or '.', exist_ok=True)
+        shutil.move(self._local(source), local_target)
+
+    def mkdirs(self, path: str) -> None:
+        os.makedirs(self._local(path), exist_ok=True)
+
+
+class DbutilsStorage(Storage):
+    """
+    Any path dbutils.fs handles (abfss://, dbfs:/, file:/).
+
+    Parameters:
+    dbutils: The notebook's dbutils
+    """
+
+    def __init__(self, dbutils):
+        self.fs = dbutils.fs
+
+    def ls(self, path: str, recursive: bool = False, pattern: Optional[str] = None) -> List[FileEntry]:
+        entries = [FileEntry(info.path, info.name, info.size, getattr(info, 'modificationTime', 0),
+                             info.name.endswith('/'))
+                   for info in self.fs.ls(path)]
+        if recursive:
+            entries = [found for entry in entries
+                       for found in ([entry] + (self.ls(entry.path, True) if entry.is_dir else []))]
+        return self._filter(entries, pattern)
+
+    def read_text(self, path: str, size: Optional[int] = None) -> str:
+        if size is None:
+            size = self.fs.ls(path)[0].size
+        if size == 0:
+            return ''
+        # One request for the whole file (head reads at most `size` bytes)
+        return self.fs.head(path, size)
+
+    def write_text(self, path: str, text: str, overwrite: bool = True) -> None:
+        self.fs.put(path, text, overwrite)
+
+    def move(self, source: str, target: str) -> None:
+        self.fs.mv(source, target)
+
+    def mkdirs(self, path: str) -> None:
+        self.fs.mkdirs(path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Read all files of a directory serially and with prefetch")
+    parser.add_argument('directory')
+    parser.add_argument('--pattern', default=None, help="File name pattern, e.g. '*.xml'")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds added to every read, to simulate a remote store")
+    args = parser.parse_args()
+
+    class DelayedStorage(LocalStorage):
+        def read_text(self, path: str, size: Optional[int] = None) -> str:
+            time.sleep(args.latency)
+            return super().read_text(path, size)
+
+    local = DelayedStorage() if args.latency else LocalStorage()
+    start = time.perf_counter()
+    entries = [entry for entry in local.ls(args.directory, recursive=True, pattern=args.pattern) if not entry.is_dir]
+    listed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    serial = sum(len(local.read_lines(entry.path, entry.size)) for entry in entries)
+    serial_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    contents = local.read_many(entries, args.workers)
+    prefetched_lines = sum(len(split_lines(text)) for text in contents.values())
+    prefetch_seconds = time.perf_counter() - start
+
+    total_bytes = sum(entry.size for entry in entries)
+    print(f"{len(entries)} files, {total_bytes / 2 ** 20:.1f} MiB, {serial} lines; listed in {listed:.3f}s")
+    print(f"serial read:   {serial_seconds:.3f}s")
+    print(f"prefetch read: {prefetch_seconds:.3f}s ({args.workers} workers, {prefetched_lines} lines)")
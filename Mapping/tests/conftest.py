@@ -0,0 +1,8 @@
+"""The Mapping modules import each other as top-level modules, so the tests run with Mapping on sys.path."""
+
+import os
+import sys
+
+MAPPING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if MAPPING_DIR not in sys.path:
+    sys.path.insert(0, MAPPING_DIR)
@@ -0,0 +1,61 @@
+import xml.etree.ElementTree as ET
+
+from calcview_splitter import split_calc_view, split_calc_view_by_dependencies
+
+XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+
+
+def view(view_id, inputs=(), padding=0):
+    nodes = ''.join(f'<input node="#{node}"/>' for node in inputs)
+    return (f'    <calculationView xsi:type="Calculation:ProjectionView" id="{view_id}">'
+            f'{nodes}<!-- {"x" * padding} --></calculationView>\n')
+
+
+def write_calc_view(path, views):
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<Calculation:scenario xmlns:xsi="{XSI}" xmlns:Calculation="http://www.sap.com/ndb/BiModelCalculation.ecore"'
+        ' id="CV_TEST">\n'
+        '  <dataSources/>\n'
+        '  <calculationViews>\n' + ''.join(views) + '  </calculationViews>\n'
+        '  <logicalModel id="Projection_1"/>\n'
+        '</Calculation:scenario>\n', encoding='utf-8')
+
+
+def view_ids(path):
+    root = ET.parse(path).getroot()
+    assert root.get('id') == 'CV_TEST' and root.find('logicalModel') is not None
+    views = root.find('calculationViews')
+    # The xsi:type prefix is still declared in every file
+    assert all(element.get(f'{{{XSI}}}type') == 'Calculation:ProjectionView' for element in views)
+    return [element.get('id') for element in views]
+
+
+def test_split_files_are_valid_xml_within_the_budget(tmp_path):
+    source = tmp_path / 'CV_TEST.calculationview'
+    write_calc_view(source, [view(f'V{number}', padding=40) for number in range(7)])
+    files = split_calc_view(str(source), str(tmp_path / 'out'), max_tokens=550, count_tokens=len, verbose=False)
+    assert len(files) > 1
+    assert all(split.tokens <= 550 for split in files)
+    assert [view_id for split in files for view_id in view_ids(split.path)] == [f'V{number}' for number in range(7)]
+
+
+def test_dependency_split_keeps_inputs_before_readers(tmp_path):
+    source = tmp_path / 'CV_TEST.calculationview'
+    write_calc_view(source, [
+        view('Join_1', ['Proj_A', 'Proj_B'], 30), view('Proj_C', padding=30), view('Proj_A', padding=30),
+        view('Agg_1', ['Join_1', 'Proj_C'], 30), view('Proj_B', padding=30)])
+    split = split_calc_view_by_dependencies(str(source), str(tmp_path / 'out'), max_tokens=600,
+                                            count_tokens=len, verbose=False)
+    files = [view_ids(split_file.path) for split_file in split.files]
+    order = [view_id for ids in files for view_id in ids]
+    assert sorted(order) == ['Agg_1', 'Join_1', 'Proj_A', 'Proj_B', 'Proj_C']
+    for reader, inputs in (('Join_1', ['Proj_A', 'Proj_B']), ('Agg_1', ['Join_1', 'Proj_C'])):
+        assert all(order.index(node) < order.index(reader) for node in inputs)
+
+    file_of = {view_id: number for number, ids in enumerate(files, start=1) for view_id in ids}
+    assert {(edge.input, edge.view) for edge in split.cut_edges} == {
+        (node, reader) for reader, inputs in (('Join_1', ['Proj_A', 'Proj_B']), ('Agg_1', ['Join_1', 'Proj_C']))
+        for node in inputs if file_of[node] != file_of[reader]}
+    wave_of = {number: wave for wave, numbers in enumerate(split.waves) for number in numbers}
+    assert all(wave_of[edge.input_file] < wave_of[edge.view_file] for edge in split.cut_edges)
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from convert_sql_files import find_sql_files, plan_tasks
+
+
+def test_outputs_keep_the_directory_layout():
+    tasks = plan_tasks([os.path.join('in', 'a.sql'), os.path.join('in', 'sub', 'b.txt')], 'out', keep_processed=True)
+    assert [(task.notebook_file, task.processed_file) for task in tasks] == [
+        (os.path.join('out', 'a.py'), os.path.join('out', 'a_processed.txt')),
+        (os.path.join('out', 'sub', 'b.py'), os.path.join('out', 'sub', 'b_processed.txt'))]
+
+
+def test_files_differing_by_extension_get_separate_outputs(tmp_path):
+    for name in ('a.sql', 'a.txt', 'b.sql'):
+        (tmp_path / name).write_text('SELECT 1;')
+    tasks = plan_tasks(find_sql_files([str(tmp_path)]), 'out')
+    assert sorted(os.path.basename(task.notebook_file) for task in tasks) == ['a_sql.py', 'a_txt.py', 'b.py']
+
+
+def test_remaining_collisions_fail():
+    with pytest.raises(ValueError, match='a_sql.py'):
+        plan_tasks([os.path.join('in', 'a_sql.sql'), os.path.join('in', 'a.sql'), os.path.join('in', 'a.txt')], 'out')
+
+
+def test_directory_search_skips_outputs_manifest_and_cache(tmp_path, monkeypatch):
+    for name in ('a.sql', os.path.join('sub', 'b.txt'), os.path.join('converted_notebooks', 'a_processed.txt'),
+                 os.path.join('.conversion_manifest', 'files.txt'), os.path.join('.mapping_cache', 'x.sql')):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text('SELECT 1;')
+    monkeypatch.chdir(tmp_path)
+    excluded = ['converted_notebooks', str(tmp_path / '.conversion_manifest'), '.mapping_cache']
+    assert find_sql_files(['.'], exclude_dirs=excluded) == ['a.sql', os.path.join('sub', 'b.txt')]
+    # Named files are still converted
+    assert find_sql_files(['.', os.path.join('.mapping_cache', 'x.sql')], exclude_dirs=excluded)[-1] == \
+        os.path.join('.mapping_cache', 'x.sql')
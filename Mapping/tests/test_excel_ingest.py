@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from excel_ingest import (build_nested_mapping, build_nested_mapping_rowwise, collect_field_values,
+                          collect_field_values_rowwise, read_excel_mapping)
+
+NAN = np.nan
+
+
+def field_sheets():
+    return {
+        'Field_A': pd.DataFrame({
+            'Used_by': ['CV_SALES', ' CV_SALES ', NAN, 'CV_STOCK', 'CV_SALES', 'CV_STOCK', 7],
+            'Base SAP CV - equivalent of DBX Table': ['SALES', 'SALES', 'X', NAN, 'SALES', 'STOCK', NAN],
+            'SAP Field Name': ['MATNR', 'ERDAT', 'MATNR', 'MATNR', 'MATNR', NAN, 42],
+            'DBX Field name': ['mat_nr', 'created_on', NAN, 'mat_nr', 'mat_nr', '', 42.0],
+            'DBX Table': ['sales', 'sales', 'sales', NAN, 'sales', 'stock', NAN],
+            'Comments': [NAN, NAN, 'ignored', NAN, 'kept', NAN, NAN],
+        }),
+        # Other 'Used_by' column name, a missing field column and an empty sheet
+        'Field_B': pd.DataFrame({
+            'ADSO GCM': ['ADSO_1', 'ADSO_2', 'ADSO_1'],
+            'SAP Field Name': ['KUNNR', 'VBELN', 'KUNNR'],
+            'DBX Field name': ['customer', NAN, 'customer_no'],
+        }),
+        'Field_C': pd.DataFrame({'Used by': pd.Series([NAN, NAN], dtype=object), 'SAP Field Name': ['A', 'B']}),
+        'Field_D': pd.DataFrame({'Other': ['no used-by column']}),
+    }
+
+
+def test_collect_field_values_matches_the_row_by_row_reference():
+    assert collect_field_values(field_sheets()) == collect_field_values_rowwise(field_sheets())
+
+
+def nested_sheet():
+    return pd.DataFrame({
+        'ADSO GCM': ['SALES', 'STOCK', NAN, 'SALES', 'SALES'],
+        'SAP Field Name': ['MATNR', 'MATNR', 'ERDAT', NAN, 'MATNR'],
+        'SAP Field description': ['Material', NAN, 'Created on', NAN, 'Material'],
+        'DBX Table': ['sales', 'stock', 'sales', NAN, 'sales'],
+        'DBX Field name': ['mat_nr', 'mat_nr', 'created_on', NAN, 42],
+    })
+
+
+def test_build_nested_mapping_matches_the_row_by_row_reference():
+    assert build_nested_mapping(nested_sheet()) == build_nested_mapping_rowwise(nested_sheet())
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_read_excel_mapping_from_a_workbook(tmp_path):
+    excel_file = str(tmp_path / 'mapping.xlsx')
+    with pd.ExcelWriter(excel_file) as writer:
+        pd.DataFrame({'x': [1]}).to_excel(writer, sheet_name='Overview', index=False)
+        nested_sheet().to_excel(writer, sheet_name='EWD field mapping_NN', index=False)
+    expected = build_nested_mapping_rowwise(pd.read_excel(excel_file, sheet_name='EWD field mapping_NN'))
+    assert read_excel_mapping(excel_file) == expected
+    assert [entry['SAP_Field_Description'] for entry in expected['SALES']] == ['Material', None, 'Material']
@@ -0,0 +1,60 @@
+import os
+import pickle
+
+import pandas as pd
+
+from convert_sql_files import load_conversion_mappings
+from field_lookup import FieldLookup, find_field_description, load_field_lookup
+from mapping_cache import shared_cache
+
+
+def test_indexes_follow_every_mutator():
+    lookup = FieldLookup({'ltst_sal_p': 'Latest sales price'})
+    lookup.update({'mat_nr': 'Material'}, plant_id='Plant')
+    lookup.setdefault('cust_no', 'Customer')
+    lookup |= {'doc_type': 'Document type'}
+    assert find_field_description('MATNR', lookup) == 'Material'
+    assert find_field_description('plantid', lookup) == 'Plant'
+    assert find_field_description('custno', lookup) == 'Customer'
+    assert find_field_description('doctype', lookup) == 'Document type'
+
+    del lookup['mat_nr']
+    assert lookup.pop('plant_id') == 'Plant'
+    assert find_field_description('matnr', lookup) is None
+    assert find_field_description('plantid', lookup) is None
+
+    lookup.clear()
+    assert find_field_description('ltstsalp', lookup) is None
+    assert lookup.normalized == {} and lookup.collisions == {}
+
+
+def test_removing_the_first_field_promotes_the_next():
+    lookup = FieldLookup({'mat_nr': 'Material', 'matnr': 'Material number'})
+    assert lookup.collision_report() == [('matnr', ['mat_nr', 'matnr'])]
+    del lookup['mat_nr']
+    assert find_field_description('ma_tnr', lookup) == 'Material number'
+    assert lookup.collision_report() == []
+
+
+def test_copies_and_pickles_keep_the_indexes():
+    lookup = FieldLookup({'mat_nr': 'Material'})
+    for copy in (lookup.copy(), lookup | {'plant_id': 'Plant'}, pickle.loads(pickle.dumps(lookup))):
+        assert isinstance(copy, FieldLookup)
+        assert find_field_description('matnr', copy) == 'Material'
+    assert 'plant_id' not in lookup
+
+
+def test_lookups_share_one_cache_per_directory(tmp_path, monkeypatch):
+    excel_file = str(tmp_path / 'comments.xlsx')
+    pd.DataFrame({'ADSO GCM': ['SALES'], 'SAP Field Name': ['MATNR'], 'SAP Field description': ['Material'],
+                  'DBX Table': ['sales'], 'DBX Field name': ['mat_nr']}).to_excel(
+        excel_file, sheet_name='EWD field mapping_NN', index=False)
+    monkeypatch.chdir(tmp_path)
+    cache = shared_cache()
+    assert shared_cache(str(tmp_path / '.mapping_cache')) is cache
+
+    first = load_field_lookup(excel_file)
+    second = load_field_lookup(excel_file)
+    _, third = load_conversion_mappings(excel_file, comment_excel=excel_file, cache_dir='.mapping_cache')
+    assert first == second == third == {'mat_nr': 'Material'}
+    assert (cache.stats['misses'], cache.stats['hits']) == (2, 2)
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from fuzzy_index import FuzzyIndex, calculate_similarity
+
+
+def random_names(rng, count):
+    parts = ['mat', 'nr', 'vbeln', 'erdat', 'kunnr', 'ltst', 'sal', 'doc', 'typ', 'x', 'q1', 'werks', 'zz']
+    suffixes = ['', '', '_p', '_r', '_cd', '_dat', '_code']
+    names = []
+    for _ in range(count):
+        name = '_'.join(rng.sample(parts, rng.randint(1, 3)))
+        if rng.random() < 0.3:
+            name = ''.join(rng.choice('abcdefgmnrstxz_') for _ in range(rng.randint(1, 10)))
+        names.append(name + rng.choice(suffixes))
+    return names
+
+
+@pytest.mark.parametrize('min_score', [0.0, 0.3, 0.45, 0.6, 0.75, 0.8, 0.85, 0.95])
+def test_top_k_matches_a_brute_force_scan(min_score):
+    rng = random.Random(7)
+    dbx_fields = list(dict.fromkeys(random_names(rng, 250)))
+    index = FuzzyIndex(dbx_fields)
+    for sap_field in random_names(rng, 100) + ['_p', 'MAT', 'x']:
+        scored = sorted((-calculate_similarity(sap_field, dbx_field), position)
+                        for position, dbx_field in enumerate(dbx_fields))
+        expected = [(dbx_fields[position], -score) for score, position in scored if -score >= min_score][:5]
+        assert index.top_k(sap_field, k=5, min_score=min_score) == expected, sap_field
+
+
+def test_low_overlap_pairs_above_the_threshold_are_found():
+    # Few shared trigrams, but the character sets and lengths are close
+    assert calculate_similarity('abcdef', 'fedcba') >= 0.6
+    assert FuzzyIndex(['fedcba', 'zzz']).best_match('abcdef', min_score=0.6) == 'fedcba'
@@ -0,0 +1,60 @@
+import pytest
+
+from incremental import ConversionManifest, MappingReferences
+from sql_conversion import make_sql_rewriter
+from sql_pipeline import convert_sql_file
+
+SQL = """CREATE TABLE VBAK (VBELN STRING, ERDAT DATE);
+
+INSERT INTO VBAK SELECT VBELN, ERDAT FROM STAGE;
+
+SELECT MATNR FROM MARA;
+"""
+
+
+def convert(tmp_path, field_mappings, streaming=False):
+    manifest = ConversionManifest(str(tmp_path / 'manifest'))
+    references = MappingReferences(field_mappings, {'VBAK': 'sales_header'})
+    result = convert_sql_file(str(tmp_path / 'in.sql'), str(tmp_path / 'out.py'), str(tmp_path / 'out.txt'),
+                              rewrite=make_sql_rewriter(field_mappings, {'VBAK': 'sales_header'}),
+                              field_lookup={'sales_document': 'Sales Document'}, streaming=streaming,
+                              manifest=manifest, references=references)
+    manifest.save()
+    outputs = (tmp_path / 'out.py').read_text(), (tmp_path / 'out.txt').read_text()
+    return result, outputs, manifest.report()
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_unchanged_file_is_reused_wholesale(tmp_path, streaming):
+    (tmp_path / 'in.sql').write_text(SQL)
+    mapping = {'VBELN': 'sales_document', 'ERDAT': 'created_on'}
+    first = convert(tmp_path, mapping, streaming)
+    assert first[2]['files_reused'] == 0
+
+    second = convert(tmp_path, mapping, streaming)
+    assert second[:2] == first[:2]
+    assert second[2]['files_reused'] == 1
+    assert second[2]['reused'] == second[2]['statements'] == first[2]['statements']
+
+
+def test_changed_mapping_falls_back_to_statements(tmp_path):
+    (tmp_path / 'in.sql').write_text(SQL)
+    convert(tmp_path, {'VBELN': 'sales_document', 'ERDAT': 'created_on'})
+    _, outputs, stats = convert(tmp_path, {'VBELN': 'sales_document', 'ERDAT': 'created_at'})
+    assert stats['files_reused'] == 0
+    # Only the statements using ERDAT are converted again
+    assert stats['rewritten'] == 2 and stats['mapping_changed'] == 2
+    assert 'created_at' in outputs[0] and 'created_on' not in outputs[0]
+
+
+def test_changed_file_falls_back_to_statements(tmp_path):
+    mapping = {'VBELN': 'sales_document', 'ERDAT': 'created_on'}
+    (tmp_path / 'in.sql').write_text(SQL)
+    convert(tmp_path, mapping)
+    (tmp_path / 'in.sql').write_text(SQL + '\nSELECT VBELN FROM VBAK;\n')
+    (num_statements, _), outputs, stats = convert(tmp_path, mapping)
+    assert num_statements == 4
+    assert stats['files_reused'] == 0 and stats['new_sql'] == 1
+    assert outputs[1].count('sales_header') == 3
+    # The previous file object is pruned, only the new one is kept
+    assert len(list((tmp_path / 'manifest' / 'files').glob('*/*.jsonl'))) == 1
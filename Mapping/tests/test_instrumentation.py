@@ -0,0 +1,87 @@
+import io
+import json
+import threading
+
+from instrumentation import DEBUG, INFO, REWRITE, WARNING, RunLog
+
+
+class Formatted:
+    """Argument that counts how often it is formatted."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return 'formatted'
+
+
+def test_ring_buffer_keeps_the_latest_messages():
+    log = RunLog(capacity=3, console_level=100)
+    for number in range(5):
+        log.info("message %d", number)
+    log.append('preformatted')
+    assert [record.text() for record in log.records] == ['message 3', 'message 4', 'preformatted']
+    assert log.dropped == 3 and len(log) == 3
+    assert log.reset() is log and len(log) == 0 and log.dropped == 0
+
+
+def test_messages_are_only_formatted_when_needed():
+    stream = io.StringIO()
+    log = RunLog(console_level=WARNING, record_level=INFO, stream=stream)
+    argument = Formatted()
+    log.debug("skipped %s", argument)
+    assert not log.is_enabled(DEBUG) and len(log) == 0
+    log.info("recorded %s", argument)
+    assert argument.calls == 0 and stream.getvalue() == ''
+    log.warning("printed %s", argument, action='Check')
+    assert argument.calls == 1 and stream.getvalue() == 'printed formatted\n'
+    assert list(log) == ['recorded formatted', '**Check**:\nprinted formatted\n']
+
+
+def test_counters_and_timers_add_up_across_threads():
+    log = RunLog(console_level=100)
+
+    @log.timed(REWRITE)
+    def work():
+        for _ in range(100):
+            log.count('statements')
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with log.timer('annotate'):
+        pass
+    log.add_time('annotate', 2.0, calls=3)
+
+    assert log.counters == {'statements': 800}
+    durations = log.stage_durations()
+    assert durations[REWRITE]['calls'] == 8 and durations['annotate']['calls'] == 4
+    assert durations['annotate']['seconds'] >= 2.0
+
+    # Metrics taken in a pool worker are merged into the parent
+    parent = RunLog(console_level=100)
+    parent.count('statements', 5)
+    parent.merge_metrics(log.take_metrics())
+    assert parent.counters == {'statements': 805}
+    assert parent.stage_durations()[REWRITE]['calls'] == 8
+    assert log.counters == {} and log.stage_durations() == {}
+
+
+def test_jsonl_export(tmp_path):
+    log = RunLog(console_level=100)
+    log.warning("Line %d: %s", 3, 'ünterminated', action='Lexer')
+    log.count('files', 2)
+    log.add_time(REWRITE, 0.5)
+    lines = [json.loads(line) for line in log.iter_jsonl()]
+    assert [line['type'] for line in lines] == ['log', 'counter', 'timer']
+    assert lines[0]['level'] == 'WARNING' and lines[0]['action'] == 'Lexer'
+    assert lines[0]['message'] == 'Line 3: ünterminated'
+    assert lines[1] == {'type': 'counter', 'name': 'files', 'value': 2}
+    assert lines[2] == {'type': 'timer', 'name': REWRITE, 'calls': 1, 'seconds': 0.5}
+
+    path = tmp_path / 'run_log.jsonl'
+    assert log.export_jsonl(str(path)) == 3
+    assert path.read_text(encoding='utf-8') == log.to_jsonl()
@@ -0,0 +1,161 @@
+import threading
+import time
+
+import pytest
+
+from instrumentation import RunLog
+from job_scheduler import DONE, FAILED, RESUMED, SKIPPED, CheckpointJournal, JobScheduler
+
+
+class Events:
+    """Thread-safe record of task starts and ends."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = []
+
+    def add(self, *event):
+        with self.lock:
+            self.items.append(event)
+
+    def index(self, *event):
+        return self.items.index(event)
+
+
+def scheduler(**options):
+    return JobScheduler(log=RunLog(console_level=100), **options)
+
+
+def test_tasks_start_after_their_dependencies(tmp_path):
+    events = Events()
+
+    def task(context, seconds):
+        events.add('start', context.key)
+        time.sleep(seconds)
+        events.add('end', context.key)
+        return sorted(context.inputs.items())
+
+    jobs = scheduler(max_workers=4)
+    jobs.add('c', task, 0.0, deps=['a', 'b'])
+    jobs.add('a', task, 0.03)
+    jobs.add('b', task, 0.01, deps=['a'])
+    jobs.add('d', task, 0.0)
+    results = jobs.run()
+
+    assert list(results) == ['c', 'a', 'b', 'd']
+    assert all(result.status == DONE for result in results.values())
+    assert events.index('end', 'a') < events.index('start', 'b')
+    assert events.index('end', 'b') < events.index('start', 'c')
+    assert results['c'].result == [('a', []), ('b', [('a', [])])]
+    # Independent tasks do not wait
+    assert events.index('start', 'd') < events.index('end', 'a')
+
+
+def test_a_group_only_waits_for_its_own_files():
+    events = Events()
+
+    def read(context, seconds):
+        time.sleep(seconds)
+        return context.key
+
+    def convert(context):
+        events.add('group', sorted(context.inputs.values()))
+
+    def long_file(context):
+        time.sleep(0.3)
+        events.add('long file')
+
+    jobs = scheduler(max_workers=3)
+    jobs.add('long', long_file, priority=10)
+    for number, seconds in enumerate([0.02, 0.05, 0.01]):
+        jobs.add(f"read:{number}", read, seconds)
+    jobs.add('group', convert, deps=['read:0', 'read:1', 'read:2'])
+    results = jobs.run()
+
+    assert JobScheduler.summary(results) == {DONE: 5, RESUMED: 0, FAILED: 0, SKIPPED: 0}
+    assert events.items == [('group', ['read:0', 'read:1', 'read:2']), ('long file',)]
+
+
+def test_a_failure_skips_only_its_dependents(tmp_path):
+    def fail(context):
+        raise RuntimeError('model call failed')
+
+    journal = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+    jobs = scheduler(max_workers=2, journal=journal)
+    jobs.add('a', fail)
+    jobs.add('b', lambda context: 'b', deps=['a'])
+    jobs.add('c', lambda context: 'c', deps=['b'])
+    jobs.add('d', lambda context: 'd')
+    results = jobs.run()
+
+    assert [results[key].status for key in 'abcd'] == [FAILED, SKIPPED, SKIPPED, DONE]
+    assert results['a'].error == 'RuntimeError: model call failed'
+    assert results['c'].error == 'dependency b skipped'
+    assert jobs.log.counters == {'tasks_failed': 1, 'tasks_skipped': 2, 'tasks_done': 1}
+    assert journal.finished() == ['d']
+
+
+def test_a_restart_resumes_from_the_journal(tmp_path):
+    path = str(tmp_path / 'checkpoints' / 'DF34.jsonl')
+    calls = []
+
+    def read(context):
+        calls.append(context.key)
+        return context.key.upper()
+
+    def convert(context, fail):
+        calls.append(context.key)
+        initial = context.step('initial', lambda: calls.append('initial') or 'initial output')
+        if fail:
+            raise RuntimeError('cluster restarted')
+        return [initial] + sorted(context.inputs.values())
+
+    def add_tasks(jobs, fail, fingerprint='v1'):
+        jobs.add('read:a', read, checkpoint=False)
+        jobs.add('read:b', read, checkpoint=False)
+        jobs.add('group:1', convert, fail, deps=['read:a', 'read:b'], fingerprint=fingerprint)
+        jobs.add('file:c', convert, False, fingerprint=fingerprint)
+
+    jobs = scheduler(journal=CheckpointJournal(path))
+    add_tasks(jobs, fail=True)
+    assert jobs.run()['group:1'].status == FAILED
+    assert calls.count('initial') == 2
+
+    # The group runs again after its recorded step, the finished file is not run at all
+    calls.clear()
+    jobs = scheduler(journal=CheckpointJournal(path))
+    add_tasks(jobs, fail=False)
+    results = jobs.run()
+    assert results['group:1'].status == DONE
+    assert results['group:1'].result == ['initial output', 'READ:A', 'READ:B']
+    assert results['file:c'].status == RESUMED and results['file:c'].result == ['initial output']
+    assert sorted(calls) == ['group:1', 'read:a', 'read:b']
+
+    # Everything finished: the reads only the group needed are not run either
+    calls.clear()
+    journal = CheckpointJournal(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "torn')
+    jobs = scheduler(journal=CheckpointJournal(path))
+    add_tasks(jobs, fail=False)
+    assert JobScheduler.summary(jobs.run())[RESUMED] == 4 and calls == []
+
+    # A changed input (fingerprint) is converted again
+    journal.compact()
+    jobs = scheduler(journal=CheckpointJournal(path))
+    add_tasks(jobs, fail=False, fingerprint='v2')
+    assert JobScheduler.summary(jobs.run())[DONE] == 4 and calls.count('initial') == 2
+
+
+def test_cycles_and_unknown_dependencies_are_rejected():
+    jobs = scheduler()
+    jobs.add('a', lambda context: None, deps=['b'])
+    jobs.add('b', lambda context: None, deps=['a'])
+    with pytest.raises(ValueError, match='circular dependencies: a, b'):
+        jobs.run()
+    with pytest.raises(ValueError, match='Duplicate task key'):
+        jobs.add('a', lambda context: None)
+    jobs = scheduler()
+    jobs.add('a', lambda context: None, deps=['missing'])
+    with pytest.raises(ValueError, match='unknown task missing'):
+        jobs.run()
@@ -0,0 +1,37 @@
+import json
+
+from lineage_diagram import BOTH, DOWNSTREAM, iter_dot, iter_json, iter_mermaid, short_name, short_names, table_diagram
+from lineage_graph import LineageGraph
+
+MIXED_CASE = [('V', 'a', 'T', 'a'), ('v', 'b', 't', 'b'), ('W', 'c', 'v', 'b')]
+
+
+def test_mixed_case_tables_are_one_node():
+    graph = LineageGraph(MIXED_CASE)
+    assert graph.table_edges() == {('V', 'T'): 2, ('W', 'V'): 1}
+    diagram = table_diagram(graph)
+    assert sorted(diagram.nodes) == ['T', 'V', 'W']
+    assert sorted(diagram.edges) == [('V', 'T', 2), ('W', 'V', 1)]
+    assert diagram.base == {'T'}
+    dot = ''.join(iter_dot(diagram))
+    assert '"W" -> "V"' in dot and '"V" -> "T"' in dot
+    assert ''.join(iter_mermaid(diagram)).count('-->') == 2
+
+
+def test_root_depth_and_direction():
+    graph = LineageGraph([('B', 'x', 'A', 'x'), ('C', 'x', 'B', 'x'), ('D', 'x', 'C', 'x')])
+    assert table_diagram(graph, root='c', depth=1).edges == [('C', 'B', 1)]
+    assert sorted(table_diagram(graph, root='B', direction=DOWNSTREAM).nodes) == ['B', 'C', 'D']
+    assert sorted(table_diagram(graph, root='B', depth=1, direction=BOTH).nodes) == ['A', 'B', 'C']
+
+
+def test_json_is_valid():
+    document = json.loads(''.join(iter_json(table_diagram(LineageGraph(MIXED_CASE)))))
+    assert {node['name'] for node in document['nodes']} == {'T', 'V', 'W'}
+    assert len(document['edges']) == 2
+
+
+def test_short_names_keep_the_full_name_on_collisions():
+    assert short_name('"_SYS_BIC"."pkg.sub/CV_X"') == 'CV_X'
+    assert short_names(['nntst.CV_A', 'prod.CV_A', 'nntst.CV_B']) == {
+        'nntst.CV_A': 'nntst.CV_A', 'prod.CV_A': 'prod.CV_A', 'nntst.CV_B': 'CV_B'}
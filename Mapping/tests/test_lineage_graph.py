@@ -0,0 +1,41 @@
+import pytest
+
+from lineage_graph import LineageGraph
+
+CYCLE_ROWS = [('A', 'x', 'B', 'x'), ('B', 'x', 'A', 'x'), ('B', 'x', 'C', 'x')]
+
+
+@pytest.mark.parametrize('order', [('A', 'B'), ('B', 'A')])
+def test_cycle_results_do_not_depend_on_query_order(order):
+    graph = LineageGraph(CYCLE_ROWS)
+    assert {table: graph.base_columns(table, 'x') for table in order} == {
+        'A': frozenset([('C', 'x')]), 'B': frozenset([('C', 'x')])}
+    assert graph.cycles == [[('A', 'x'), ('B', 'x'), ('A', 'x')]]
+
+
+@pytest.mark.parametrize('order', [('A', 'B'), ('B', 'A')])
+def test_cycle_paths_do_not_depend_on_query_order(order):
+    graph = LineageGraph(CYCLE_ROWS)
+    paths = {table: [[(edge.source_table, edge.source_column) for edge in path]
+                     for path in graph.upstream_paths(table, 'x')] for table in order}
+    assert paths == {'A': [[('B', 'x'), ('C', 'x')]], 'B': [[('C', 'x')]]}
+
+
+def test_closure_and_final_columns_through_a_cycle():
+    graph = LineageGraph(CYCLE_ROWS + [('D', 'y', 'A', 'x')])
+    assert graph.closure()[('D', 'y')] == frozenset([('C', 'x')])
+    assert graph.final_columns('C', 'x') == frozenset([('D', 'y')])
+
+
+def test_lookups_are_case_insensitive_and_follow_star_rows():
+    graph = LineageGraph([('V', '*', 'T', '*'), ('T', '*', 'BASE', '*'), ('W', 'a', 'v', 'AMOUNT')])
+    assert graph.base_tables('w', 'A') == {'BASE'}
+    assert graph.base_columns('W', 'a') == frozenset([('BASE', 'AMOUNT')])
+
+
+def test_columns_computed_from_literals_have_no_base_columns():
+    graph = LineageGraph([('V', 'flag', '', ''), ('W', 'flag', 'V', 'flag')])
+    assert graph.base_columns('W', 'flag') == frozenset()
+    assert list(graph.path_records([('W', 'flag')])) == [{
+        'DEPTH': 1, 'TARGET_TABLE_NAME': 'W', 'TARGET_COLUMN_NAME': 'flag', 'SOURCE_TABLE_NAME': 'V',
+        'SOURCE_COLUMN_NAME': 'flag', 'TRANSFORMATION': ''}]
@@ -0,0 +1,36 @@
+import sqlite3
+
+from metadata_harvester import TABLE, VIEW, ColumnMetadata, MetadataHarvester, SqliteMetadataSource
+
+
+def sample_source(tmp_path):
+    sales = str(tmp_path / 'sales.db')
+    with sqlite3.connect(sales) as connection:
+        connection.execute('CREATE TABLE orders (id INTEGER, amount DECIMAL(10,2))')
+        connection.execute('CREATE VIEW big_orders AS SELECT id FROM orders WHERE amount > 100')
+    return SqliteMetadataSource(str(tmp_path / 'main.db'), {'sales': sales})
+
+
+EXPECTED = [
+    ColumnMetadata(VIEW, 'cat', 'sales', 'BIG_ORDERS', 'ID', 'INTEGER'),
+    ColumnMetadata(TABLE, 'cat', 'sales', 'ORDERS', 'ID', 'INTEGER'),
+    ColumnMetadata(TABLE, 'cat', 'sales', 'ORDERS', 'AMOUNT', 'DECIMAL(10,2)')]
+
+
+def test_bulk_and_fallback_give_the_same_columns(tmp_path):
+    source = sample_source(tmp_path)
+    assert MetadataHarvester(source).harvest([('cat', 'sales')]) == EXPECTED
+    assert MetadataHarvester(source, bulk=False).harvest([('cat', 'sales')]) == EXPECTED
+
+
+def test_schemas_are_cached_and_missing_ones_reported(tmp_path):
+    source = sample_source(tmp_path)
+    harvester = MetadataHarvester(source, ttl_seconds=60)
+    assert harvester.harvest([('cat', 'sales'), ('cat', 'missing'), ('cat', 'sales')]) == EXPECTED
+    assert list(harvester.errors) == [('cat', 'missing')]
+
+    with sqlite3.connect(source.schemas['sales']) as connection:
+        connection.execute('CREATE TABLE returns (id INTEGER)')
+    assert harvester.harvest([('CAT', 'SALES')]) == EXPECTED
+    harvester.invalidate('cat')
+    assert len(harvester.harvest([('cat', 'sales')])) == len(EXPECTED) + 1
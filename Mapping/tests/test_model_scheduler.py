@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from fake_openai_server import FakeChatServer
+from instrumentation import RunLog
+from model_scheduler import ModelCallScheduler, RetryPolicy, TokenBucket, http_chat_sender
+from response_cache import ResponseCache
+
+
+def request(number=0, max_tokens=None):
+    request = {'model': 'o1', 'messages': [{'role': 'user', 'content': f"Convert view {number:03d}" + 'x' * 24}]}
+    if max_tokens:
+        request['max_tokens'] = max_tokens
+    return request
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(**options):
+        servers.append(FakeChatServer(latency=options.pop('latency', 0.01), **options))
+        return servers[-1], servers[-1].start()
+    yield start
+    for fake in servers:
+        fake.stop()
+
+
+def scheduler(base_url, **options):
+    options.setdefault('retry', RetryPolicy(base_delay=0.01, max_delay=0.05))
+    return ModelCallScheduler(http_chat_sender(base_url), log=RunLog(console_level=100), **options)
+
+
+def test_429_is_retried_after_retry_after(server):
+    fake, base_url = server(rate_limit_first=2, retry_after=0.2)
+    calls = scheduler(base_url)
+    started = time.monotonic()
+    response = asyncio.run(calls.call(request(), tag='view'))
+    assert response['choices'][0]['message']['content'].startswith('-- Converted')
+    # Two 429 answers, each pausing all calls for Retry-After
+    assert time.monotonic() - started >= 0.4
+    assert fake.stats['rate_limited'] == 2 and fake.stats['completed'] == 1
+    assert calls.metrics[-1].attempts == 3
+    assert calls.summary()['retries'] == 2
+
+
+def test_calls_in_flight_are_bounded(server):
+    fake, base_url = server(latency=0.05)
+    asyncio.run(scheduler(base_url, max_concurrency=3).map([request(n) for n in range(12)]))
+    assert fake.stats['completed'] == 12
+    assert fake.stats['max_in_flight'] == 3
+
+
+def test_requests_per_minute_are_limited(server):
+    fake, base_url = server()
+    calls = scheduler(base_url, max_concurrency=8)
+    calls.requests = TokenBucket(600, capacity=2)  # 10 per second after a burst of 2
+    started = time.monotonic()
+    asyncio.run(calls.map([request(n) for n in range(7)]))
+    assert time.monotonic() - started >= 0.45
+    assert fake.stats['completed'] == 7
+
+
+@pytest.mark.parametrize('capacity', [1000, 50])
+def test_tokens_are_refunded_against_what_was_taken(server, capacity):
+    # Estimate: 36 characters / 4 + 1 + 100 = 110 tokens; the first attempt is answered 429
+    fake, base_url = server(rate_limit_first=1, retry_after=0.05)
+    calls = scheduler(base_url)
+    calls.tokens = TokenBucket(60, capacity=capacity)
+    response = asyncio.run(calls.call(request(max_tokens=100)))
+    used = response['usage']['prompt_tokens'] + response['usage']['completion_tokens']
+    calls.tokens.adjust(0)
+    # Only the usage of the successful attempt is taken; refills add about one token per second
+    assert capacity - used <= calls.tokens.tokens <= capacity - used + 2
+
+
+def test_cache_hits_do_not_call_the_model(server, tmp_path):
+    fake, base_url = server()
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    calls = scheduler(base_url, cache=cache)
+    first = asyncio.run(calls.call(request()))
+    second = asyncio.run(calls.call(request()))
+    assert second['choices'][0]['message']['content'] == first['choices'][0]['message']['content']
+    assert fake.stats['requests'] == 1
+    assert [m.cached for m in calls.metrics] == [False, True]
+    cache.close()
+
+
+def test_metrics_sum_the_usage_and_are_bounded(server):
+    fake, base_url = server()
+    calls = scheduler(base_url, metrics_capacity=3)
+    responses = asyncio.run(calls.map([request(n) for n in range(5)], tags=[f"view_{n}" for n in range(5)]))
+    assert len(calls.metrics) == 3 and calls.dropped_metrics == 2
+    summary = calls.summary()
+    assert summary['calls'] == 3 and summary['dropped'] == 2 and summary['errors'] == 0
+    kept = {m.tag for m in calls.metrics}
+    assert summary['prompt_tokens'] == sum(response['usage']['prompt_tokens']
+                                           for n, response in enumerate(responses) if f"view_{n}" in kept)
+    assert calls.log.counters['model_calls'] == 5
@@ -0,0 +1,105 @@
+import itertools
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, request_key
+
+
+def request(prompt='Convert view 001', model='o1', system='You convert SQL.', **params):
+    messages = [{'role': 'system', 'content': system}] if system else []
+    return dict(model=model, messages=messages + [{'role': 'user', 'content': prompt}], **params)
+
+
+def response(content, finish_reason='stop'):
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+            'usage': {'prompt_tokens': 10, 'completion_tokens': 5}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    yield cache
+    cache.close()
+
+
+def test_key_separates_model_system_message_and_params(cache):
+    variants = [request(), request(model='gpt-4o'), request(system='Other system message.'), request(system=None),
+                request(temperature=0), request(max_tokens=100), request(prompt='Convert view 002')]
+    keys = {request_key(variant)['key'] for variant in variants}
+    assert len(keys) == len(variants)
+    # The prompt hash ignores the system message, parameters and model
+    assert len({request_key(variant)['prompt_sha256'] for variant in variants[:-1]}) == 1
+
+    for number, variant in enumerate(variants):
+        assert cache.put(variant, response(f"answer {number}"))
+    for number, variant in enumerate(variants):
+        assert cache.get(variant).choices[0].message.content == f"answer {number}"
+    assert cache.get(request(temperature=1)) is None
+    assert cache.stats()['hits'] == len(variants) and cache.stats()['saved_tokens'] == 15 * len(variants)
+
+
+def test_truncated_and_empty_answers_are_not_stored(cache):
+    assert not cache.put(request(), response('-- cut off', finish_reason='length'))
+    assert not cache.put(request(), response(''))
+    assert cache.get(request()) is None and cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_are_evicted_to_90_percent(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(response_cache, 'time', SimpleNamespace(time=lambda: float(next(clock))))
+    size = len(json.dumps(response('answer 001')))
+    cache = ResponseCache(str(tmp_path / 'cache'), max_bytes=4 * size + size // 2)
+    for number in range(1, 5):
+        cache.put(request(f"view {number:03d}"), response(f"answer {number:03d}"))
+    assert cache.get(request('view 001')) is not None
+    assert cache.stats()['evictions'] == 0
+
+    # 5 entries exceed max_bytes; evicting the least recently used one (view 002) gets below 90%
+    cache.put(request('view 005'), response('answer 005'))
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 4 and stats['bytes'] <= 0.9 * cache.max_bytes
+    assert cache.get(request('view 002')) is None
+    assert all(cache.get(request(f"view {number:03d}")) for number in (1, 3, 4, 5))
+
+    # Far over the limit: evict down to 90% in one go, not only to max_bytes
+    cache.max_bytes = 2 * size
+    cache.put(request('view 006'), response('answer 006'))
+    assert cache.stats()['entries'] == 1
+    cache.close()
+
+
+def test_concurrent_writers_share_the_database(tmp_path):
+    directory = str(tmp_path / 'cache')
+    errors = []
+
+    def writer(number):
+        # One connection per writer, as separate notebook processes would have
+        cache = ResponseCache(directory)
+        try:
+            for item in range(25):
+                prompt = f"writer {number} view {item}"
+                cache.put(request(prompt), response(f"answer {number}/{item}"))
+                assert cache.get(request(prompt)) is not None
+                # Readers see the rows of the other writers
+                cache.get(request(f"writer {(number + 1) % 4} view {item}"))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            cache.close()
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    cache = ResponseCache(directory)
+    assert cache.stats()['entries'] == 100
+    assert cache.get(request('writer 3 view 24')).choices[0].message.content == 'answer 3/24'
+    assert cache._db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    cache.close()
@@ -0,0 +1,28 @@
+from sql_annotator import ADDED, MISSING, annotate_ddl
+
+LOOKUP = {'id': 'Id', 'tags': 'Tags', 's': 'S', 'l': 'L', 'amount': 'Amount'}
+
+
+def test_comments_go_after_each_column():
+    sql, report = annotate_ddl("CREATE TABLE t (id INT, amount DECIMAL(5, 0), other STRING)", LOOKUP)
+    assert sql == ("CREATE TABLE t (id INT COMMENT('Id'), amount DECIMAL(5, 0) COMMENT('Amount'), "
+                   "other STRING)")
+    assert [column.status for column in report.columns] == [ADDED, ADDED, MISSING]
+    assert report.missing_fields == ['other']
+
+
+def test_complex_types_are_one_column():
+    sql, report = annotate_ddl(
+        "CREATE TABLE t (id INT, tags MAP<STRING, INT>, s STRUCT<a: INT, b: STRING>, "
+        "l ARRAY<STRUCT<x: DECIMAL(5,2), y: MAP<STRING, INT>>>)", LOOKUP)
+    assert sql == ("CREATE TABLE t (id INT COMMENT('Id'), tags MAP<STRING, INT> COMMENT('Tags'), "
+                   "s STRUCT<a: INT, b: STRING> COMMENT('S'), "
+                   "l ARRAY<STRUCT<x: DECIMAL(5,2), y: MAP<STRING, INT>>> COMMENT('L'))")
+    assert [column.column for column in report.columns] == ['id', 'tags', 's', 'l']
+    assert report.missing_fields == []
+
+
+def test_comparison_outside_complex_types_is_not_a_bracket():
+    sql, report = annotate_ddl("CREATE TABLE t (id INT CHECK (id > 0), tags STRING)", LOOKUP)
+    assert sql == "CREATE TABLE t (id INT CHECK (id > 0) COMMENT('Id'), tags STRING COMMENT('Tags'))"
+    assert report.comments_added == 2
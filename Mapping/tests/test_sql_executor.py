@@ -0,0 +1,65 @@
+import sqlite3
+import time
+
+from sql_executor import (ASSIGN, BARRIER, CREATE, QUERY, WRITE, SqliteExecutor, execute_plan, parse_statement,
+                          plan_sql, split_sql)
+
+VIEW_OVER_TABLE = """
+CREATE TABLE t (c INT);
+CREATE VIEW v AS SELECT c FROM t;
+INSERT INTO t VALUES (1);
+CREATE TABLE x AS SELECT * FROM v;
+"""
+
+
+class SlowInsertExecutor(SqliteExecutor):
+    """Gives an INSERT time to lose a race against anything not waiting for it."""
+
+    def execute(self, statement):
+        if statement.kind == WRITE:
+            time.sleep(0.2)
+        super().execute(statement)
+
+
+def test_split_keeps_semicolons_in_literals_and_comments():
+    assert split_sql("SELECT ';' AS a; -- x; y\nSELECT 2;\n/* only; a comment */;") == [
+        "SELECT ';' AS a", "-- x; y\nSELECT 2"]
+
+
+def test_statement_kinds_targets_and_reads():
+    create = parse_statement(0, "CREATE OR REPLACE TEMPORARY VIEW v AS SELECT a FROM s.t JOIN u ON t.k = u.k")
+    assert (create.kind, create.target) == (CREATE, 'v')
+    assert {'s.t', 'u'} <= set(create.reads)
+    assign = parse_statement(1, "IT_X = SELECT * FROM :IT_Y")
+    assert (assign.kind, assign.target) == (ASSIGN, 'it_x') and 'it_y' in assign.reads
+    assert parse_statement(2, "INSERT INTO t VALUES (1)")[2:4] == (WRITE, 't')
+    assert parse_statement(3, "SELECT 1")[2] == QUERY
+    assert parse_statement(4, "USE CATALOG c")[2] == BARRIER
+
+
+def test_plan_orders_by_names_and_barriers():
+    plan = plan_sql("CREATE VIEW a AS SELECT 1 AS c; CREATE VIEW b AS SELECT 2 AS c; "
+                    "CREATE VIEW ab AS SELECT * FROM a UNION ALL SELECT * FROM b; USE s; CREATE VIEW d AS SELECT 3;")
+    assert plan.deps == [(), (), (0, 1), (0, 1, 2), (3,)]
+    assert plan.waves() == [[0, 1], [2], [3], [4]]
+
+
+def test_reading_a_view_waits_for_writes_to_its_tables():
+    plan = plan_sql(VIEW_OVER_TABLE)
+    assert 2 in plan.deps[3]  # CREATE TABLE x reads t through v, after the INSERT
+
+
+def test_view_sources_are_expanded_through_views_and_variables():
+    plan = plan_sql("CREATE TABLE t (c INT); IT_A = SELECT c FROM t; CREATE VIEW v AS SELECT c FROM :IT_A; "
+                    "INSERT INTO t VALUES (1); SELECT * FROM v;")
+    assert 3 in plan.deps[4]
+    # and the INSERT waits for the statements that read t through the views before it
+    assert {1, 2} <= set(plan.deps[3])
+
+
+def test_sqlite_executor_materializes_after_the_insert(tmp_path):
+    executor = SlowInsertExecutor(str(tmp_path / 'plan.sqlite'))
+    report = execute_plan(plan_sql(VIEW_OVER_TABLE), executor, max_workers=4)
+    assert report.failed == []
+    with sqlite3.connect(executor.path) as connection:
+        assert connection.execute('SELECT c FROM x').fetchall() == [(1,)]
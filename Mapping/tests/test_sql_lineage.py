@@ -0,0 +1,61 @@
+from sql_lineage import LineageRow, extract_lineage, lineage_insert_sql
+
+TABLES = """
+CREATE TABLE base (id INT, amt DECIMAL(10, 2), name STRING);
+CREATE TABLE other (id INT, qty INT);
+"""
+
+
+def lineage(sql):
+    return [tuple(row) for row in extract_lineage(TABLES + sql) if row.target_table not in ('base', 'other')]
+
+
+def test_cte_and_alias_chain_the_transformations():
+    assert lineage("""
+        CREATE VIEW v AS
+        WITH c AS (SELECT id, amt * 2 AS dbl FROM base)
+        SELECT b.name, c.dbl AS total FROM base b JOIN c ON b.id = c.id;
+        CREATE VIEW n AS SELECT s.w + 1 AS z FROM (SELECT amt * 2 AS w FROM base) s;
+    """) == [
+        ('v', 'name', 'base', 'name', ''),
+        ('v', 'total', 'base', 'amt', 'amt * 2'),
+        ('n', 'z', 'base', 'amt', 'amt * 2 -> s.w + 1')]
+
+
+def test_star_and_unqualified_columns_resolve_through_the_catalog():
+    assert lineage("""
+        CREATE VIEW j AS SELECT name, qty FROM base JOIN other USING (id);
+        CREATE TABLE copy AS SELECT * FROM j;
+        INSERT INTO target SELECT o.* FROM other o;
+    """) == [
+        ('j', 'name', 'base', 'name', ''),
+        ('j', 'qty', 'other', 'qty', ''),
+        ('copy', 'name', 'j', 'name', ''),
+        ('copy', 'qty', 'j', 'qty', ''),
+        ('target', 'id', 'other', 'id', ''),
+        ('target', 'qty', 'other', 'qty', '')]
+
+
+def test_set_operations_and_table_variables():
+    assert lineage("""
+        CREATE VIEW u AS SELECT id AS k FROM base UNION ALL SELECT qty FROM other;
+        IT_X = SELECT name FROM base;
+        IT_Y = SELECT name AS label, 'k' AS lit FROM :IT_X;
+    """) == [
+        ('u', 'k', 'base', 'id', ''),
+        ('u', 'k', 'other', 'qty', ''),
+        ('IT_X', 'name', 'base', 'name', ''),
+        ('IT_Y', 'label', 'IT_X', 'name', ''),
+        ('IT_Y', 'lit', '', '', "'k'")]
+
+
+def test_unparsable_statements_are_skipped():
+    rows = lineage("CREATE VIEW broken AS SELECT (name FROM base; CREATE VIEW ok AS SELECT id FROM base;")
+    assert rows == [('ok', 'id', 'base', 'id', '')]
+
+
+def test_insert_sql_escapes_and_batches():
+    rows = [LineageRow('t', 'c', '', '', "'it''s'")] * 3
+    sql = lineage_insert_sql(rows, 'flow_lineage', batch_size=2)
+    assert sql.count('INSERT INTO flow_lineage (TARGET_TABLE_NAME, ') == 2
+    assert "('t', 'c', '', '', '\\'it\\'\\'s\\'')" in sql
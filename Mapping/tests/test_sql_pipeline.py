@@ -0,0 +1,93 @@
+import io
+import os
+
+import pytest
+
+from sql_annotator import process_sql_string
+from sql_conversion import build_notebook, format_spark_sql, iter_sql_statements, make_sql_rewriter, read_chunks
+from sql_lexer import PUNCT, tokenize
+from sql_pipeline import NotebookWriter, SparkSqlWriter, SqlPipeline, convert_sql_file
+
+# ';' inside literals, quoted identifiers and comments does not end a statement
+TRICKY_SQL = ("-- header; with a semicolon\n"
+              "CREATE TABLE t (a STRING COMMENT 'x;y', `b;c` INT, \"d;\" INT);\n\n"
+              "/* block; comment */ INSERT INTO t SELECT 'it''s; fine', 'a\\';b' FROM s; SELECT 1;\n\n"
+              "SELECT 2 -- trailing; comment\n;\n"
+              "SELECT '/* not a comment;' AS x, 3 - -4 / 2;\n\n"
+              "SELECT 5")
+
+
+def lexer_statements(sql):
+    """Reference split: after every ';' token of the SQL lexer."""
+    statements, current = [], ''
+    for token in tokenize(sql):
+        current += token.text
+        if token.kind == PUNCT and token.text == ';':
+            statements.append(current)
+            current = ''
+    if current.strip():
+        statements.append(current)
+    return statements
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1 << 16])
+def test_streaming_split_skips_semicolons_in_literals_and_comments(chunk_size):
+    statements = list(iter_sql_statements(read_chunks(io.StringIO(TRICKY_SQL), chunk_size)))
+    assert statements == lexer_statements(TRICKY_SQL)
+    assert len(statements) == 6 and statements[-1] == '\n\nSELECT 5'
+    assert ''.join(statements) == TRICKY_SQL
+
+
+def test_streaming_and_batch_agree_on_blank_line_separated_statements(tmp_path):
+    sql = ("CREATE TABLE vbak (\n    vbeln STRING,\n    erdat DATE\n);\n\n"
+           "INSERT INTO vbak SELECT vbeln, 'a;b' FROM stage;\n\n-- kept; together\n"
+           "SELECT vbeln FROM vbak\n")
+    (tmp_path / 'in.sql').write_text(sql)
+    rewrite = make_sql_rewriter({'VBELN': 'sales_document'}, {'vbak': 'sales_header'})
+    outputs = []
+    for streaming in (False, True):
+        notebook, processed = tmp_path / f"{streaming}.py", tmp_path / f"{streaming}.txt"
+        result = convert_sql_file(str(tmp_path / 'in.sql'), str(notebook), str(processed), rewrite=rewrite,
+                                  field_lookup={'sales_document': 'Sales Document'}, streaming=streaming)
+        outputs.append((result, notebook.read_text(), processed.read_text()))
+    assert outputs[0] == outputs[1]
+    assert outputs[0][0] == (3, 1)
+
+
+SAMPLE_SQL = os.path.join(os.path.dirname(__file__), '..', '..', 'tf_steftedata_BRP_variant.sql')
+
+
+@pytest.mark.parametrize('source', ['tricky', 'sample'])
+@pytest.mark.parametrize('field_lookup', [None, {'mutation_id': 'Mutation ID', 'zvtaid': 'Contract'}])
+def test_batch_output_is_byte_identical_to_the_two_step_conversion(tmp_path, source, field_lookup):
+    if source == 'sample':
+        with open(SAMPLE_SQL, encoding='utf-8') as f:
+            sql = f.read()
+    else:
+        sql = TRICKY_SQL
+    input_file = tmp_path / 'in.sql'
+    input_file.write_text(sql, encoding='utf-8')
+    rewrite = make_sql_rewriter({'ZMUTID': 'mutation_id', 'A': 'col_a'}, {'t': 'target'})
+
+    # process_sql_file writes the spark.sql() file, create_databricks_notebook reads it back
+    content = rewrite(sql)
+    if field_lookup is not None:
+        content, _, _ = process_sql_string(content, field_lookup, verbose=False)
+    processed, num_statements = format_spark_sql(content)
+    notebook, _ = build_notebook(processed)
+
+    result = convert_sql_file(str(input_file), str(tmp_path / 'out.py'), str(tmp_path / 'out.txt'),
+                              rewrite=rewrite, field_lookup=field_lookup)
+    assert (tmp_path / 'out.txt').read_text(encoding='utf-8') == processed
+    assert (tmp_path / 'out.py').read_text(encoding='utf-8') == notebook
+    assert result[0] == num_statements
+
+
+@pytest.mark.parametrize('statements', [[], ['SELECT 1;'], ['SELECT 1;', "SELECT '2;'\nFROM t;"]])
+def test_writers_match_the_string_functions(statements):
+    notebook, processed = io.StringIO(), io.StringIO()
+    pipeline = SqlPipeline([])
+    assert pipeline.run(statements, [NotebookWriter(notebook), SparkSqlWriter(processed)]) == len(statements)
+    expected_processed, _ = format_spark_sql('\n\n'.join(statements))
+    assert processed.getvalue() == expected_processed
+    assert notebook.getvalue() == build_notebook(expected_processed)[0]
@@ -0,0 +1,59 @@
+import pytest
+
+from instrumentation import run_log
+from sql_rewriter import FieldRewriter, SqlRewriter, rewrite_fields_sequential
+
+SQL = "SELECT matnr, ÄNDR, t.Erdat FROM t WHERE c = 'MATNR' -- MATNR\n"
+
+
+@pytest.mark.parametrize('field_mappings', [
+    {'MATNR': 'MAT_NR', 'MAT_NR': 'material', 'ERDAT': 'created_on'},
+    # Not plain ASCII words and a key that collides once upper-cased: the sequential fallback
+    {'MATNR': 'MAT_NR', 'MAT_NR': 'material', 'matnr': 'unused', 'ÄNDR': 'changed_on', 'ERDAT': 'created_on'},
+])
+def test_chains_are_resolved_in_both_modes(field_mappings):
+    rewriter = SqlRewriter(field_mappings)
+    expected = rewrite_fields_sequential("SELECT matnr, ÄNDR, t.Erdat FROM t", field_mappings)
+    assert rewriter.rewrite(SQL) == expected + " WHERE c = 'MATNR' -- MATNR\n"
+    fields, _ = rewriter.references(SQL)
+    assert fields['MATNR'] == 'material' and fields['ERDAT'] == 'created_on'
+
+
+def test_resolved_mapping_of_the_fallback():
+    rewriter = FieldRewriter({'X-Y': 'A', 'A': 'B', 'B': 'C', 'a': 'D', 'C_D': 'E'})
+    assert not rewriter.single_pass
+    assert rewriter.resolved_mapping() == {'X-Y': 'C', 'A': 'C', 'B': 'C', 'C_D': 'E'}
+    assert rewriter.lookup('x-y') == 'C'
+
+
+@pytest.mark.parametrize('field_mappings', [
+    # Overlapping names and prefixes
+    {'MATNR': 'material', 'MAT': 'mat_short', 'MATNR_OLD': 'old_material', 'NR': 'number'},
+    # Chains through later entries, in both directions of the mapping order
+    {'VBELN': 'ERDAT', 'ERDAT': 'created_on', 'KUNNR': 'customer', 'CUSTOMER': 'kunde'},
+    {'ERDAT': 'created_on', 'VBELN': 'ERDAT', 'A': 'B', 'B': 'C', 'C': 'A'},
+    # Values with several words and keys with digits
+    {'ZZ1': 'zz_one two', 'TWO': '2', 'Z1': 'z'},
+])
+def test_field_rewriter_matches_the_sequential_loop(field_mappings):
+    rewriter = FieldRewriter(field_mappings)
+    assert rewriter.single_pass
+    sql = ("SELECT matnr, MatNr_old, mat, MATNR2, nr, t.NR, vbeln, Erdat, kunnr, customer, a, b, c,\n"
+           "       zz1, Z1, two, 'MATNR' AS literal, MAT_NR, xmatnr, matnrx -- MATNR in a comment\n"
+           "FROM mara JOIN vbak ON mara.matnr = vbak.MATNR;")
+    assert rewriter.rewrite(sql) == rewrite_fields_sequential(sql, field_mappings)
+
+
+def test_a_stray_backtick_only_hides_names_on_its_line():
+    sql = ("SELECT `matnr`` AS m, 'x'\n"
+           "  `matnr`, erdat;\n"
+           "SELECT erdat FROM mara WHERE c = 'a;\nb' AND erdat > 0;")
+    before = run_log.counters.get('broken_quotes', 0)
+    rewritten = SqlRewriter({'MATNR': 'material', 'ERDAT': 'created_on'}).rewrite(sql)
+    assert rewritten == ("SELECT `matnr`` AS m, 'x'\n"
+                         "  `material`, created_on;\n"
+                         "SELECT created_on FROM mara WHERE c = 'a;\nb' AND created_on > 0;")
+    assert run_log.counters['broken_quotes'] == before + 2
+    messages = [record.text() for record in list(run_log.records)[-2:]]
+    assert "Line 1: unterminated quoted identifier" in messages[0]
+    assert "Line 3: string literal spans lines" in messages[1]
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from storage import FileEntry, LocalStorage, Storage
+
+
+@pytest.fixture
+def tree(tmp_path):
+    storage = LocalStorage()
+    storage.write_text(str(tmp_path / 'in' / 'a.xml'), '<a/>\r\nline 2\n')
+    storage.write_text(str(tmp_path / 'in' / 'b.txt'), 'b')
+    storage.write_text(str(tmp_path / 'in' / 'group' / 'c.xml'), '')
+    return storage, str(tmp_path / 'in')
+
+
+def test_storage_backends_must_implement_the_primitives():
+    with pytest.raises(TypeError):
+        Storage()
+
+    class ListOnly(Storage):
+        def ls(self, path, recursive=False, pattern=None):
+            return []
+
+    with pytest.raises(TypeError):
+        ListOnly()
+
+
+def test_read_and_write_keep_line_breaks(tree, tmp_path):
+    storage, root = tree
+    path = os.path.join(root, 'a.xml')
+    assert storage.read_text(path) == '<a/>\r\nline 2\n'
+    assert storage.read_lines('file:' + path) == ['<a/>', 'line 2']
+    assert storage.read_text(os.path.join(root, 'group', 'c.xml')) == ''
+    with pytest.raises(FileExistsError):
+        storage.write_text(path, 'other', overwrite=False)
+    storage.write_text(path, 'other')
+    assert storage.read_many([path, FileEntry(path, 'a.xml', 5)]) == {path: 'other'}
+
+
+def test_ls_lists_sizes_and_filters(tree):
+    storage, root = tree
+    assert [(entry.name, entry.size, entry.is_dir) for entry in storage.ls(root)] == [
+        ('a.xml', 13, False), ('b.txt', 1, False), ('group/', 0, True)]
+    assert [entry.name for entry in storage.ls(root, recursive=True)] == ['a.xml', 'b.txt', 'group/', 'c.xml']
+    xml_files = storage.ls(root, recursive=True, pattern='*.xml')
+    assert [entry.path for entry in xml_files] == [os.path.join(root, 'a.xml'),
+                                                   os.path.join(root, 'group/', 'c.xml')]
+    assert all(entry.modification_time > 0 for entry in xml_files)
+
+
+def test_move_many_collects_errors(tree, tmp_path):
+    storage, root = tree
+    archive = str(tmp_path / 'archive' / '2026')
+    pairs = [(os.path.join(root, name), os.path.join(archive, name)) for name in ('a.xml', 'b.txt', 'missing.xml')]
+    results = storage.move_many(pairs, max_workers=2)
+    assert [result.source for result in results] == [source for source, _ in pairs]
+    assert [result.error is None for result in results] == [True, True, False]
+    assert results[2].error.startswith('FileNotFoundError')
+    assert sorted(os.listdir(archive)) == ['a.xml', 'b.txt']
+    assert [entry.name for entry in storage.ls(root)] == ['group/']
+    assert storage.move_many([]) == []
@@ -0,0 +1,48 @@
+import pytest
+
+from type_comparison import compare_types, report_records, types_compatible
+
+
+def dbx(table, column, data_type):
+    return ('TABLE', 'catalog', 'schema', table, column, data_type)
+
+
+def match_of(sap_column, dbx_columns):
+    rows = compare_types([('CV_T', 'T', sap_column, 'NVARCHAR')], [dbx('T', name, 'string') for name in dbx_columns])
+    return rows[0].matched_column, rows[0].match_score
+
+
+@pytest.mark.parametrize('sap_column, dbx_columns, expected', [
+    ('MUT_NR', ['MUTNR'], ('MUTNR', 1.0)),
+    ('MUT_NR', ['MUTNR_OLD', 'OTHER'], ('MUTNR_OLD', 0.8)),
+    ('POLNR', ['POL_NR_P'], ('POL_NR_P', 0.8)),
+    ('ZLTSALDT_P', ['ZLTSALDT'], ('ZLTSALDT', 0.8)),
+    ('MUT_NR', ['MUTNR_OLD', 'MUTNR_X'], ('MUTNR_X', 0.8)),  # closest length wins
+    ('POLNR', ['BEDRAG', 'STATUS'], (None, None)),
+])
+def test_name_matching(sap_column, dbx_columns, expected):
+    assert match_of(sap_column, dbx_columns) == expected
+
+
+def test_exact_matches_are_not_matched_again():
+    rows = compare_types([('CV', 'T', 'MUTNR', 'NVARCHAR'), ('CV', 'T', 'MUT_NR', 'NVARCHAR')],
+                         [dbx('T', 'MUTNR', 'string')])
+    assert [(row.dbx_column, row.matched_column) for row in rows] == [('MUTNR', None), (None, None)]
+
+
+def test_report_rows_and_types():
+    rows = compare_types([('CV', 't', 'amount', 'DECIMAL'), ('CV', 'T', 'FLAG', 'INTEGER'), ('CV', 'U', 'X', 'DATE')],
+                         [dbx('T', 'AMOUNT', 'decimal(15,2)'), dbx('T', 'FLAG', 'string'), dbx('T', 'EXTRA', 'int')])
+    records = list(report_records(rows))
+    assert [(r['TableNameDbx'], r['ColumnNameSAP'], r['ColumnNameDbx'], r['DataTypeDbx'], r['DataTypeMatch'])
+            for r in records] == [('T', 'amount', 'AMOUNT', 'DECIMAL', True), ('T', 'FLAG', 'FLAG', 'STRING', False),
+                                  ('U', 'X', None, None, None), ('T', None, 'EXTRA', 'INT', None)]
+    assert records[2]['CatalogSchema'] is None and records[0]['CatalogSchema'] == 'catalog.schema'
+
+
+def test_type_compatibility():
+    assert types_compatible('NVARCHAR', 'string') is True
+    assert types_compatible('INTEGER', 'INT') is True
+    assert types_compatible('DATE', 'TIMESTAMP') is False
+    assert types_compatible('DECIMAL', 'DECIMAL(10,2)') is True
+    assert types_compatible(None, 'INT') is None
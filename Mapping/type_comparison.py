@@ -0,0 +1,329 @@
+"""
+SAP versus Databricks data type comparison of the columns of a dataflow.
+
+The comparison cells of data_type_comparison.ipynb and
+leap_data_type_comparison.ipynb joined the SAP and Databricks columns with
+a full outer join, then matched every SAP column without an exact
+Databricks name through a Python UDF that scanned all Databricks column
+names of every table with substring checks, joined the result with itself
+(final_v2_df) or looked the matched column up in another UDF
+(lookup_matched_datatype) to get its type, and compared the types with one
+hard-coded rule (STRING is NVARCHAR).
+
+compare_types does the same on the driver in one pass:
+
+- names are normalized once: upper-case, trimmed; data types without
+  precision (DECIMAL(10,2) -> DECIMAL)
+- exact matches are dictionary lookups on (table, column)
+- a SAP column without an exact match is matched against the unmatched
+  Databricks columns of its own table, in three steps:
+  1. the same name without underscores (MUT_NR / MUTNR), score 1.0
+  2. one name without underscores contains the other (MUT_NR / MUTNR_OLD,
+     POLNR / POL_NR_P), the test of the UDF, score 0.8; the closest length
+     wins, found through an index of character trigrams
+  3. the best FuzzyIndex match (fuzzy_index.py) with a calculate_similarity
+     score of at least min_score (0.8 by default), which also accepts names
+     with most characters in common and similar lengths
+- types are compared through TYPE_COMPATIBILITY, a table of the
+  Databricks types each SAP HANA type may become
+
+The result has one row per SAP column and one per Databricks column of the
+tables in scope that no SAP column has, like the full outer join;
+report_records gives them under the notebooks' column names.
+
+Usage:
+    rows = compare_types(grouped_df.collect(), joined_df.collect())
+    display(pd.DataFrame(report_records(rows)))
+
+    python type_comparison.py [--tables 300] [--columns 80] [--renamed 0.2]
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from fuzzy_index import FuzzyIndex, ngrams
+from instrumentation import run_log
+
+# Minimum calculate_similarity score of a fuzzy match
+DEFAULT_MIN_SCORE = 0.8
+
+# Score of a match by containment of the names without underscores (calculate_similarity's containment score)
+CONTAINMENT_SCORE = 0.8
+
+# Shortest name without underscores the containment step looks for; shorter ones are left to the FuzzyIndex
+MIN_CONTAINED_LENGTH = 3
+
+# SAP HANA type -> Databricks types it may be converted to. A type always matches itself.
+TYPE_COMPATIBILITY: Dict[str, FrozenSet[str]] = {
+    sap_type: frozenset(dbx_types) for sap_type, dbx_types in {
+        'NVARCHAR': ('STRING', 'VARCHAR'),
+        'VARCHAR': ('STRING', 'VARCHAR'),
+        'NCHAR': ('STRING', 'CHAR'),
+        'CHAR': ('STRING', 'CHAR'),
+        'ALPHANUM': ('STRING',),
+        'SHORTTEXT': ('STRING',),
+        'NCLOB': ('STRING',),
+        'CLOB': ('STRING',),
+        'TEXT': ('STRING',),
+        'DECIMAL': ('DECIMAL',),
+        'SMALLDECIMAL': ('DECIMAL',),
+        'DOUBLE': ('DOUBLE',),
+        'REAL': ('FLOAT', 'DOUBLE'),
+        'FLOAT': ('FLOAT', 'DOUBLE'),
+        'INTEGER': ('INT',),
+        'BIGINT': ('BIGINT',),
+        'SMALLINT': ('SMALLINT', 'INT'),
+        'TINYINT': ('TINYINT', 'SMALLINT', 'INT'),
+        'BOOLEAN': ('BOOLEAN',),
+        'DATE': ('DATE',),
+        'DAYDATE': ('DATE',),
+        'TIME': ('STRING', 'TIMESTAMP'),
+        'SECONDTIME': ('STRING', 'TIMESTAMP'),
+        'SECONDDATE': ('TIMESTAMP',),
+        'TIMESTAMP': ('TIMESTAMP', 'TIMESTAMP_NTZ'),
+        'LONGDATE': ('TIMESTAMP', 'TIMESTAMP_NTZ'),
+        'VARBINARY': ('BINARY',),
+        'BINARY': ('BINARY',),
+        'BLOB': ('BINARY',),
+    }.items()
+}
+
+# Column names of report_records, as in the notebooks
+REPORT_COLUMNS = ('CatalogSchema', 'TableNameDbx', 'CalcViewName', 'ColumnNameDbx', 'ColumnNameSAP', 'DataTypeDbx',
+                  'DataTypeSAP', 'DataTypeMatch', 'MatchedColumnDbx', 'MatchScore', 'DataTypeDbxMatched',
+                  'DataTypeMatchAfterMatch')
+
+_PRECISION = re.compile(r'\(.*\)')
+
+
+class SapColumn(NamedTuple):
+    calc_view: str
+    table_name: str
+    column_name: str
+    data_type: str
+
+
+class DbxColumn(NamedTuple):
+    object_type: str
+    catalog_name: str
+    schema_name: str
+    object_name: str
+    column_name: str
+    data_type: str
+
+
+class TypeComparison(NamedTuple):
+    catalog_schema: Optional[str]
+    table_name: str
+    calc_view: Optional[str]
+    dbx_column: Optional[str]  # Databricks column of the same name
+    sap_column: Optional[str]
+    dbx_type: Optional[str]
+    sap_type: Optional[str]
+    type_match: Optional[bool]  # None where one side is missing
+    matched_column: Optional[str] = None  # Databricks column matched by name for a SAP column without dbx_column
+    match_score: Optional[float] = None
+    matched_type: Optional[str] = None
+    matched_type_match: Optional[bool] = None
+
+
+def base_type(data_type: Optional[str]) -> Optional[str]:
+    """Upper-case type without precision, length or element types; None for a missing type."""
+    if data_type is None:
+        return None
+    data_type = _PRECISION.sub('', str(data_type)).strip().upper()
+    return data_type or None
+
+
+def normalize_name(name: Optional[str]) -> Optional[str]:
+    return str(name).strip().upper() if name is not None else None
+
+
+def types_compatible(sap_type: Optional[str], dbx_type: Optional[str],
+                     compatibility: Mapping[str, FrozenSet[str]] = TYPE_COMPATIBILITY) -> Optional[bool]:
+    """
+    True if a Databricks column of dbx_type can hold a SAP column of sap_type.
+
+    Parameters:
+    sap_type (str): SAP HANA type, with or without length
+    dbx_type (str): Databricks type, with or without precision
+    compatibility (dict): SAP type -> allowed Databricks types
+
+    Returns:
+    bool: None if either type is missing
+    """
+    sap_type, dbx_type = base_type(sap_type), base_type(dbx_type)
+    if sap_type is None or dbx_type is None:
+        return None
+    return sap_type == dbx_type or dbx_type in compatibility.get(sap_type, ())
+
+
+class _Table:
+    """Databricks columns of one table: exact and underscore-free name dictionaries, n-gram indexes built on demand."""
+
+    def __init__(self, catalog_schema: str):
+        self.catalog_schema = catalog_schema
+        self.columns: Dict[str, Tuple[str, Optional[str]]] = {}  # upper name -> (name, base type)
+        self._unmatched: Optional[List[str]] = None
+        self._compact: Dict[str, str] = {}  # name without underscores -> first unmatched column with it
+        self._postings: Optional[Dict[str, List[str]]] = None  # trigram -> names without underscores
+        self._index: Optional[FuzzyIndex] = None
+
+    def _contained(self, compact: str) -> Optional[str]:
+        """Unmatched column whose name without underscores contains or is contained in `compact`."""
+        if self._postings is None:
+            self._postings = {}
+            for name in self._compact:
+                for gram in ngrams(name):
+                    self._postings.setdefault(gram, []).append(name)
+        candidates = set()
+        if len(compact) >= MIN_CONTAINED_LENGTH:
+            # names containing compact have all of its trigrams
+            postings = sorted((self._postings.get(gram, []) for gram in ngrams(compact)), key=len)
+            candidates.update(name for name in postings[0] if compact in name)
+        # names contained in compact are substrings of it
+        for length in range(MIN_CONTAINED_LENGTH, len(compact)):
+            for start in range(len(compact) - length + 1):
+                if compact[start:start + length] in self._compact:
+                    candidates.add(compact[start:start + length])
+        if not candidates:
+            return None
+        position = {name: number for number, name in enumerate(self._compact)}
+        best = min(candidates, key=lambda name: (abs(len(name) - len(compact)), position[name]))
+        return self._compact[best]
+
+    def match(self, column: str, exact: Iterable[str], min_score: float) -> Tuple[Optional[str], Optional[float]]:
+        """Best Databricks column for a SAP column among the columns no SAP column has exactly."""
+        if self._unmatched is None:
+            exact = set(exact)
+            self._unmatched = [name for name in self.columns if name not in exact]
+            for name in self._unmatched:
+                self._compact.setdefault(name.replace('_', ''), name)
+        compact = column.replace('_', '')
+        if compact in self._compact:
+            return self._compact[compact], 1.0
+        contained = self._contained(compact)
+        if contained is not None:
+            return contained, CONTAINMENT_SCORE
+        if self._index is None:
+            self._index = FuzzyIndex(self._unmatched)
+        matches = self._index.top_k(column, k=1, min_score=min_score)
+        return matches[0] if matches else (None, None)
+
+
+def compare_types(sap_columns: Iterable[Sequence], dbx_columns: Iterable[Sequence],
+                  compatibility: Mapping[str, FrozenSet[str]] = TYPE_COMPATIBILITY,
+                  min_score: float = DEFAULT_MIN_SCORE, log=run_log) -> List[TypeComparison]:
+    """
+    Compare the data types of SAP columns with the Databricks columns of the same tables.
+
+    Parameters:
+    sap_columns (iterable): (calculation view, table, column, data type) rows, e.g. grouped_df.collect()
+    dbx_columns (iterable): (object type, catalog, schema, object name, column, data type) rows,
+                            e.g. metadata_harvester.ColumnMetadata or joined_df.collect()
+    compatibility (dict): SAP type -> allowed Databricks types
+    min_score (float): Minimum calculate_similarity score of a fuzzy name match
+
+    Returns:
+    list: TypeComparison, the SAP columns in their order, then the Databricks columns no SAP column has
+    """
+    tables: Dict[str, _Table] = {}
+    for row in dbx_columns:
+        dbx = DbxColumn(*tuple(row)[:6])
+        table_name = normalize_name(dbx.object_name)
+        table = tables.get(table_name)
+        if table is None:
+            table = tables[table_name] = _Table(f"{dbx.catalog_name}.{dbx.schema_name}")
+        table.columns.setdefault(normalize_name(dbx.column_name), (dbx.column_name, base_type(dbx.data_type)))
+
+    sap_rows = [SapColumn(*tuple(row)[:4]) for row in sap_columns]
+    exact_names: Dict[str, set] = {}
+    for sap in sap_rows:
+        table_name, column = normalize_name(sap.table_name), normalize_name(sap.column_name)
+        if table_name in tables and column in tables[table_name].columns:
+            exact_names.setdefault(table_name, set()).add(column)
+
+    result = []
+    fuzzy = 0
+    for sap in sap_rows:
+        table_name, column = normalize_name(sap.table_name), normalize_name(sap.column_name)
+        sap_type = base_type(sap.data_type)
+        table = tables.get(table_name)
+        if table is None:
+            result.append(TypeComparison(None, table_name, sap.calc_view, None, sap.column_name, None, sap_type, None))
+            continue
+        if column in table.columns:
+            dbx_name, dbx_type = table.columns[column]
+            result.append(TypeComparison(table.catalog_schema, table_name, sap.calc_view, dbx_name, sap.column_name,
+                                         dbx_type, sap_type, types_compatible(sap_type, dbx_type, compatibility)))
+            continue
+        matched, score = table.match(column, exact_names.get(table_name, ()), min_score) if column else (None, None)
+        matched_name = matched_type = None
+        if matched is not None:
+            fuzzy += 1
+            matched_name, matched_type = table.columns[matched]
+        result.append(TypeComparison(table.catalog_schema, table_name, sap.calc_view, None, sap.column_name, None,
+                                     sap_type, None, matched_name, score, matched_type,
+                                     types_compatible(sap_type, matched_type, compatibility)))
+
+    for table_name, table in tables.items():
+        exact = exact_names.get(table_name, ())
+        for column, (dbx_name, dbx_type) in table.columns.items():
+            if column not in exact:
+                result.append(TypeComparison(table.catalog_schema, table_name, None, dbx_name, None, dbx_type,
+                                             None, None))
+
+    log.count('type_comparison_rows', len(result))
+    log.count('type_comparison_name_matches', fuzzy)
+    return result
+
+
+def report_records(rows: Iterable[TypeComparison]) -> Iterator[Dict[str, object]]:
+    """The comparison rows as dictionaries under REPORT_COLUMNS, for pandas or spark.createDataFrame."""
+    for row in rows:
+        yield dict(zip(REPORT_COLUMNS, row))
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Compare a synthetic SAP and Databricks dataflow")
+    parser.add_argument('--tables', type=int, default=300)
+    parser.add_argument('--columns', type=int, default=80)
+    parser.add_argument('--renamed', type=float, default=0.2, help="Share of Databricks columns with another name")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sap_types = sorted(TYPE_COMPATIBILITY)
+    sample_sap, sample_dbx = [], []
+    for table_number in range(args.tables):
+        table_id = f"ZTAB_{table_number}"
+        for column_number in range(args.columns):
+            sap_name = f"Z{rng.choice('ABCDEFGH')}{column_number}_{rng.choice(('NR', 'DAT', 'AMT', 'CD'))}"
+            sap_type = rng.choice(sap_types)
+            dbx_type = rng.choice(sorted(TYPE_COMPATIBILITY[sap_type]))
+            dbx_name = sap_name + '_P' if rng.random() < args.renamed else sap_name
+            sample_sap.append(('CV_' + table_id, table_id, sap_name, sap_type))
+            sample_dbx.append(('TABLE', 'catalogdevdev', 'schema', table_id, dbx_name, dbx_type + '(10)'))
+
+    started = time.perf_counter()
+    comparison = compare_types(sample_sap, sample_dbx)
+    elapsed = time.perf_counter() - started
+    matched = sum(1 for row in comparison if row.matched_column)
+    compatible = sum(1 for row in comparison if row.type_match or row.matched_type_match)
+    print(f"{len(sample_sap)} SAP / {len(sample_dbx)} Databricks columns: {len(comparison)} rows, "
+          f"{matched} matched by name, {compatible} compatible types in {elapsed:.3f}s")
+
+    # The UDF: a scan over every Databricks column name for each SAP column without an exact match
+    unmatched_sap = [row.sap_column for row in comparison if row.sap_column and row.dbx_column is None][:200]
+    all_names = list(dict.fromkeys(row[4] for row in sample_dbx))
+    started = time.perf_counter()
+    for sap_name in unmatched_sap:
+        next((name for name in all_names if sap_name.replace('_', '') in name.replace('_', '')
+              or name.replace('_', '') in sap_name.replace('_', '')), None)
+    if unmatched_sap:
+        print(f"substring scan: {(time.perf_counter() - started) / len(unmatched_sap) * 1e3:.2f}ms per unmatched "
+              f"column ({len(unmatched_sap)} timed, {len(all_names)} names)")